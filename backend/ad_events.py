@@ -0,0 +1,259 @@
+# Buffered Ad Event Writer
+
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+from models import AdImpression, AdClick
+from ad_inventory import AdInventory
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Truncates an event timestamp to the start of its hour in an aggregation
+HOUR_EXPRESSION = {
+    "$dateFromParts": {
+        "year": {"$year": "$timestamp"},
+        "month": {"$month": "$timestamp"},
+        "day": {"$dayOfMonth": "$timestamp"},
+        "hour": {"$hour": "$timestamp"}
+    }
+}
+
+RollupKey = Tuple[str, datetime]
+
+
+def hour_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_id(ad_id: str, hour: datetime) -> str:
+    return f"{ad_id}|{hour:%Y-%m-%dT%H}"
+
+
+class AdEventBuffer:
+    """Aggregates ad counter increments and hourly rollups in memory and writes them in bulk"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, inventory: Optional[AdInventory] = None):
+        self.db = db
+        self.inventory = inventory
+        self.flush_interval = float(os.environ.get('AD_EVENT_FLUSH_INTERVAL', 5))
+        self.max_pending = int(os.environ.get('AD_EVENT_MAX_PENDING', 5000))
+        self._counters: Dict[str, Counter] = {}
+        self._rollups: Dict[RollupKey, Counter] = {}
+        self._impressions: List[dict] = []
+        self._clicks: List[dict] = []
+        self._quarantined: List[dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+
+    @property
+    def pending(self) -> int:
+        return len(self._impressions) + len(self._clicks) + len(self._quarantined)
+
+    @property
+    def flush_lock(self) -> asyncio.Lock:
+        """Held while a flush is writing; hold it to read a consistent view of pending events"""
+        return self._flush_lock
+
+    def pending_spend(self, since: Optional[datetime] = None) -> Dict[str, float]:
+        """Click revenue per ad that has not been written to ad_hourly_rollups yet"""
+        spend: Dict[str, float] = {}
+        for (ad_id, hour), counter in self._rollups.items():
+            if counter["revenue"] and (since is None or hour >= since):
+                spend[ad_id] = spend.get(ad_id, 0.0) + counter["revenue"]
+        return spend
+
+    async def ensure_indexes(self):
+        """Create the indexes ad analytics queries rely on"""
+        await self.db.ad_hourly_rollups.create_index([("advertiser", ASCENDING), ("hour", ASCENDING)])
+        await self.db.ad_hourly_rollups.create_index([("hour", ASCENDING)])
+
+    def _increment(self, ad_id: str, field: str, amount: int = 1):
+        counter = self._counters.get(ad_id)
+        if counter is None:
+            counter = self._counters[ad_id] = Counter()
+        counter[field] += amount
+
+    def _roll_up(self, ad_id: str, timestamp: datetime, **amounts):
+        key = (ad_id, hour_start(timestamp))
+        counter = self._rollups.get(key)
+        if counter is None:
+            counter = self._rollups[key] = Counter()
+        counter.update(amounts)
+
+    def _event_document(self, event) -> dict:
+        document = event.dict()
+        # Using the event id as _id makes re-inserting after a partial failure idempotent
+        document["_id"] = document["id"]
+        return document
+
+    def add_impression(self, impression: AdImpression):
+        """Buffer an impression"""
+        self._impressions.append(self._event_document(impression))
+        self._increment(impression.ad_id, "impressions")
+        self._roll_up(impression.ad_id, impression.timestamp, impressions=1)
+        if self.pending >= self.max_pending:
+            self._flush_requested.set()
+
+    def add_click(self, click: AdClick):
+        """Buffer a click"""
+        self._clicks.append(self._event_document(click))
+        self._increment(click.ad_id, "clicks")
+        self._roll_up(click.ad_id, click.timestamp, clicks=1, revenue=click.revenue)
+        if self.pending >= self.max_pending:
+            self._flush_requested.set()
+
+    def add_quarantined_click(self, click: AdClick, reason: str):
+        """Buffer a suspicious click for review; it earns no revenue and touches no counters"""
+        document = self._event_document(click)
+        document["reason"] = reason
+        document["quarantined_at"] = datetime.utcnow()
+        self._quarantined.append(document)
+        if self.pending >= self.max_pending:
+            self._flush_requested.set()
+
+    async def _insert_events(self, collection, documents: List[dict]) -> List[dict]:
+        """Insert raw events; returns the documents that still need writing"""
+        if not documents:
+            return []
+        try:
+            await collection.insert_many(documents, ordered=False)
+            return []
+        except BulkWriteError as e:
+            failed = {
+                error["index"] for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY_ERROR
+            }
+            return [document for index, document in enumerate(documents) if index in failed]
+
+    async def _apply_counters(self, counters: Dict[str, Counter]) -> Dict[str, Counter]:
+        """Apply counter increments in one bulk_write; returns increments that failed"""
+        if not counters:
+            return {}
+
+        ad_ids = list(counters)
+        operations = [
+            UpdateOne({"id": ad_id}, {"$inc": dict(counters[ad_id])})
+            for ad_id in ad_ids
+        ]
+        try:
+            await self.db.advertisements.bulk_write(operations, ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return {ad_ids[error["index"]]: counters[ad_ids[error["index"]]]
+                    for error in e.details.get("writeErrors", [])}
+
+    def _advertiser(self, ad_id: str) -> Optional[str]:
+        ad = self.inventory.get(ad_id) if self.inventory else None
+        return ad.advertiser if ad else None
+
+    def _rollup_update(self, ad_id: str, hour: datetime, amounts: Dict) -> UpdateOne:
+        return UpdateOne(
+            {"_id": rollup_id(ad_id, hour)},
+            {
+                "$setOnInsert": {"ad_id": ad_id, "advertiser": self._advertiser(ad_id), "hour": hour},
+                "$inc": {"impressions": 0, "clicks": 0, "revenue": 0.0, **amounts}
+            },
+            upsert=True
+        )
+
+    async def _apply_rollups(self, rollups: Dict[RollupKey, Counter]) -> Dict[RollupKey, Counter]:
+        """Upsert hourly rollup increments in one bulk_write; returns increments that failed"""
+        if not rollups:
+            return {}
+
+        keys = list(rollups)
+        operations = [self._rollup_update(ad_id, hour, dict(rollups[(ad_id, hour)])) for ad_id, hour in keys]
+        try:
+            await self.db.ad_hourly_rollups.bulk_write(operations, ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return {keys[error["index"]]: rollups[keys[error["index"]]]
+                    for error in e.details.get("writeErrors", [])}
+
+    def _requeue(self, counters: Dict[str, Counter], rollups: Dict[RollupKey, Counter],
+                 impressions: List[dict], clicks: List[dict], quarantined: List[dict]):
+        for ad_id, counter in counters.items():
+            for field, amount in counter.items():
+                self._increment(ad_id, field, amount)
+        for (ad_id, hour), counter in rollups.items():
+            self._roll_up(ad_id, hour, **counter)
+        self._impressions[:0] = impressions
+        self._clicks[:0] = clicks
+        self._quarantined[:0] = quarantined
+
+    async def flush(self):
+        """Write buffered events, counter increments and hourly rollups"""
+        async with self._flush_lock:
+            self._flush_requested.clear()
+
+            # Swap buffers first so events recorded during the writes go to the next flush
+            counters, self._counters = self._counters, {}
+            rollups, self._rollups = self._rollups, {}
+            impressions, self._impressions = self._impressions, []
+            clicks, self._clicks = self._clicks, []
+            quarantined, self._quarantined = self._quarantined, []
+            if not counters and not rollups and not impressions and not clicks and not quarantined:
+                return
+
+            try:
+                impressions = await self._insert_events(self.db.ad_impressions, impressions)
+                clicks = await self._insert_events(self.db.ad_clicks, clicks)
+                quarantined = await self._insert_events(self.db.ad_click_quarantine, quarantined)
+                counters = await self._apply_counters(counters)
+                rollups = await self._apply_rollups(rollups)
+            except Exception as e:
+                logger.error(f"Error flushing ad events: {e}")
+
+            if counters or rollups or impressions or clicks or quarantined:
+                logger.warning(
+                    f"Requeueing {len(impressions)} impressions, {len(clicks)} clicks, "
+                    f"{len(quarantined)} quarantined clicks, counters for {len(counters)} ads "
+                    f"and {len(rollups)} rollups after a failed flush"
+                )
+                self._requeue(counters, rollups, impressions, clicks, quarantined)
+
+    async def backfill_rollups(self) -> int:
+        """Build hourly rollups from raw events when the rollup collection is empty"""
+        async with self._flush_lock:
+            if await self.db.ad_hourly_rollups.find_one({}, {"_id": 1}):
+                return 0
+
+            rollups: Dict[RollupKey, Counter] = {}
+            sources = (
+                (self.db.ad_impressions, {"impressions": {"$sum": 1}}),
+                (self.db.ad_clicks, {"clicks": {"$sum": 1}, "revenue": {"$sum": "$revenue"}}),
+            )
+            for collection, fields in sources:
+                pipeline = [{"$group": {"_id": {"ad_id": "$ad_id", "hour": HOUR_EXPRESSION}, **fields}}]
+                async for row in collection.aggregate(pipeline):
+                    key = (row["_id"]["ad_id"], row["_id"]["hour"])
+                    rollups.setdefault(key, Counter()).update({field: row[field] for field in fields})
+
+            failed = await self._apply_rollups(rollups)
+            if failed:
+                logger.error(f"Failed to backfill {len(failed)} ad rollups")
+            logger.info(f"Backfilled {len(rollups) - len(failed)} hourly ad rollups")
+            return len(rollups) - len(failed)
+
+    async def run_flusher(self):
+        """Flush every flush_interval seconds, or sooner when the buffer fills up"""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        except asyncio.CancelledError:
+            # Don't lose buffered events when the app shuts down
+            await self.flush()
+            raise
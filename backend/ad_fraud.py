@@ -0,0 +1,45 @@
+# Click Fraud Filter
+
+from typing import Callable, Iterable, Optional
+import os
+import time
+
+from trending import SlidingWindowCounter
+
+
+class ClickFraudFilter:
+    """Flags click bursts per clicker and per (clicker, ad) over a sliding time wheel"""
+
+    def __init__(self, window_seconds: int = None, bucket_seconds: int = 5, max_clicks_per_ad: int = None,
+                 max_clicks: int = None, clock: Callable[[], float] = time.time):
+        window_seconds = window_seconds or int(os.environ.get('AD_FRAUD_WINDOW', 60))
+        self.max_clicks_per_ad = max_clicks_per_ad or int(os.environ.get('AD_FRAUD_MAX_CLICKS_PER_AD', 3))
+        self.max_clicks = max_clicks or int(os.environ.get('AD_FRAUD_MAX_CLICKS', 20))
+        self.clock = clock
+        self._window = SlidingWindowCounter(bucket_seconds, max(1, window_seconds // bucket_seconds))
+
+    @property
+    def tracked_keys(self) -> int:
+        return len(self._window.totals)
+
+    def check(self, clickers: Iterable[Optional[str]], ad_id: str) -> Optional[str]:
+        """Count a click; returns why it is suspicious, or None if it looks clean"""
+        now = self.clock()
+        self._window.advance(now)
+
+        keys = []
+        for clicker in clickers:
+            if clicker:
+                keys += [clicker, f"{clicker}|{ad_id}"]
+        if not keys:
+            return None
+
+        # Suspicious clicks still count, so a sustained burst stays flagged
+        self._window.add(keys, now)
+        totals = self._window.totals
+        for clicker in keys[::2]:
+            if totals[f"{clicker}|{ad_id}"] > self.max_clicks_per_ad:
+                return f"more than {self.max_clicks_per_ad} clicks on this ad from {clicker}"
+            if totals[clicker] > self.max_clicks:
+                return f"more than {self.max_clicks} ad clicks from {clicker}"
+        return None
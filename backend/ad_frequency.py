@@ -0,0 +1,47 @@
+# Ad Frequency Capping
+
+from typing import Callable
+import os
+import time
+
+from bloom import RotatingBloomFilter
+
+DAY_SECONDS = 86400
+
+
+class FrequencyCapper:
+    """Per-viewer daily ad caps and impression dedupe in fixed-size Bloom filters"""
+
+    def __init__(self, max_per_day: int = None, dedupe_window: int = None, capacity: int = None,
+                 error_rate: float = 0.01, clock: Callable[[], float] = time.time):
+        self.max_per_day = max_per_day or int(os.environ.get('AD_FREQUENCY_CAP', 3))
+        self.dedupe_window = dedupe_window or int(os.environ.get('AD_IMPRESSION_DEDUPE_WINDOW', 1800))
+        capacity = capacity or int(os.environ.get('AD_FREQUENCY_CAPACITY', 1000000))
+
+        # One key per (viewer, ad, nth view today), cleared at UTC midnight
+        self._views = RotatingBloomFilter(capacity * self.max_per_day, DAY_SECONDS, 1, error_rate, clock)
+        # One key per (viewer, ad) shown within the last one to two dedupe windows
+        self._recent = RotatingBloomFilter(capacity, self.dedupe_window, 2, error_rate, clock)
+
+    @staticmethod
+    def _key(viewer: str, ad_id: str) -> str:
+        return f"{viewer}|{ad_id}"
+
+    def allows(self, viewer: str, ad_id: str) -> bool:
+        """Whether the viewer is still under today's cap for an ad"""
+        return f"{self._key(viewer, ad_id)}|{self.max_per_day - 1}" not in self._views
+
+    def record_impression(self, viewer: str, ad_id: str) -> bool:
+        """Count an impression; returns False if it repeats one from the dedupe window"""
+        key = self._key(viewer, ad_id)
+        if self._recent.add(key):
+            return False
+
+        for view in range(self.max_per_day):
+            if not self._views.add(f"{key}|{view}"):
+                break
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return self._views.nbytes + self._recent.nbytes
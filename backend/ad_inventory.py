@@ -0,0 +1,125 @@
+# In-Memory Ad Inventory
+
+from typing import Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+import asyncio
+import hashlib
+import logging
+import os
+
+from models import Advertisement, Platform
+
+logger = logging.getLogger(__name__)
+
+# Fields that change on every impression or click and never affect ad selection
+COUNTER_FIELDS = ("impressions", "clicks")
+
+# Change stream events worth reloading the catalog for
+CATALOG_CHANGE_PIPELINE = [
+    {
+        "$match": {
+            "$or": [
+                {"operationType": {"$nin": ["update"]}},
+                {
+                    "updateDescription.updatedFields.impressions": {"$exists": False},
+                    "updateDescription.updatedFields.clicks": {"$exists": False}
+                }
+            ]
+        }
+    }
+]
+
+
+class AdInventory:
+    """Validated advertisements indexed by target platform, kept in sync with Mongo"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.poll_interval = int(os.environ.get('AD_INVENTORY_POLL_INTERVAL', 30))
+        self.version = 0
+        self._digest: Optional[str] = None
+        self._ads: Dict[str, Advertisement] = {}
+        self._by_platform: Dict[Optional[str], Tuple[Advertisement, ...]] = {None: ()}
+
+    async def load(self) -> bool:
+        """Reload the catalog; returns True if it changed"""
+        projection = {"_id": 0, **{field: 0 for field in COUNTER_FIELDS}}
+        documents = await self.db.advertisements.find({}, projection).sort("created_at", 1).to_list(None)
+
+        digest = hashlib.sha256(repr(documents).encode("utf-8")).hexdigest()
+        if digest == self._digest:
+            return False
+
+        ads: Dict[str, Advertisement] = {}
+        for ad_data in documents:
+            try:
+                ad = Advertisement(**ad_data)
+                ads[ad.id] = ad
+            except Exception as e:
+                logger.error(f"Error parsing advertisement: {e}")
+
+        self._rebuild_index(ads)
+        self._digest = digest
+        self.version += 1
+        logger.info(f"Loaded ad inventory version {self.version} with {len(ads)} ads")
+        return True
+
+    def _rebuild_index(self, ads: Dict[str, Advertisement]):
+        by_platform: Dict[Optional[str], List[Advertisement]] = {None: []}
+        for ad in ads.values():
+            if not ad.is_active:
+                continue
+            by_platform[None].append(ad)
+            for platform in ad.target_platforms:
+                by_platform.setdefault(platform.value, []).append(ad)
+
+        # Swap in whole tuples so readers never see a half-built index
+        self._ads = ads
+        self._by_platform = {key: tuple(value) for key, value in by_platform.items()}
+
+    def deactivate(self, ad_id: str) -> bool:
+        """Stop serving an ad until the catalog says otherwise; returns False if it wasn't active"""
+        ad = self._ads.get(ad_id)
+        if ad is None or not ad.is_active:
+            return False
+
+        ads = dict(self._ads)
+        ads[ad_id] = ad.model_copy(update={"is_active": False})
+        self._rebuild_index(ads)
+        self.version += 1
+        return True
+
+    def get(self, ad_id: str) -> Optional[Advertisement]:
+        """Get an ad by id, active or not"""
+        return self._ads.get(ad_id)
+
+    def get_active_ads(self, platform: Optional[Platform] = None) -> Tuple[Advertisement, ...]:
+        """Get active ads targeting a platform, or all active ads"""
+        key = platform.value if platform else None
+        return self._by_platform.get(key, ())
+
+    async def _watch_changes(self):
+        async with self.db.advertisements.watch(CATALOG_CHANGE_PIPELINE) as stream:
+            logger.info("Watching advertisements change stream")
+            async for _ in stream:
+                await self.load()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Error refreshing ad inventory: {e}")
+
+    async def run_watcher(self):
+        """Keep the inventory fresh from a change stream, polling when streams are unavailable"""
+        try:
+            await self._watch_changes()
+        except OperationFailure as e:
+            # Change streams need a replica set; standalone servers fall back to polling
+            logger.warning(f"Ad change stream unavailable ({e}), polling every {self.poll_interval}s")
+        except Exception as e:
+            logger.error(f"Ad change stream failed ({e}), polling every {self.poll_interval}s")
+        await self._poll()
@@ -0,0 +1,153 @@
+# Budget-Aware Ad Selection
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+import random
+import time
+
+from models import Advertisement, Platform
+from ad_inventory import AdInventory
+from ad_spend import SpendTracker
+
+
+class AliasTable:
+    """Walker/Vose alias table for O(1) weighted sampling"""
+
+    def __init__(self, items: Sequence, weights: Sequence[float]):
+        self.items = list(items)
+        count = len(self.items)
+        self.probability = [0.0] * count
+        self.alias = [0] * count
+
+        total = float(sum(weights))
+        if count == 0 or total <= 0:
+            self.items = []
+            return
+
+        scaled = [weight * count / total for weight in weights]
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+
+        # Leftovers are 1.0 up to floating point error
+        for index in small + large:
+            self.probability[index] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def draw(self, rng: random.Random):
+        """Draw one item with probability proportional to its weight"""
+        index = int(rng.random() * len(self.items))
+        if rng.random() < self.probability[index]:
+            return self.items[index]
+        return self.items[self.alias[index]]
+
+
+def day_fraction_elapsed(now: Optional[datetime] = None) -> float:
+    now = now or datetime.utcnow()
+    seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    return seconds / 86400
+
+
+class AdSelector:
+    """Samples ads weighted by CPC and remaining budget, paced evenly across the day"""
+
+    def __init__(self, inventory: AdInventory, spend_tracker: SpendTracker, rng: Optional[random.Random] = None,
+                 rebuild_interval: float = 60.0, clock: Callable[[], float] = time.monotonic,
+                 weight_tolerance: float = 0.25):
+        self.inventory = inventory
+        self.spend_tracker = spend_tracker
+        self.rng = rng or random.Random()
+        self.rebuild_interval = rebuild_interval
+        self.clock = clock
+        self.weight_tolerance = weight_tolerance
+        self._tables: Dict[Optional[str], Tuple[float, AliasTable]] = {}
+        # Ad id -> the weight it was last sampled with
+        self._weights: Dict[str, float] = {}
+        self._versions = (-1, -1)
+
+    def note_spend(self, ad: Advertisement):
+        """Rebuild the tables containing an ad only if its spend moved its weight materially"""
+        built = self._weights.get(ad.id)
+        if not built:
+            # Not in any table; spend only lowers a weight, and pacing recovery waits for rebuild_interval
+            return
+        weight = self.weight(ad, day_fraction_elapsed())
+        # Small drifts are left for the periodic rebuild; running out or being throttled by pacing is not
+        if weight <= 0 or built - weight > built * self.weight_tolerance:
+            self._invalidate(ad.target_platforms)
+
+    def _invalidate(self, platforms: Sequence[Platform]):
+        self._tables.pop(None, None)
+        for platform in platforms:
+            self._tables.pop(platform.value, None)
+
+    def weight(self, ad: Advertisement, elapsed: float) -> float:
+        """Selection weight: CPC times remaining budget, throttled when ahead of pace"""
+        remaining = ad.budget - self.spend_tracker.spent_total(ad.id)
+        if remaining <= 0 or ad.cost_per_click <= 0:
+            return 0.0
+
+        # Pace the day's budget linearly; allow a small burst before throttling
+        daily_budget = min(ad.daily_budget or ad.budget, ad.budget)
+        allowed = daily_budget * elapsed
+        slack = max(ad.cost_per_click, daily_budget * 0.05)
+        ahead = self.spend_tracker.spent_today(ad.id) - allowed
+        pacing = 1.0 if ahead <= 0 else max(0.0, 1.0 - ahead / slack)
+
+        return ad.cost_per_click * remaining * pacing
+
+    def _table(self, platform: Optional[Platform]) -> AliasTable:
+        # Inventory changes and spend reconciliation invalidate every table
+        versions = (self.inventory.version, self.spend_tracker.version)
+        if versions != self._versions:
+            self._versions = versions
+            self._tables.clear()
+            self._weights.clear()
+
+        key = platform.value if platform else None
+        now = self.clock()
+        cached = self._tables.get(key)
+        if cached and now - cached[0] < self.rebuild_interval:
+            return cached[1]
+
+        ads = self.inventory.get_active_ads(platform)
+        elapsed = day_fraction_elapsed()
+        weights = [self.weight(ad, elapsed) for ad in ads]
+        eligible = [(ad, weight) for ad, weight in zip(ads, weights) if weight > 0]
+        self._weights.update((ad.id, weight) for ad, weight in zip(ads, weights))
+        table = AliasTable([ad for ad, _ in eligible], [weight for _, weight in eligible])
+
+        self._tables[key] = (now, table)
+        return table
+
+    def select(self, platform: Optional[Platform] = None, limit: int = 3,
+               allow: Optional[Callable[[Advertisement], bool]] = None) -> List[Advertisement]:
+        """Draw up to `limit` distinct ads, skipping ads `allow` rejects"""
+        table = self._table(platform)
+        if not table:
+            return []
+
+        limit = min(limit, len(table))
+        chosen: Dict[str, Advertisement] = {}
+        rejected = set()
+        for _ in range(limit * 4):
+            ad = table.draw(self.rng)
+            if ad.id in chosen or ad.id in rejected:
+                continue
+            if allow is not None and not allow(ad):
+                rejected.add(ad.id)
+                if len(rejected) + limit > len(table):
+                    limit = len(table) - len(rejected)
+            else:
+                chosen[ad.id] = ad
+            if len(chosen) >= limit:
+                break
+        return list(chosen.values())
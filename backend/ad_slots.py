@@ -0,0 +1,86 @@
+# Ad Slot Planning
+
+from typing import List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime
+from itertools import islice
+import random
+
+from models import Advertisement, Platform, ViralVideo
+
+# An ad goes after every MIN_GAP to MAX_GAP videos
+MIN_GAP = 6
+MAX_GAP = 8
+
+
+@lru_cache(maxsize=4096)
+def plan_slots(feed_length: int, max_ads: int, seed: int) -> Tuple[int, ...]:
+    """Feed positions after which an ad is inserted, the same for a given length and seed"""
+    rng = random.Random(seed)
+    slots = []
+    position = rng.randint(MIN_GAP, MAX_GAP)
+    while position <= feed_length and len(slots) < max_ads:
+        slots.append(position)
+        position += rng.randint(MIN_GAP, MAX_GAP)
+    return tuple(slots)
+
+
+def default_seed(now: Optional[datetime] = None) -> int:
+    """Placements stay stable for a day"""
+    return (now or datetime.utcnow()).toordinal()
+
+
+class AdCardCache:
+    """Prebuilt sponsored feed cards, one per version of an ad's display fields"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._cards: "OrderedDict[Tuple, ViralVideo]" = OrderedDict()
+
+    @staticmethod
+    def version_key(ad: Advertisement) -> Tuple:
+        return (ad.id, ad.title, ad.description, ad.image_url, ad.click_url, ad.advertiser)
+
+    def get(self, ad: Advertisement) -> ViralVideo:
+        """Get the card for an ad; callers must not modify it"""
+        key = self.version_key(ad)
+        card = self._cards.get(key)
+        if card is not None:
+            self._cards.move_to_end(key)
+            return card
+
+        built_at = ad.created_at
+        card = ViralVideo(
+            id=f"ad_{ad.id}",
+            title=f"🎯 {ad.title}",
+            url=ad.click_url,
+            thumbnail=ad.image_url,
+            platform=Platform.ADVERTISEMENT,
+            views=None,
+            likes=None,
+            author=ad.advertiser,
+            description=ad.description,
+            viral_score=0,
+            is_sponsored=True,
+            sponsor_name=ad.advertiser,
+            fetched_at=built_at,
+            published_at=built_at
+        )
+        self._cards[key] = card
+        if len(self._cards) > self.max_size:
+            self._cards.popitem(last=False)
+        return card
+
+
+def merge_ads(videos: Sequence, cards: Sequence[ViralVideo], slots: Sequence[int]) -> List:
+    """Single pass merge of ad cards into a feed at planned slots"""
+    remaining = iter(videos)
+    result = []
+    start = 0
+    for slot, card in zip(slots, cards):
+        result.extend(islice(remaining, slot - start))
+        result.append(card)
+        start = slot
+    result.extend(remaining)
+    return result
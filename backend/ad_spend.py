@@ -0,0 +1,116 @@
+# Real-Time Ad Spend Tracking
+
+from typing import Dict
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+from ad_inventory import AdInventory
+from ad_events import AdEventBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class SpendTracker:
+    """In-memory spend per ad that retires ads from serving once their budget is used up"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, inventory: AdInventory, event_buffer: AdEventBuffer):
+        self.db = db
+        self.inventory = inventory
+        self.event_buffer = event_buffer
+        self.reconcile_interval = int(os.environ.get('AD_SPEND_RECONCILE_INTERVAL', 60))
+        self.version = 0
+        self._day = datetime.utcnow().date()
+        self._spent_total: Dict[str, float] = {}
+        self._spent_today: Dict[str, float] = {}
+        self._deactivations: Dict[str, asyncio.Task] = {}
+
+    def _reset_day_if_needed(self):
+        today = datetime.utcnow().date()
+        if today != self._day:
+            self._day = today
+            self._spent_today = {}
+            self.version += 1
+
+    def spent_total(self, ad_id: str) -> float:
+        return self._spent_total.get(ad_id, 0.0)
+
+    def spent_today(self, ad_id: str) -> float:
+        self._reset_day_if_needed()
+        return self._spent_today.get(ad_id, 0.0)
+
+    def record(self, ad_id: str, amount: float) -> bool:
+        """Add click spend for an ad; returns True if this exhausted its budget"""
+        self._reset_day_if_needed()
+        self._spent_total[ad_id] = self._spent_total.get(ad_id, 0.0) + amount
+        self._spent_today[ad_id] = self._spent_today.get(ad_id, 0.0) + amount
+        return self._check_budget(ad_id)
+
+    def _check_budget(self, ad_id: str) -> bool:
+        ad = self.inventory.get(ad_id)
+        if ad is None or not ad.is_active or self._spent_total.get(ad_id, 0.0) < ad.budget:
+            return False
+
+        # Stop serving immediately; the database write happens off the click path
+        self.inventory.deactivate(ad_id)
+        if ad_id not in self._deactivations:
+            self._deactivations[ad_id] = asyncio.create_task(self._deactivate(ad_id))
+        logger.info(f"Ad {ad_id} exhausted its budget of {ad.budget:.2f}")
+        return True
+
+    async def _deactivate(self, ad_id: str):
+        try:
+            await self.db.advertisements.update_one(
+                {"id": ad_id},
+                {"$set": {"is_active": False, "exhausted_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.error(f"Error deactivating exhausted ad {ad_id}: {e}")
+        finally:
+            self._deactivations.pop(ad_id, None)
+
+    async def reconcile(self):
+        """Rebase spend on hourly rollup totals plus clicks still waiting in the event buffer"""
+        day_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        pipeline = [
+            {"$match": {"revenue": {"$gt": 0}}},
+            {
+                "$group": {
+                    "_id": "$ad_id",
+                    "total": {"$sum": "$revenue"},
+                    "today": {"$sum": {"$cond": [{"$gte": ["$hour", day_start]}, "$revenue", 0]}}
+                }
+            }
+        ]
+
+        # Hold the flush lock so no buffered click is counted twice or missed
+        async with self.event_buffer.flush_lock:
+            spent_total: Dict[str, float] = {}
+            spent_today: Dict[str, float] = {}
+            async for row in self.db.ad_hourly_rollups.aggregate(pipeline):
+                spent_total[row["_id"]] = row["total"]
+                spent_today[row["_id"]] = row["today"]
+
+            for ad_id, amount in self.event_buffer.pending_spend().items():
+                spent_total[ad_id] = spent_total.get(ad_id, 0.0) + amount
+            for ad_id, amount in self.event_buffer.pending_spend(since=day_start).items():
+                spent_today[ad_id] = spent_today.get(ad_id, 0.0) + amount
+
+        self._day = day_start.date()
+        self._spent_total = spent_total
+        self._spent_today = spent_today
+        self.version += 1
+
+        for ad_id in list(spent_total):
+            self._check_budget(ad_id)
+
+    async def run_reconciler(self):
+        """Periodically reconcile in-memory spend with the database"""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Error reconciling ad spend: {e}")
+            await asyncio.sleep(self.reconcile_interval)
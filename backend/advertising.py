@@ -1,101 +1,145 @@
 # Advertising System
 
-from typing import List, Optional
+from typing import List, Optional, Sequence
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import Advertisement, AdImpression, AdClick, Platform, User, SubscriptionTier, ViralVideo
-import random
-from datetime import datetime
+from models import Advertisement, AdImpression, AdClick, AdEventBatch, Platform, User, SubscriptionTier
+from ad_inventory import AdInventory
+from ad_events import AdEventBuffer, hour_start
+from ad_selection import AdSelector
+from ad_spend import SpendTracker
+from ad_slots import AdCardCache, plan_slots, merge_ads, default_seed
+from ad_frequency import FrequencyCapper
+from ad_fraud import ClickFraudFilter
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
 class AdvertisingService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, inventory: Optional[AdInventory] = None,
+                 event_buffer: Optional[AdEventBuffer] = None,
+                 spend_tracker: Optional[SpendTracker] = None,
+                 selector: Optional[AdSelector] = None,
+                 frequency_capper: Optional[FrequencyCapper] = None,
+                 fraud_filter: Optional[ClickFraudFilter] = None):
         self.db = db
+        self.inventory = inventory or AdInventory(db)
+        self.event_buffer = event_buffer or AdEventBuffer(db, self.inventory)
+        self.spend_tracker = spend_tracker or SpendTracker(db, self.inventory, self.event_buffer)
+        self.selector = selector or AdSelector(self.inventory, self.spend_tracker)
+        self.ad_cards = AdCardCache()
+        self.frequency_capper = frequency_capper or FrequencyCapper()
+        self.fraud_filter = fraud_filter or ClickFraudFilter()
+    
+    @staticmethod
+    def _viewer(user: Optional[User], viewer: Optional[str]) -> Optional[str]:
+        """Frequency caps follow the user when signed in, else the anonymous client key"""
+        return user.id if user else viewer
     
     async def get_ads_for_platform(self, platform: Optional[Platform] = None, 
-                                 user: Optional[User] = None, limit: int = 3) -> List[Advertisement]:
-        """Get relevant ads for a platform and user"""
+                                 user: Optional[User] = None, limit: int = 3,
+                                 viewer: Optional[str] = None) -> List[Advertisement]:
+        """Get relevant ads for a platform and user, weighted by CPC and remaining budget"""
         
         # Premium users don't see ads
         if user and user.subscription_tier != SubscriptionTier.FREE:
             return []
         
-        # Build query
-        query = {"is_active": True}
-        if platform:
-            query["target_platforms"] = {"$in": [platform.value]}
-        
-        # Get active ads
-        ads_cursor = self.db.advertisements.find(query).limit(limit)
-        ads = await ads_cursor.to_list(limit)
-        
-        # Convert to Advertisement objects
-        ad_objects = []
-        for ad_data in ads:
-            try:
-                ad = Advertisement(**ad_data)
-                ad_objects.append(ad)
-            except Exception as e:
-                logger.error(f"Error parsing advertisement: {e}")
-                continue
-        
-        return ad_objects
+        viewer = self._viewer(user, viewer)
+        if viewer is None:
+            return self.selector.select(platform, limit)
+        return self.selector.select(platform, limit, lambda ad: self.frequency_capper.allows(viewer, ad.id))
+    
+    def _is_duplicate_impression(self, ad_id: str, viewer: Optional[str]) -> bool:
+        return viewer is not None and not self.frequency_capper.record_impression(viewer, ad_id)
     
     async def record_impression(self, ad_id: str, user: Optional[User] = None, 
-                              platform: Optional[Platform] = None) -> bool:
-        """Record an ad impression"""
+                              platform: Optional[Platform] = None, viewer: Optional[str] = None) -> bool:
+        """Record an ad impression; repeats within the dedupe window are dropped"""
         try:
+            if self._is_duplicate_impression(ad_id, self._viewer(user, viewer)):
+                return False
+            
             impression = AdImpression(
                 ad_id=ad_id,
                 user_id=user.id if user else None,
                 platform=platform
             )
             
-            # Save impression
-            await self.db.ad_impressions.insert_one(impression.dict())
-            
-            # Update ad impression count
-            await self.db.advertisements.update_one(
-                {"id": ad_id},
-                {"$inc": {"impressions": 1}}
-            )
+            # Buffered; the event and the counter increment are written on the next flush
+            self.event_buffer.add_impression(impression)
             
             return True
         except Exception as e:
             logger.error(f"Error recording ad impression: {e}")
             return False
     
-    async def record_click(self, ad_id: str, user: Optional[User] = None) -> bool:
-        """Record an ad click and calculate revenue"""
+    async def record_click(self, ad_id: str, user: Optional[User] = None,
+                           clickers: Sequence[str] = ()) -> bool:
+        """Record an ad click and calculate revenue; clickers are the connection keys fraud checks count"""
         try:
             # Get ad details for revenue calculation
-            ad_data = await self.db.advertisements.find_one({"id": ad_id})
-            if not ad_data:
+            ad = self.inventory.get(ad_id)
+            if not ad:
                 return False
             
-            ad = Advertisement(**ad_data)
-            
-            # Record click
-            click = AdClick(
-                ad_id=ad_id,
-                user_id=user.id if user else None,
-                revenue=ad.cost_per_click
-            )
-            
-            await self.db.ad_clicks.insert_one(click.dict())
-            
-            # Update ad click count
-            await self.db.advertisements.update_one(
-                {"id": ad_id},
-                {"$inc": {"clicks": 1}}
-            )
+            self._charge_click(ad, user, clickers)
             
             return True
         except Exception as e:
             logger.error(f"Error recording ad click: {e}")
             return False
     
+    def _charge_click(self, ad: Advertisement, user: Optional[User], clickers: Sequence[str]):
+        """Buffer a click and charge it, or quarantine it if it is part of a burst"""
+        click = AdClick(ad_id=ad.id, user_id=user.id if user else None, revenue=ad.cost_per_click)
+        
+        # Counted per signed-in user and per connection key, so changing only one of them doesn't reset the window
+        reason = self.fraud_filter.check((f"user:{user.id}" if user else None, *clickers), ad.id)
+        if reason:
+            self.event_buffer.add_quarantined_click(click, reason)
+            return
+        
+        self.event_buffer.add_click(click)
+        self._note_spend(ad)
+    
+    def _note_spend(self, ad: Advertisement):
+        """Charge a click to the ad's budget; exhausted ads leave the serving index"""
+        if not self.spend_tracker.record(ad.id, ad.cost_per_click):
+            self.selector.note_spend(ad)
+    
+    def record_event_batch(self, batch: AdEventBatch, user: Optional[User] = None,
+                           viewer: Optional[str] = None, clickers: Sequence[str] = ()) -> dict:
+        """Buffer a batch of impressions and clicks, skipping unknown ads and repeated impressions"""
+        user_id = user.id if user else None
+        capped_viewer = self._viewer(user, viewer)
+        accepted = 0
+        rejected = 0
+        duplicates = 0
+        
+        for event in batch.impressions:
+            if self.inventory.get(event.ad_id) is None:
+                rejected += 1
+                continue
+            if self._is_duplicate_impression(event.ad_id, capped_viewer):
+                duplicates += 1
+                continue
+            self.event_buffer.add_impression(
+                AdImpression(ad_id=event.ad_id, user_id=user_id, platform=event.platform)
+            )
+            accepted += 1
+        
+        for event in batch.clicks:
+            ad = self.inventory.get(event.ad_id)
+            if ad is None:
+                rejected += 1
+                continue
+            # Quarantined clicks are reported as accepted so bursts get no feedback
+            self._charge_click(ad, user, clickers)
+            accepted += 1
+        
+        return {"accepted": accepted, "rejected": rejected, "duplicates": duplicates}
+    
     async def create_sample_ads(self):
         """Create sample advertisements for testing"""
         sample_ads = [
@@ -155,50 +199,31 @@ class AdvertisingService:
                 logger.info(f"Created sample ad: {ad.title}")
     
     async def get_ad_analytics(self, advertiser: Optional[str] = None, days: int = 30) -> dict:
-        """Get advertising analytics"""
-        from datetime import timedelta
-        
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Build query
-        match_query = {"timestamp": {"$gte": start_date}}
-        
-        # Get impression analytics
-        impression_pipeline = [
-            {"$match": match_query},
-            {"$group": {
-                "_id": "$ad_id",
-                "impressions": {"$sum": 1}
-            }}
-        ]
+        """Get advertising analytics from hourly rollups"""
+        start_hour = hour_start(datetime.utcnow() - timedelta(days=days))
         
-        impressions = await self.db.ad_impressions.aggregate(impression_pipeline).to_list(1000)
+        # Served by the (advertiser, hour) index, or the hour index for all advertisers
+        match_query = {"hour": {"$gte": start_hour}}
+        if advertiser:
+            match_query["advertiser"] = advertiser
         
-        # Get click analytics
-        click_pipeline = [
+        pipeline = [
             {"$match": match_query},
             {"$group": {
                 "_id": "$ad_id",
-                "clicks": {"$sum": 1},
+                "impressions": {"$sum": "$impressions"},
+                "clicks": {"$sum": "$clicks"},
                 "revenue": {"$sum": "$revenue"}
             }}
         ]
         
-        clicks = await self.db.ad_clicks.aggregate(click_pipeline).to_list(1000)
-        
-        # Combine data
         analytics = {}
-        for item in impressions:
-            ad_id = item["_id"]
-            analytics[ad_id] = {"impressions": item["impressions"], "clicks": 0, "revenue": 0.0}
-        
-        for item in clicks:
-            ad_id = item["_id"]
-            if ad_id in analytics:
-                analytics[ad_id]["clicks"] = item["clicks"]
-                analytics[ad_id]["revenue"] = item["revenue"]
-            else:
-                analytics[ad_id] = {"impressions": 0, "clicks": item["clicks"], "revenue": item["revenue"]}
+        async for item in self.db.ad_hourly_rollups.aggregate(pipeline):
+            analytics[item["_id"]] = {
+                "impressions": item["impressions"],
+                "clicks": item["clicks"],
+                "revenue": item["revenue"]
+            }
         
         # Calculate totals
         total_impressions = sum(data["impressions"] for data in analytics.values())
@@ -214,7 +239,7 @@ class AdvertisingService:
         }
     
     def inject_ads_into_videos(self, videos: List, ads: List[Advertisement], 
-                              user: Optional[User] = None) -> List:
+                              user: Optional[User] = None, seed: Optional[int] = None) -> List:
         """Inject ads into video list for free tier users"""
         
         # Premium users don't see ads
@@ -224,34 +249,7 @@ class AdvertisingService:
         if not ads or len(videos) < 4:
             return videos
         
-        # Insert ads every 5-8 videos
-        result = []
-        ad_index = 0
-        
-        for i, video in enumerate(videos):
-            result.append(video)
-            
-            # Insert ad every 6-8 videos (with some randomness)
-            if (i + 1) % random.randint(6, 8) == 0 and ad_index < len(ads):
-                ad = ads[ad_index]
-                # Create ViralVideo object for ads instead of dict
-                ad_video = ViralVideo(
-                    id=f"ad_{ad.id}",
-                    title=f"🎯 {ad.title}",
-                    url=ad.click_url,
-                    thumbnail=ad.image_url,
-                    platform="advertisement",
-                    views=None,
-                    likes=None,
-                    author=ad.advertiser,
-                    description=ad.description,
-                    viral_score=0,
-                    is_sponsored=True,
-                    sponsor_name=ad.advertiser,
-                    fetched_at=datetime.utcnow(),
-                    published_at=datetime.utcnow()
-                )
-                result.append(ad_video)
-                ad_index += 1
-        
-        return result
\ No newline at end of file
+        # Insert ads every 6-8 videos at positions planned once per feed length and seed
+        slots = plan_slots(len(videos), len(ads), default_seed() if seed is None else seed)
+        cards = [self.ad_cards.get(ad) for ad in ads[:len(slots)]]
+        return merge_ads(videos, cards, slots)
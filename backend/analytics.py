@@ -1,16 +1,34 @@
 # Analytics System
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import PlatformAnalytics, UserAnalytics, SystemAnalytics, Platform, SubscriptionTier
+from models import PlatformAnalytics, UserAnalytics, SystemAnalytics, Platform, SubscriptionTier, ViralVideo
+from trending import TrendingTopicsEngine
+from usage_sketches import UsageSketchService
+from revenue_ledger import RevenueLedger
 from datetime import datetime, timedelta
+from collections import OrderedDict
+import asyncio
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
 class AnalyticsService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, trending_engine: Optional[TrendingTopicsEngine] = None,
+                 usage_sketches: Optional[UsageSketchService] = None,
+                 revenue_ledger: Optional[RevenueLedger] = None):
         self.db = db
+        self.trending_engine = trending_engine or TrendingTopicsEngine()
+        self.usage_sketches = usage_sketches or UsageSketchService(db)
+        self.revenue_ledger = revenue_ledger or RevenueLedger(db)
+        self.dashboard_interval = int(os.environ.get('ANALYTICS_DASHBOARD_INTERVAL', 300))
+        self.user_section_ttl = int(os.environ.get('ANALYTICS_USER_CACHE_TTL', 120))
+        self.max_user_sections = 10000
+        self._dashboard: Optional[Dict] = None
+        self._dashboard_lock = asyncio.Lock()
+        self._user_sections: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
     
     async def get_platform_analytics(self, platform: Optional[Platform] = None, 
                                    days: int = 30) -> Dict:
@@ -54,62 +72,66 @@ class AnalyticsService:
         return analytics
     
     async def get_trending_topics(self, platform: Optional[Platform] = None, 
-                                limit: int = 10) -> List[str]:
-        """Extract trending topics from video titles"""
-        match_query = {}
-        if platform:
-            match_query["platform"] = platform.value
-        
-        # Get recent high-scoring videos
-        videos = await self.db.viral_videos.find(
-            match_query,
-            {"title": 1, "viral_score": 1}
-        ).sort("viral_score", -1).limit(50).to_list(50)
-        
-        # Simple keyword extraction (in production, use NLP)
-        trending_words = {}
-        for video in videos:
-            title = video.get("title", "").lower()
-            words = title.split()
-            for word in words:
-                if len(word) > 3 and word.isalpha():
-                    trending_words[word] = trending_words.get(word, 0) + 1
-        
-        # Return top trending words
-        sorted_words = sorted(trending_words.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, count in sorted_words[:limit]]
+                                limit: int = 10, window: str = "24h") -> List[str]:
+        """Get trending topics from the incremental trending engine"""
+        return self.trending_engine.top_topics(platform, window, limit)
+    
+    async def warm_trending_topics(self, days: int = 7):
+        """Seed the trending engine with recently fetched videos"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+        cursor = self.db.viral_videos.find(
+            {"fetched_at": {"$gte": start_date}},
+            {"_id": 0, "title": 1, "url": 1, "platform": 1, "fetched_at": 1, "thumbnail": 1}
+        ).batch_size(1000)
+        
+        ingested = 0
+        async for video_data in cursor:
+            try:
+                if self.trending_engine.ingest(ViralVideo(**video_data)):
+                    ingested += 1
+            except Exception as e:
+                logger.error(f"Error ingesting video into trending engine: {e}")
+        logger.info(f"Warmed trending engine with {ingested} videos")
     
     async def get_user_analytics(self, user_id: str, days: int = 30) -> UserAnalytics:
         """Get analytics for a specific user"""
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # API usage analytics
-        api_usage = await self.db.api_usage.find({
-            "user_id": user_id,
-            "timestamp": {"$gte": start_date}
-        }).to_list(10000)
-        
-        # Process API usage data
-        total_api_calls = len(api_usage)
-        videos_accessed = len([u for u in api_usage if "/videos" in u.get("endpoint", "")])
-        
-        # Platform preferences
-        platform_counts = {}
-        for usage in api_usage:
-            endpoint = usage.get("endpoint", "")
-            if "platform=" in endpoint:
-                platform = endpoint.split("platform=")[1].split("&")[0]
-                platform_counts[platform] = platform_counts.get(platform, 0) + 1
-        
-        favorite_platforms = sorted(platform_counts.keys(), 
-                                  key=lambda x: platform_counts[x], 
-                                  reverse=True)[:3]
-        
-        # Usage by day
-        usage_by_day = {}
-        for usage in api_usage:
-            date_str = usage["timestamp"].strftime("%Y-%m-%d")
-            usage_by_day[date_str] = usage_by_day.get(date_str, 0) + 1
+        # API usage analytics, grouped server-side on the structured usage fields
+        pipeline = [
+            {"$match": {"user_id": user_id, "timestamp": {"$gte": start_date}}},
+            {
+                "$facet": {
+                    "total": [{"$count": "count"}],
+                    "videos": [
+                        {"$match": {"$or": [
+                            {"route": "/api/videos"},
+                            {"route": None, "endpoint": "/api/videos"}
+                        ]}},
+                        {"$count": "count"}
+                    ],
+                    "platforms": [
+                        {"$match": {"platform": {"$ne": None}}},
+                        {"$group": {"_id": "$platform", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}},
+                        {"$limit": 3}
+                    ],
+                    "by_day": [
+                        {"$group": {
+                            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                            "count": {"$sum": 1}
+                        }}
+                    ]
+                }
+            }
+        ]
+        results = await self.db.api_usage.aggregate(pipeline).to_list(1)
+        facets = results[0] if results else {}
+        
+        total_api_calls = facets["total"][0]["count"] if facets.get("total") else 0
+        videos_accessed = facets["videos"][0]["count"] if facets.get("videos") else 0
+        favorite_platforms = [item["_id"] for item in facets.get("platforms", [])]
+        usage_by_day = {item["_id"]: item["count"] for item in facets.get("by_day", [])}
         
         # Calculate subscription value (estimated)
         user = await self.db.users.find_one({"id": user_id})
@@ -129,113 +151,152 @@ class AnalyticsService:
             subscription_value=subscription_value
         )
     
-    async def get_system_analytics(self, days: int = 30) -> SystemAnalytics:
-        """Get overall system analytics"""
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # User counts
-        total_users = await self.db.users.count_documents({"is_active": True})
-        active_subscribers = await self.db.users.count_documents({
-            "is_active": True,
-            "subscription_tier": {"$ne": "free"}
-        })
-        
-        # API usage
-        total_api_calls = await self.db.api_usage.count_documents({
-            "timestamp": {"$gte": start_date}
-        })
-        
-        # Daily active users
-        daily_active_users = await self.db.api_usage.distinct("user_id", {
-            "timestamp": {"$gte": datetime.utcnow() - timedelta(days=1)},
-            "user_id": {"$ne": None}
-        })
-        
-        # Revenue calculation (estimated)
-        pro_users = await self.db.users.count_documents({
-            "subscription_tier": "pro",
-            "is_active": True
-        })
-        business_users = await self.db.users.count_documents({
-            "subscription_tier": "business", 
-            "is_active": True
-        })
-        
-        revenue_this_month = (pro_users * 9.99) + (business_users * 29.99)
-        
-        # Platform distribution
+    async def _get_user_counts(self) -> Dict[str, int]:
+        """Count active users per subscription tier in a single aggregation"""
+        pipeline = [
+            {"$match": {"is_active": True}},
+            {"$group": {"_id": "$subscription_tier", "count": {"$sum": 1}}}
+        ]
+        results = await self.db.users.aggregate(pipeline).to_list(10)
+        return {result["_id"]: result["count"] for result in results}
+    
+    async def _get_platform_distribution(self, start_date: datetime) -> Dict[Platform, int]:
+        """Count fetched videos per platform"""
         platform_pipeline = [
             {"$match": {"fetched_at": {"$gte": start_date}}},
             {"$group": {"_id": "$platform", "count": {"$sum": 1}}}
         ]
         
         platform_results = await self.db.viral_videos.aggregate(platform_pipeline).to_list(10)
-        platform_distribution = {
+        return {
             Platform(result["_id"]): result["count"] 
             for result in platform_results 
             if result["_id"] in Platform.__members__.values()
         }
+    
+    async def get_system_analytics(self, days: int = 30) -> SystemAnalytics:
+        """Get overall system analytics"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+        
+        # Independent queries run concurrently
+        user_counts, total_api_calls, active_users, platform_distribution, revenue_this_month = await asyncio.gather(
+            self._get_user_counts(),
+            self.db.api_usage.count_documents({"timestamp": {"$gte": start_date}}),
+            self.usage_sketches.get_active_user_counts(),
+            self._get_platform_distribution(start_date),
+            self.revenue_ledger.get_revenue_this_month()
+        )
         
         return SystemAnalytics(
-            total_users=total_users,
+            total_users=sum(user_counts.values()),
             total_api_calls=total_api_calls,
-            revenue_this_month=round(revenue_this_month, 2),
-            active_subscribers=active_subscribers,
+            revenue_this_month=revenue_this_month,
+            active_subscribers=sum(
+                count for tier, count in user_counts.items()
+                if tier != SubscriptionTier.FREE.value
+            ),
             platform_distribution=platform_distribution,
-            daily_active_users=len(daily_active_users)
+            **active_users
         )
     
     async def get_revenue_analytics(self, days: int = 30) -> Dict:
-        """Get detailed revenue analytics"""
+        """Get detailed revenue analytics from the daily revenue ledger"""
         start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Payment transactions
-        payments = await self.db.payment_transactions.find({
-            "created_at": {"$gte": start_date},
-            "status": "completed"
-        }).to_list(10000)
-        
-        # Group by subscription tier
-        revenue_by_tier = {"pro": 0.0, "business": 0.0}
-        for payment in payments:
-            tier = payment.get("subscription_tier")
-            if tier in revenue_by_tier:
-                revenue_by_tier[tier] += payment.get("amount", 0.0)
-        
-        # Daily revenue
-        daily_revenue = {}
-        for payment in payments:
-            date_str = payment["created_at"].strftime("%Y-%m-%d")
-            daily_revenue[date_str] = daily_revenue.get(date_str, 0.0) + payment.get("amount", 0.0)
-        
-        total_revenue = sum(daily_revenue.values())
+        revenue = await self.revenue_ledger.get_revenue(start_date)
         
         return {
-            "total_revenue": round(total_revenue, 2),
-            "revenue_by_tier": revenue_by_tier,
-            "daily_revenue": daily_revenue,
-            "average_daily_revenue": round(total_revenue / days, 2) if days > 0 else 0,
-            "total_transactions": len(payments)
+            **revenue,
+            "average_daily_revenue": {
+                currency: round(total / days, 2) if days > 0 else 0
+                for currency, total in revenue["total_revenue"].items()
+            }
         }
     
-    async def create_analytics_dashboard_data(self, user_id: Optional[str] = None) -> Dict:
-        """Create comprehensive dashboard data"""
-        
-        # System analytics
-        system_analytics = await self.get_system_analytics()
-        platform_analytics = await self.get_platform_analytics()
-        revenue_analytics = await self.get_revenue_analytics()
+    async def refresh_dashboard(self) -> Dict:
+        """Rebuild and persist the materialized global dashboard"""
+        system_analytics, platform_analytics, revenue_analytics = await asyncio.gather(
+            self.get_system_analytics(),
+            self.get_platform_analytics(),
+            self.get_revenue_analytics()
+        )
         
-        dashboard_data = {
+        dashboard = {
             "system": system_analytics.dict(),
             "platforms": platform_analytics,
             "revenue": revenue_analytics,
+            "generated_at": datetime.utcnow()
+        }
+        
+        await self.db.analytics_dashboards.replace_one(
+            {"_id": "global"},
+            {"_id": "global", **dashboard},
+            upsert=True
+        )
+        self._dashboard = dashboard
+        return dashboard
+    
+    async def get_dashboard(self, force_refresh: bool = False) -> Dict:
+        """Get the materialized global dashboard"""
+        # Refreshes swap in a whole new dict, so readers never wait on one
+        dashboard = self._dashboard
+        if dashboard is not None and not force_refresh:
+            return dashboard
+        
+        # Only the first build and forced refreshes are serialized
+        async with self._dashboard_lock:
+            if force_refresh:
+                return await self.refresh_dashboard()
+            
+            if self._dashboard is None:
+                # Reuse a dashboard materialized by another worker if it is still fresh
+                stored = await self.db.analytics_dashboards.find_one({"_id": "global"})
+                max_age = timedelta(seconds=self.dashboard_interval)
+                if stored and stored["generated_at"] >= datetime.utcnow() - max_age:
+                    stored.pop("_id")
+                    self._dashboard = stored
+                else:
+                    await self.refresh_dashboard()
+            
+            return self._dashboard
+    
+    async def run_dashboard_refresher(self):
+        """Periodically rebuild the materialized dashboard"""
+        while True:
+            try:
+                await self.refresh_dashboard()
+            except Exception as e:
+                logger.error(f"Error refreshing analytics dashboard: {e}")
+            await asyncio.sleep(self.dashboard_interval)
+    
+    async def get_user_section(self, user_id: str) -> Dict:
+        """Get per-user analytics, cached per user for user_section_ttl seconds"""
+        now = time.monotonic()
+        cached = self._user_sections.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        user_analytics = await self.get_user_analytics(user_id)
+        section = user_analytics.dict()
+        
+        # Every entry has the same TTL, so insertion order is expiry order; evict the oldest
+        self._user_sections[user_id] = (now + self.user_section_ttl, section)
+        self._user_sections.move_to_end(user_id)
+        while len(self._user_sections) > self.max_user_sections:
+            self._user_sections.popitem(last=False)
+        return section
+    
+    async def create_analytics_dashboard_data(self, user_id: Optional[str] = None,
+                                              force_refresh: bool = False) -> Dict:
+        """Create comprehensive dashboard data"""
+        dashboard = await self.get_dashboard(force_refresh)
+        
+        dashboard_data = {
+            **dashboard,
             "timestamp": datetime.utcnow().isoformat()
         }
         
         # Add user-specific analytics if user_id provided
         if user_id:
-            user_analytics = await self.get_user_analytics(user_id)
-            dashboard_data["user"] = user_analytics.dict()
+            dashboard_data["user"] = await self.get_user_section(user_id)
         
-        return dashboard_data
\ No newline at end of file
+        return dashboard_data
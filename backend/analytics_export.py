@@ -0,0 +1,251 @@
+# Columnar Analytics Export
+
+from typing import AsyncIterator, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+import logging
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+class ExportDataset:
+    """A Mongo source exported with a fixed Arrow schema"""
+
+    def __init__(self, collection: str, time_field: str, schema: pa.Schema, pipeline: Optional[List[Dict]] = None):
+        self.collection = collection
+        self.time_field = time_field
+        self.schema = schema
+        self.pipeline = pipeline
+
+
+EXPORT_DATASETS: Dict[str, ExportDataset] = {
+    "videos": ExportDataset(
+        collection="viral_videos",
+        time_field="fetched_at",
+        schema=pa.schema([
+            ("id", pa.string()),
+            ("title", pa.string()),
+            ("url", pa.string()),
+            ("platform", pa.string()),
+            ("views", pa.int64()),
+            ("likes", pa.int64()),
+            ("shares", pa.int64()),
+            ("author", pa.string()),
+            ("duration", pa.string()),
+            ("viral_score", pa.float64()),
+            ("fetched_at", pa.timestamp("ms")),
+            ("published_at", pa.timestamp("ms")),
+        ])
+    ),
+    "usage": ExportDataset(
+        collection="api_usage",
+        time_field="timestamp",
+        schema=pa.schema([
+            ("day", pa.string()),
+            ("route", pa.string()),
+            ("platform", pa.string()),
+            ("tier", pa.string()),
+            ("calls", pa.int64()),
+            ("errors", pa.int64()),
+            ("results", pa.int64()),
+            ("avg_response_time_ms", pa.float64()),
+        ]),
+        pipeline=[
+            {
+                "$group": {
+                    "_id": {
+                        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                        "route": {"$ifNull": ["$route", "$endpoint"]},
+                        "platform": "$platform",
+                        "tier": "$tier"
+                    },
+                    "calls": {"$sum": 1},
+                    "errors": {"$sum": {"$cond": [{"$gte": ["$status_code", 400]}, 1, 0]}},
+                    "results": {"$sum": {"$ifNull": ["$result_count", 0]}},
+                    "avg_response_time_ms": {"$avg": "$response_time_ms"}
+                }
+            },
+            {"$sort": {"_id.day": 1}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "day": "$_id.day",
+                    "route": "$_id.route",
+                    "platform": "$_id.platform",
+                    "tier": "$_id.tier",
+                    "calls": 1,
+                    "errors": 1,
+                    "results": 1,
+                    "avg_response_time_ms": 1
+                }
+            }
+        ]
+    ),
+    "ad_stats": ExportDataset(
+        collection="ad_hourly_rollups",
+        time_field="hour",
+        schema=pa.schema([
+            ("day", pa.string()),
+            ("ad_id", pa.string()),
+            ("advertiser", pa.string()),
+            ("impressions", pa.int64()),
+            ("clicks", pa.int64()),
+            ("revenue", pa.float64()),
+        ]),
+        pipeline=[
+            {
+                "$group": {
+                    "_id": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$hour"}}, "ad_id": "$ad_id"},
+                    "advertiser": {"$first": "$advertiser"},
+                    "impressions": {"$sum": "$impressions"},
+                    "clicks": {"$sum": "$clicks"},
+                    "revenue": {"$sum": "$revenue"}
+                }
+            },
+            {"$sort": {"_id.day": 1}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "day": "$_id.day",
+                    "ad_id": "$_id.ad_id",
+                    "advertiser": 1,
+                    "impressions": 1,
+                    "clicks": 1,
+                    "revenue": 1
+                }
+            }
+        ]
+    ),
+}
+
+
+class _ChunkSink:
+    """Write-only file object whose buffered bytes are handed out after each batch"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class AnalyticsExporter:
+    """Stream analytics datasets from Mongo as Parquet or Arrow IPC"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    def resolve_schema(self, dataset: str, columns: Optional[List[str]] = None) -> pa.Schema:
+        """Validate the dataset and projected columns and get the output schema"""
+        spec = EXPORT_DATASETS.get(dataset)
+        if spec is None:
+            raise ValueError(f"Unknown dataset '{dataset}'. Choose one of: {', '.join(EXPORT_DATASETS)}")
+        if not columns:
+            return spec.schema
+
+        unknown = [column for column in columns if spec.schema.get_field_index(column) < 0]
+        if unknown:
+            raise ValueError(f"Unknown columns for {dataset}: {', '.join(unknown)}")
+        return pa.schema([spec.schema.field(column) for column in columns])
+
+    def _time_match(self, spec: ExportDataset, start: Optional[datetime], end: Optional[datetime]) -> Dict:
+        time_range = {}
+        if start:
+            time_range["$gte"] = start
+        if end:
+            time_range["$lt"] = end
+        return {spec.time_field: time_range} if time_range else {}
+
+    def _pipeline(self, spec: ExportDataset, schema: pa.Schema,
+                  start: Optional[datetime], end: Optional[datetime]) -> List[Dict]:
+        pipeline = [{"$match": self._time_match(spec, start, end)}] + spec.pipeline
+        pipeline.append({"$project": {"_id": 0, **{name: 1 for name in schema.names}}})
+        return pipeline
+
+    async def iter_batches(self, dataset: str, columns: Optional[List[str]] = None,
+                           start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           batch_size: int = DEFAULT_BATCH_SIZE) -> AsyncIterator[pa.RecordBatch]:
+        """Read a dataset with a batched cursor, yielding one record batch per batch_size rows"""
+        schema = self.resolve_schema(dataset, columns)
+        spec = EXPORT_DATASETS[dataset]
+        collection = self.db[spec.collection]
+
+        if spec.pipeline is None:
+            # Plain collections push the projection and time range into find()
+            cursor = collection.find(
+                self._time_match(spec, start, end),
+                {"_id": 0, **{name: 1 for name in schema.names}}
+            ).sort(spec.time_field, 1).batch_size(batch_size)
+        else:
+            cursor = collection.aggregate(
+                self._pipeline(spec, schema, start, end),
+                allowDiskUse=True,
+                batchSize=batch_size
+            )
+
+        rows = []
+        async for row in cursor:
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield pa.RecordBatch.from_pylist(rows, schema=schema)
+                rows = []
+        if rows:
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+    async def stream(self, dataset: str, export_format: str = "parquet", columns: Optional[List[str]] = None,
+                     start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> AsyncIterator[bytes]:
+        """Encode a dataset as Parquet (one row group per batch) or an Arrow IPC stream"""
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format '{export_format}'. Choose one of: {', '.join(EXPORT_FORMATS)}")
+        schema = self.resolve_schema(dataset, columns)
+
+        sink = _ChunkSink()
+        if export_format == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        else:
+            writer = ipc.new_stream(sink, schema)
+
+        rows = 0
+        try:
+            async for batch in self.iter_batches(dataset, columns, start, end, batch_size):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+        finally:
+            writer.close()
+
+        yield sink.drain()
+        logger.info(f"Exported {rows} {dataset} rows as {export_format}")
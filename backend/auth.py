@@ -5,15 +5,17 @@ from typing import Optional
 import secrets
 import hashlib
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import User, SubscriptionTier, APIUsage
+from models import User, SubscriptionTier, APIUsage, Platform
+from usage_sketches import UsageSketchService
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
 class AuthService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, usage_sketches: Optional[UsageSketchService] = None):
         self.db = db
+        self.usage_sketches = usage_sketches
     
     def generate_api_key(self) -> str:
         """Generate a secure API key"""
@@ -96,10 +98,24 @@ class AuthService:
         
         return calls_today < user.max_daily_api_calls
     
+    async def ensure_indexes(self):
+        """Create indexes used by rate limiting and usage analytics"""
+        await self.db.api_usage.create_index([("user_id", 1), ("timestamp", -1)])
+        await self.db.api_usage.create_index([("api_key", 1), ("timestamp", -1)])
+        await self.db.api_usage.create_index([("route", 1), ("timestamp", -1)])
+        await self.db.api_usage.create_index([("platform", 1), ("timestamp", -1)])
+        await self.db.api_usage.create_index("timestamp")
+    
     async def log_api_usage(self, user: Optional[User], endpoint: str, method: str, 
                           api_key: Optional[str] = None, response_time_ms: float = None,
-                          status_code: int = 200, error_message: str = None):
+                          status_code: int = 200, error_message: str = None,
+                          route: Optional[str] = None, platform: Optional[Platform] = None,
+                          limit: Optional[int] = None, result_count: Optional[int] = None):
         """Log API usage for analytics"""
+        if self.usage_sketches and user:
+            # Only matched route templates get an endpoint scope; raw paths of 404s are unbounded
+            self.usage_sketches.record(user.id, route, platform.value if platform else None)
+        
         usage = APIUsage(
             user_id=user.id if user else None,
             api_key=api_key,
@@ -107,7 +123,12 @@ class AuthService:
             method=method,
             response_time_ms=response_time_ms,
             status_code=status_code,
-            error_message=error_message
+            error_message=error_message,
+            route=route,
+            platform=platform,
+            tier=user.subscription_tier if user else None,
+            limit=limit,
+            result_count=result_count
         )
         
         await self.db.api_usage.insert_one(usage.dict())
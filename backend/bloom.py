@@ -0,0 +1,91 @@
+# Bloom Filters
+
+from typing import Callable, List, Tuple
+import hashlib
+import math
+import time
+
+
+def _hashes(value: str) -> Tuple[int, int]:
+    """Two independent 64-bit hashes of a string value"""
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+
+
+class BloomFilter:
+    """Fixed-size set membership filter sized for a capacity and false positive rate"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        if capacity <= 0:
+            raise ValueError("Bloom filter capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("Bloom filter error rate must be between 0 and 1")
+
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str) -> List[int]:
+        # Kirsch-Mitzenmacher double hashing
+        first, second = _hashes(value)
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def add(self, value: str) -> bool:
+        """Add a value; returns True if it was (probably) already present"""
+        present = True
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                present = False
+                self.bits[position >> 3] |= mask
+        return present
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+class RotatingBloomFilter:
+    """Bloom filters per time period; values are forgotten after `generations` periods"""
+
+    def __init__(self, capacity: int, period: float, generations: int = 2, error_rate: float = 0.01,
+                 clock: Callable[[], float] = time.time):
+        if generations < 1:
+            raise ValueError("A rotating Bloom filter needs at least one generation")
+
+        self.capacity = capacity
+        self.period = period
+        self.generations = generations
+        self.error_rate = error_rate
+        self.clock = clock
+        self._epoch = self._current_epoch()
+        self._filters = [BloomFilter(capacity, error_rate)]
+
+    def _current_epoch(self) -> int:
+        return int(self.clock() // self.period)
+
+    def _rotate(self):
+        epoch = self._current_epoch()
+        if epoch == self._epoch:
+            return
+        # Drop generations that fell out of the window and start a fresh one
+        elapsed = min(epoch - self._epoch, self.generations)
+        self._filters = [BloomFilter(self.capacity, self.error_rate)] + self._filters[:self.generations - elapsed]
+        self._epoch = epoch
+
+    def __contains__(self, value: str) -> bool:
+        self._rotate()
+        return any(value in bloom for bloom in self._filters)
+
+    def add(self, value: str) -> bool:
+        """Add a value to the current period; returns True if it was (probably) seen in the window"""
+        self._rotate()
+        seen = any(value in bloom for bloom in self._filters[1:])
+        return self._filters[0].add(value) or seen
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bloom.nbytes for bloom in self._filters)
@@ -0,0 +1,153 @@
+# Durable Delivery Queue
+
+from typing import Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from datetime import datetime, timedelta
+import logging
+import os
+import random
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_LEASED = "leased"
+JOB_DONE = "done"
+JOB_DEAD = "dead"
+
+
+def job_id(subscription_id: str, method: str, date: str) -> str:
+    """Idempotency key: one send per subscription, channel and digest date"""
+    return f"{subscription_id}:{method}:{date}"
+
+
+class DeliveryJobQueue:
+    """Outbound sends in Mongo, claimed under leases so any number of workers in any process can share them"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, clock=datetime.utcnow):
+        self.db = db
+        self.clock = clock
+        self.lease = timedelta(seconds=int(os.environ.get('DELIVERY_LEASE_SECONDS', 120)))
+        self.max_attempts = int(os.environ.get('DELIVERY_MAX_ATTEMPTS', 6))
+        self.backoff_base = float(os.environ.get('DELIVERY_BACKOFF_BASE', 30))
+        self.backoff_max = float(os.environ.get('DELIVERY_BACKOFF_MAX', 3600))
+        self.retention = int(os.environ.get('DELIVERY_JOB_RETENTION', 7 * 86400))
+
+    async def ensure_indexes(self):
+        """Create the indexes claims walk, and expire finished jobs after the retention period"""
+        await self.db.delivery_jobs.create_index([("method", 1), ("status", 1), ("available_at", 1)])
+        await self.db.delivery_jobs.create_index([("method", 1), ("status", 1), ("lease_until", 1)])
+        await self.db.delivery_jobs.create_index("finished_at", expireAfterSeconds=self.retention)
+        await self.db.delivery_dead_letters.create_index("failed_at")
+
+    async def enqueue(self, jobs: List[Dict]) -> int:
+        """Queue jobs keyed by their _id, ignoring any already queued; returns how many were new"""
+        if not jobs:
+            return 0
+        now = self.clock()
+        operations = [
+            UpdateOne(
+                {"_id": job["_id"]},
+                {"$setOnInsert": {
+                    **{key: value for key, value in job.items() if key != "_id"},
+                    "status": JOB_PENDING,
+                    "attempts": 0,
+                    "available_at": now,
+                    "created_at": now
+                }},
+                upsert=True
+            )
+            for job in jobs
+        ]
+        result = await self.db.delivery_jobs.bulk_write(operations, ordered=False)
+        return result.upserted_count
+
+    async def claim(self, method: str, worker: str) -> Optional[Dict]:
+        """Atomically lease the oldest due job for a method, or one whose lease expired"""
+        now = self.clock()
+        return await self.db.delivery_jobs.find_one_and_update(
+            {"method": method, "$or": [
+                {"status": JOB_PENDING, "available_at": {"$lte": now}},
+                # A worker died holding this lease; the reclaim counts as an attempt
+                {"status": JOB_LEASED, "lease_until": {"$lte": now}, "attempts": {"$lt": self.max_attempts}},
+            ]},
+            {
+                "$set": {"status": JOB_LEASED, "lease_until": now + self.lease,
+                         "lease_token": str(uuid.uuid4()), "worker": worker},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _leased(self, job: Dict) -> Dict:
+        # Only the current lease holder may settle a job
+        return {"_id": job["_id"], "lease_token": job["lease_token"]}
+
+    async def complete(self, job: Dict) -> bool:
+        """Mark a leased job sent; False if the lease was lost to another worker"""
+        result = await self.db.delivery_jobs.update_one(
+            self._leased(job),
+            {"$set": {"status": JOB_DONE, "finished_at": self.clock()}, "$unset": {"lease_until": "", "lease_token": ""}}
+        )
+        return result.modified_count == 1
+
+    def backoff(self, attempts: int) -> timedelta:
+        """Exponential delay before the next attempt, with jitter so retries do not arrive in waves"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    async def fail(self, job: Dict, error: Exception, retryable: bool = True) -> bool:
+        """Schedule a retry, or dead-letter the job once it is permanent or out of attempts; True if retried"""
+        now = self.clock()
+        if retryable and job["attempts"] < self.max_attempts:
+            await self.db.delivery_jobs.update_one(
+                self._leased(job),
+                {
+                    "$set": {"status": JOB_PENDING, "available_at": now + self.backoff(job["attempts"]),
+                             "last_error": str(error)},
+                    "$unset": {"lease_until": "", "lease_token": ""}
+                }
+            )
+            return True
+
+        result = await self.db.delivery_jobs.update_one(
+            self._leased(job),
+            {"$set": {"status": JOB_DEAD, "finished_at": now, "last_error": str(error)},
+             "$unset": {"lease_until": "", "lease_token": ""}}
+        )
+        if result.modified_count == 1:
+            await self._dead_letter(job, str(error), retryable, now)
+        return False
+
+    async def _dead_letter(self, job: Dict, error: str, retryable: bool, now: datetime):
+        # The job stays behind as a tombstone so the same key is never queued again
+        dead_letter = {key: value for key, value in job.items() if key not in ("status", "lease_until", "lease_token")}
+        dead_letter.update({"error": error, "retryable": retryable, "failed_at": now})
+        await self.db.delivery_dead_letters.replace_one({"_id": job["_id"]}, dead_letter, upsert=True)
+        logger.warning(f"Dead-lettered delivery job {job['_id']} after {job['attempts']} attempts: {error}")
+
+    async def reap(self) -> int:
+        """Dead-letter jobs whose lease expired after their last attempt; returns how many"""
+        reaped = 0
+        while True:
+            now = self.clock()
+            error = "Lease expired on the final attempt"
+            job = await self.db.delivery_jobs.find_one_and_update(
+                {"status": JOB_LEASED, "lease_until": {"$lte": now}, "attempts": {"$gte": self.max_attempts}},
+                {"$set": {"status": JOB_DEAD, "finished_at": now, "last_error": error},
+                 "$unset": {"lease_until": "", "lease_token": ""}},
+                return_document=ReturnDocument.BEFORE
+            )
+            if job is None:
+                return reaped
+            await self._dead_letter(job, error, True, now)
+            reaped += 1
+
+    async def counts(self) -> Dict[str, int]:
+        """Jobs per status"""
+        counts = {JOB_PENDING: 0, JOB_LEASED: 0, JOB_DONE: 0, JOB_DEAD: 0}
+        async for row in self.db.delivery_jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
@@ -0,0 +1,124 @@
+# Digest Delivery Transports
+
+from typing import Dict
+import asyncio
+import logging
+import os
+
+from python_http_client.exceptions import HTTPError
+from sendgrid import SendGridAPIClient
+from sendgrid.helpers.mail import Mail
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from twilio.base.exceptions import TwilioRestException
+from twilio.rest import Client as TwilioClient
+
+from models import DeliveryMethod
+from digest_delivery import DeliveryChannel, DeliveryError, Digest, FakeTransport
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_LENGTH = 4096
+WHATSAPP_MAX_LENGTH = 1600
+
+
+def _retryable_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+class SendGridTransport:
+    """Sends digests as HTML email with a plain text part"""
+
+    def __init__(self, api_key: str, sender: str):
+        self.client = SendGridAPIClient(api_key)
+        self.sender = sender
+
+    async def send(self, address: str, digest: Digest) -> None:
+        message = Mail(
+            from_email=self.sender,
+            to_emails=address,
+            subject=digest.subject,
+            html_content=digest.html,
+            plain_text_content=digest.text
+        )
+        try:
+            # The SendGrid client is blocking
+            await asyncio.to_thread(self.client.send, message)
+        except HTTPError as e:
+            raise DeliveryError(f"SendGrid returned {e.status_code}", retryable=_retryable_status(e.status_code))
+
+
+class TelegramTransport:
+    """Sends digests as Telegram bot messages to a chat id"""
+
+    def __init__(self, token: str):
+        self.bot = Bot(token)
+        self._initialized = False
+
+    async def send(self, address: str, digest: Digest) -> None:
+        try:
+            if not self._initialized:
+                await self.bot.initialize()
+                self._initialized = True
+            await self.bot.send_message(
+                chat_id=address,
+                text=f"{digest.subject}\n\n{digest.text}"[:TELEGRAM_MAX_LENGTH],
+                disable_web_page_preview=True
+            )
+        except (BadRequest, Forbidden) as e:
+            # Unknown chats and users who blocked the bot will not start working on retry
+            raise DeliveryError(f"Telegram rejected the message: {e}", retryable=False)
+        except RetryAfter as e:
+            raise DeliveryError(f"Telegram rate limited for {e.retry_after}s")
+        except TelegramError as e:
+            raise DeliveryError(f"Telegram error: {e}")
+
+
+class TwilioWhatsAppTransport:
+    """Sends digests as WhatsApp messages through Twilio"""
+
+    def __init__(self, account_sid: str, auth_token: str, sender: str):
+        self.client = TwilioClient(account_sid, auth_token)
+        self.sender = sender
+
+    async def send(self, address: str, digest: Digest) -> None:
+        try:
+            await asyncio.to_thread(
+                self.client.messages.create,
+                from_=f"whatsapp:{self.sender}",
+                to=f"whatsapp:{address}",
+                body=f"{digest.subject}\n\n{digest.text}"[:WHATSAPP_MAX_LENGTH]
+            )
+        except TwilioRestException as e:
+            raise DeliveryError(f"Twilio returned {e.status}: {e.msg}", retryable=_retryable_status(e.status))
+
+
+def build_channels() -> Dict[DeliveryMethod, DeliveryChannel]:
+    """Channels for every delivery method whose provider is configured"""
+    if os.environ.get('DIGEST_FAKE_TRANSPORTS', '').lower() in ('1', 'true', 'yes'):
+        return {method: DeliveryChannel(method, FakeTransport()) for method in DeliveryMethod}
+
+    channels: Dict[DeliveryMethod, DeliveryChannel] = {}
+    sendgrid_key = os.environ.get('SENDGRID_API_KEY')
+    sender_email = os.environ.get('DIGEST_SENDER_EMAIL')
+    if sendgrid_key and sender_email:
+        channels[DeliveryMethod.EMAIL] = DeliveryChannel(
+            DeliveryMethod.EMAIL, SendGridTransport(sendgrid_key, sender_email)
+        )
+
+    telegram_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    if telegram_token:
+        channels[DeliveryMethod.TELEGRAM] = DeliveryChannel(DeliveryMethod.TELEGRAM, TelegramTransport(telegram_token))
+
+    twilio_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    twilio_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    whatsapp_sender = os.environ.get('TWILIO_WHATSAPP_NUMBER')
+    if twilio_sid and twilio_token and whatsapp_sender:
+        channels[DeliveryMethod.WHATSAPP] = DeliveryChannel(
+            DeliveryMethod.WHATSAPP, TwilioWhatsAppTransport(twilio_sid, twilio_token, whatsapp_sender)
+        )
+
+    missing = [method.value for method in DeliveryMethod if method not in channels]
+    if missing:
+        logger.warning(f"Digest delivery not configured for: {', '.join(missing)}")
+    return channels
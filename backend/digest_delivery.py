@@ -0,0 +1,475 @@
+# Daily Digest Delivery
+
+from typing import Dict, List, Optional, Protocol, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+from collections import Counter
+from html import escape
+import asyncio
+import logging
+import os
+import random
+import secrets
+import socket
+import time
+
+from models import DeliveryMethod, Platform, ViralVideo
+from feed_snapshots import FeedSnapshot, FeedSnapshotStore
+from delivery_queue import DeliveryJobQueue, job_id
+
+logger = logging.getLogger(__name__)
+
+# (platforms, locale); an empty platform mix means every platform
+Segment = Tuple[Tuple[str, ...], str]
+
+ADDRESS_FIELDS = {
+    DeliveryMethod.EMAIL: "email",
+    DeliveryMethod.TELEGRAM: "telegram_id",
+    DeliveryMethod.WHATSAPP: "whatsapp_number",
+}
+
+# Method -> (concurrent sends, sends per second), within each provider's documented limits
+CHANNEL_DEFAULTS = {
+    DeliveryMethod.EMAIL: (20, 50.0),
+    DeliveryMethod.TELEGRAM: (10, 25.0),
+    DeliveryMethod.WHATSAPP: (5, 10.0),
+}
+
+DEFAULT_LOCALE = "en"
+
+LOCALES: Dict[str, Dict[str, str]] = {
+    "en": {"subject": "Your Viral Daily for {date}", "heading": "Today's top viral videos",
+           "views": "views", "footer": "You are receiving this because you subscribed to Viral Daily.",
+           "unsubscribe": "Unsubscribe", "confirm_subject": "Confirm your Viral Daily subscription",
+           "confirm": "Open this link to start receiving your daily digest:"},
+    "es": {"subject": "Tu Viral Daily del {date}", "heading": "Los videos más virales de hoy",
+           "views": "vistas", "footer": "Recibes este mensaje porque te suscribiste a Viral Daily.",
+           "unsubscribe": "Cancelar suscripción", "confirm_subject": "Confirma tu suscripción a Viral Daily",
+           "confirm": "Abre este enlace para empezar a recibir tu resumen diario:"},
+    "fr": {"subject": "Votre Viral Daily du {date}", "heading": "Les vidéos les plus virales du jour",
+           "views": "vues", "footer": "Vous recevez ce message car vous êtes abonné à Viral Daily.",
+           "unsubscribe": "Se désabonner", "confirm_subject": "Confirmez votre abonnement à Viral Daily",
+           "confirm": "Ouvrez ce lien pour commencer à recevoir votre résumé quotidien :"},
+    "de": {"subject": "Dein Viral Daily vom {date}", "heading": "Die viralsten Videos des Tages",
+           "views": "Aufrufe", "footer": "Du erhältst diese Nachricht, weil du Viral Daily abonniert hast.",
+           "unsubscribe": "Abbestellen", "confirm_subject": "Bestätige dein Viral Daily Abo",
+           "confirm": "Öffne diesen Link, um deine tägliche Übersicht zu erhalten:"},
+    "pt": {"subject": "Seu Viral Daily de {date}", "heading": "Os vídeos mais virais de hoje",
+           "views": "visualizações", "footer": "Você recebe esta mensagem porque assinou o Viral Daily.",
+           "unsubscribe": "Cancelar inscrição", "confirm_subject": "Confirme sua inscrição no Viral Daily",
+           "confirm": "Abra este link para começar a receber seu resumo diário:"},
+}
+
+# Filled in per recipient, since one rendered digest is shared by a whole segment
+UNSUBSCRIBE_PLACEHOLDER = "{{unsubscribe_url}}"
+
+
+class DeliveryError(Exception):
+    """A failed send; retryable failures may succeed if the same send is attempted later"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Digest:
+    """One rendered digest, shared by every subscriber in its segment"""
+
+    def __init__(self, segment: Segment, subject: str, text: str, html: str, videos: List[ViralVideo]):
+        self.segment = segment
+        self.subject = subject
+        self.text = text
+        self.html = html
+        self.videos = videos
+
+    def document(self, digest_id: str, date: str) -> Dict:
+        platforms, locale = self.segment
+        return {"_id": digest_id, "date": date, "platforms": list(platforms), "locale": locale,
+                "subject": self.subject, "text": self.text, "html": self.html}
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "Digest":
+        segment = (tuple(document["platforms"]), document["locale"])
+        return cls(segment, document["subject"], document["text"], document["html"], [])
+
+    def for_recipient(self, unsubscribe_url: str) -> "Digest":
+        """This digest with the recipient's own unsubscribe link in the footer"""
+        def fill(body: str, url: str) -> str:
+            # The footer comes last, so a placeholder quoted in a video title is left alone
+            head, placeholder, tail = body.rpartition(UNSUBSCRIBE_PLACEHOLDER)
+            return f"{head}{url}{tail}" if placeholder else body
+
+        return Digest(self.segment, self.subject, fill(self.text, unsubscribe_url),
+                      fill(self.html, escape(unsubscribe_url)), self.videos)
+
+
+class Transport(Protocol):
+    async def send(self, address: str, digest: Digest) -> None:
+        ...
+
+
+class FakeTransport:
+    """In-memory transport for local runs and tests, with optional latency and failures"""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: List[Tuple[str, Digest]] = []
+
+    async def send(self, address: str, digest: Digest) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise DeliveryError(f"Simulated failure sending to {address}")
+        self.sent.append((address, digest))
+
+
+def segment_of(subscription: Dict) -> Segment:
+    """The (platform mix, locale) a subscription's digest is rendered for"""
+    platforms = {getattr(platform, "value", platform) for platform in subscription.get("platforms") or ()}
+    platforms = tuple(sorted(platforms & {platform.value for platform in Platform}))
+    locale = (subscription.get("locale") or DEFAULT_LOCALE).replace("_", "-").split("-")[0].lower()
+    return platforms, locale if locale in LOCALES else DEFAULT_LOCALE
+
+
+def digest_id(segment: Segment, date: str) -> str:
+    platforms, locale = segment
+    return f"{date}:{','.join(platforms) or 'all'}:{locale}"
+
+
+def _format_count(count: Optional[int]) -> str:
+    if not count:
+        return "0"
+    for size, suffix in ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K")):
+        if count >= size:
+            return f"{count / size:.1f}".rstrip("0").rstrip(".") + suffix
+    return str(count)
+
+
+class DigestRenderer:
+    """Renders the top videos of a snapshot for a segment as plain text and HTML"""
+
+    def __init__(self, top: int = None):
+        self.top = top or int(os.environ.get('DIGEST_TOP_VIDEOS', 10))
+
+    def videos(self, snapshot: FeedSnapshot, platforms: Tuple[str, ...]) -> List[ViralVideo]:
+        if not platforms:
+            return list(snapshot.videos()[:self.top])
+        videos = [video for platform in platforms for video in snapshot.videos(Platform(platform))[:self.top]]
+        return sorted(videos, key=lambda video: (video.viral_score, video.id), reverse=True)[:self.top]
+
+    def render(self, snapshot: FeedSnapshot, segment: Segment, date: datetime) -> Digest:
+        platforms, locale = segment
+        strings = LOCALES[locale]
+        videos = self.videos(snapshot, platforms)
+        subject = strings["subject"].format(date=date.strftime("%Y-%m-%d"))
+
+        lines = [strings["heading"], ""]
+        items = []
+        for rank, video in enumerate(videos, start=1):
+            stats = f"{video.platform.value}, {_format_count(video.views)} {strings['views']}"
+            lines.append(f"{rank}. {video.title} ({stats})\n{video.url}")
+            items.append(f'<li><a href="{escape(video.url)}">{escape(video.title)}</a> ({escape(stats)})</li>')
+        lines += ["", strings["footer"], f"{strings['unsubscribe']}: {UNSUBSCRIBE_PLACEHOLDER}"]
+
+        html = (f"<h2>{escape(strings['heading'])}</h2><ol>{''.join(items)}</ol>"
+                f"<p><small>{escape(strings['footer'])} "
+                f'<a href="{UNSUBSCRIBE_PLACEHOLDER}">{escape(strings["unsubscribe"])}</a></small></p>')
+        return Digest(segment, subject, "\n".join(lines), html, videos)
+
+
+class RateLimiter:
+    """Token bucket shared by a channel's workers"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DeliveryChannel:
+    """A delivery method with its transport, worker pool size and send rate"""
+
+    def __init__(self, method: DeliveryMethod, transport: Transport, concurrency: int = None, rate: float = None):
+        default_concurrency, default_rate = CHANNEL_DEFAULTS[method]
+        name = method.value.upper()
+        self.method = method
+        self.transport = transport
+        self.concurrency = concurrency or int(os.environ.get(f'DIGEST_{name}_CONCURRENCY', default_concurrency))
+        self.limiter = RateLimiter(rate or float(os.environ.get(f'DIGEST_{name}_RATE', default_rate)))
+
+    def address(self, subscription: Dict) -> Optional[str]:
+        return subscription.get(ADDRESS_FIELDS[self.method])
+
+    async def send(self, address: str, digest: Digest):
+        await self.limiter.acquire()
+        await self.transport.send(address, digest)
+
+
+class _DeliveryMarker:
+    """Buffers last_delivery updates and writes them in unordered bulk batches"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self._operations: List[UpdateOne] = []
+
+    async def add(self, subscription_id: str, delivered_at: datetime):
+        self._operations.append(UpdateOne(
+            {"id": subscription_id, "$or": [{"last_delivery": None}, {"last_delivery": {"$lt": delivered_at}}]},
+            {"$set": {"last_delivery": delivered_at}}
+        ))
+        if len(self._operations) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        operations, self._operations = self._operations, []
+        if not operations:
+            return
+        try:
+            await self.db.subscriptions.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Error recording digest deliveries: {e}")
+
+
+class DigestDeliveryEngine:
+    """Queues one job per due subscription and channel, and runs per-channel worker pools that send them"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, snapshots: FeedSnapshotStore,
+                 channels: Dict[DeliveryMethod, DeliveryChannel], renderer: DigestRenderer = None,
+                 queue: DeliveryJobQueue = None):
+        self.db = db
+        self.snapshots = snapshots
+        self.channels = channels
+        self.renderer = renderer or DigestRenderer()
+        self.queue = queue or DeliveryJobQueue(db)
+        self.batch_size = int(os.environ.get('DIGEST_BATCH_SIZE', 1000))
+        self.write_batch_size = int(os.environ.get('DIGEST_WRITE_BATCH_SIZE', 500))
+        self.delivery_hour = int(os.environ.get('DIGEST_DELIVERY_HOUR', 8))
+        self.poll_interval = float(os.environ.get('DELIVERY_POLL_INTERVAL', 5))
+        self.public_url = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+        self.marker = _DeliveryMarker(db, self.write_batch_size)
+        self._digests: Dict[str, Digest] = {}
+        self._lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        """Create the indexes the due-subscription scan and the job queue walk"""
+        await self.db.subscriptions.create_index([("active", 1), ("confirmed", 1), ("last_delivery", 1)])
+        await self.db.subscriptions.create_index("id")
+        await self.db.subscriptions.create_index("confirm_token")
+        await self.db.subscriptions.create_index("unsubscribe_token")
+        await self.queue.ensure_indexes()
+
+    async def _save_digest(self, digest: Digest, key: str, date: str):
+        # The first process to render a segment today wins, so every worker sends the same digest
+        document = digest.document(key, date)
+        await self.db.delivery_digests.update_one(
+            {"_id": key}, {"$setOnInsert": {name: value for name, value in document.items() if name != "_id"}},
+            upsert=True
+        )
+
+    async def backfill_tokens(self) -> int:
+        """Give subscriptions created before confirmation existed their tokens; returns how many were updated"""
+        # Those subscribers signed up when no confirmation was asked for and were already receiving digests,
+        # so they are grandfathered in as confirmed rather than made to confirm again
+        updated = 0
+        operations: List[UpdateOne] = []
+        cursor = self.db.subscriptions.find(
+            {"unsubscribe_token": {"$exists": False}}, {"_id": 0, "id": 1, "confirmed": 1}
+        ).batch_size(self.batch_size)
+        async for subscription in cursor:
+            fields = {"unsubscribe_token": secrets.token_urlsafe(24), "confirm_token": secrets.token_urlsafe(24)}
+            if "confirmed" not in subscription:
+                fields["confirmed"] = True
+            # Another process may be running the same backfill; the first token written wins
+            operations.append(UpdateOne(
+                {"id": subscription["id"], "unsubscribe_token": {"$exists": False}}, {"$set": fields}
+            ))
+            if len(operations) >= self.write_batch_size:
+                updated += (await self.db.subscriptions.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            updated += (await self.db.subscriptions.bulk_write(operations, ordered=False)).modified_count
+        if updated:
+            logger.info(f"Backfilled tokens for {updated} legacy subscriptions")
+        return updated
+
+    def confirm_url(self, token: str) -> str:
+        return f"{self.public_url}/api/subscribe/confirm?token={token}"
+
+    def unsubscribe_url(self, token: str) -> str:
+        return f"{self.public_url}/api/subscribe/unsubscribe?token={token}"
+
+    def _sends(self, subscription: Dict) -> List[Tuple[DeliveryChannel, str]]:
+        sends = []
+        for method in subscription.get("delivery_methods") or ():
+            channel = self.channels.get(DeliveryMethod(method))
+            address = channel.address(subscription) if channel else None
+            if address:
+                sends.append((channel, address))
+        return sends
+
+    async def send_confirmation(self, subscription: Dict) -> int:
+        """Send the confirmation link to every configured address of a new subscription; returns how many sent"""
+        segment = segment_of(subscription)
+        strings = LOCALES[segment[1]]
+        url = self.confirm_url(subscription["confirm_token"])
+        html = f'<p>{escape(strings["confirm"])}</p><p><a href="{escape(url)}">{escape(url)}</a></p>'
+        message = Digest(segment, strings["confirm_subject"], f"{strings['confirm']}\n{url}", html, [])
+
+        sent = 0
+        for channel, address in self._sends(subscription):
+            try:
+                await channel.send(address, message)
+                sent += 1
+            except Exception as e:
+                logger.error(f"Error sending {channel.method.value} confirmation for {subscription['id']}: {e}")
+        return sent
+
+    async def deliver(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Queue today's digest for every confirmed, active subscription not yet delivered today; safe to repeat"""
+        async with self._lock:
+            now = now or datetime.utcnow()
+            date = now.strftime("%Y-%m-%d")
+            day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            snapshot = await self.snapshots.current()
+            stats: Counter = Counter()
+            rendered: Dict[Segment, str] = {}
+            jobs: List[Dict] = []
+
+            cursor = self.db.subscriptions.find(
+                {"active": True, "confirmed": True,
+                 "$or": [{"last_delivery": None}, {"last_delivery": {"$lt": day_start}}]},
+                {"_id": 0, "id": 1, "delivery_methods": 1, "platforms": 1, "locale": 1, "unsubscribe_token": 1, **{
+                    field: 1 for field in ADDRESS_FIELDS.values()
+                }}
+            ).batch_size(self.batch_size)
+
+            async for subscription in cursor:
+                stats["subscriptions"] += 1
+                sends = self._sends(subscription)
+                # Every digest carries an unsubscribe link, so a subscription without a token cannot be sent one
+                if not sends or not subscription.get("unsubscribe_token"):
+                    stats["skipped"] += 1
+                    continue
+
+                segment = segment_of(subscription)
+                key = rendered.get(segment)
+                if key is None:
+                    key = rendered[segment] = digest_id(segment, date)
+                    await self._save_digest(self.renderer.render(snapshot, segment, now), key, date)
+
+                unsubscribe_url = self.unsubscribe_url(subscription["unsubscribe_token"])
+                for channel, address in sends:
+                    jobs.append({
+                        "_id": job_id(subscription["id"], channel.method.value, date),
+                        "subscription_id": subscription["id"],
+                        "method": channel.method.value,
+                        "address": address,
+                        "digest_id": key,
+                        "unsubscribe_url": unsubscribe_url,
+                        "date": date
+                    })
+                if len(jobs) >= self.write_batch_size:
+                    stats["queued"] += await self.queue.enqueue(jobs)
+                    stats["jobs"] += len(jobs)
+                    jobs = []
+
+            stats["queued"] += await self.queue.enqueue(jobs)
+            stats["jobs"] += len(jobs)
+            stats["segments"] = len(rendered)
+            logger.info(f"Queued daily digests: {dict(stats)}")
+            return dict(stats)
+
+    async def _digest(self, key: str) -> Digest:
+        digest = self._digests.get(key)
+        if digest is None:
+            document = await self.db.delivery_digests.find_one({"_id": key})
+            if document is None:
+                raise DeliveryError(f"Digest {key} not found", retryable=False)
+            if len(self._digests) >= 256:
+                self._digests.clear()
+            digest = self._digests[key] = Digest.from_document(document)
+        return digest
+
+    async def _worker(self, channel: DeliveryChannel, name: str):
+        method = channel.method.value
+        while True:
+            try:
+                job = await self.queue.claim(method, name)
+            except Exception as e:
+                logger.error(f"Error claiming {method} delivery job: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval * random.uniform(0.5, 1.0))
+                continue
+
+            try:
+                digest = await self._digest(job["digest_id"])
+                await channel.send(job["address"], digest.for_recipient(job.get("unsubscribe_url", "")))
+            except Exception as e:
+                retryable = e.retryable if isinstance(e, DeliveryError) else True
+                try:
+                    await self.queue.fail(job, e, retryable)
+                except Exception as error:
+                    # The lease will expire and another worker will retry the job
+                    logger.error(f"Error recording failed delivery job {job['_id']}: {error}")
+                continue
+
+            try:
+                if await self.queue.complete(job):
+                    await self.marker.add(job["subscription_id"], datetime.utcnow())
+            except Exception as e:
+                logger.error(f"Error completing delivery job {job['_id']}: {e}")
+
+    async def run_workers(self):
+        """Send queued jobs with a bounded pool of lease-claiming workers per channel"""
+        host = f"{socket.gethostname()}:{os.getpid()}"
+        workers = [
+            asyncio.create_task(self._worker(channel, f"{host}:{method.value}:{index}"))
+            for method, channel in self.channels.items()
+            for index in range(channel.concurrency)
+        ]
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                await self.marker.flush()
+                try:
+                    await self.queue.reap()
+                except Exception as e:
+                    logger.error(f"Error reaping expired delivery jobs: {e}")
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.marker.flush()
+
+    def seconds_until_next_run(self, now: Optional[datetime] = None) -> float:
+        now = now or datetime.utcnow()
+        next_run = now.replace(hour=self.delivery_hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    async def run_scheduler(self):
+        """Queue digests every day at delivery_hour UTC"""
+        while True:
+            await asyncio.sleep(self.seconds_until_next_run())
+            try:
+                await self.deliver()
+            except Exception as e:
+                logger.error(f"Error queueing daily digests: {e}")
@@ -0,0 +1,62 @@
+# Analytics Export CLI
+#
+# Usage: python export_cli.py videos --format parquet --start 2024-01-01 --output videos.parquet
+
+from pathlib import Path
+from typing import Optional
+from datetime import datetime
+import asyncio
+import os
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from analytics_export import AnalyticsExporter, DEFAULT_BATCH_SIZE
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+app = typer.Typer(help="Export Viral Daily analytics datasets as Parquet or Arrow IPC")
+
+
+async def _export(dataset: str, export_format: str, output: Path, columns: Optional[list],
+                  start: Optional[datetime], end: Optional[datetime], batch_size: int) -> int:
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        exporter = AnalyticsExporter(client[os.environ['DB_NAME']])
+        written = 0
+        with open(output, "wb") as handle:
+            async for chunk in exporter.stream(dataset, export_format, columns, start, end, batch_size):
+                handle.write(chunk)
+                written += len(chunk)
+        return written
+    finally:
+        client.close()
+
+
+@app.command()
+def export(
+    dataset: str = typer.Argument(..., help="videos, usage or ad_stats"),
+    export_format: str = typer.Option("parquet", "--format", help="parquet or arrow"),
+    output: Optional[Path] = typer.Option(None, help="Output file (defaults to <dataset>.<format>)"),
+    columns: Optional[str] = typer.Option(None, help="Comma-separated columns to export"),
+    start: Optional[datetime] = typer.Option(None, help="Only rows at or after this time (UTC)"),
+    end: Optional[datetime] = typer.Option(None, help="Only rows before this time (UTC)"),
+    batch_size: int = typer.Option(DEFAULT_BATCH_SIZE, help="Rows per cursor batch and row group"),
+):
+    """Export a dataset to a local file"""
+    column_list = [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+    output = output or Path(f"{dataset}.{'parquet' if export_format == 'parquet' else 'arrows'}")
+
+    try:
+        written = asyncio.run(_export(dataset, export_format, output, column_list, start, end, batch_size))
+    except ValueError as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
+
+    typer.echo(f"Wrote {written} bytes to {output}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,58 @@
+# Fast JSON Encoding
+
+from typing import Optional, Sequence, Tuple
+from collections import OrderedDict
+from datetime import datetime
+
+import orjson
+
+from models import Platform, SubscriptionTier, ViralVideo
+
+
+class VideoFragmentCache:
+    """LRU of pre-encoded ViralVideo JSON, keyed by video id and fetch time"""
+
+    def __init__(self, max_size: int = 20000):
+        self.max_size = max_size
+        self._fragments: "OrderedDict[Tuple, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def get(self, video: ViralVideo) -> bytes:
+        """Encoded video; videos must not be modified after they are first served"""
+        key: Tuple = (video.id, video.fetched_at)
+        if video.is_sponsored:
+            # Ad cards keep their id and creation time across edits, so their display fields are part of the key
+            key += (video.title, video.url, video.thumbnail, video.description, video.author, video.sponsor_name)
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+            return fragment
+
+        # model_dump keeps datetimes and enums, which orjson encodes natively
+        fragment = orjson.dumps(video.model_dump())
+        self._fragments[key] = fragment
+        if len(self._fragments) > self.max_size:
+            self._fragments.popitem(last=False)
+        return fragment
+
+
+def encode_video_response(videos: Sequence[ViralVideo], fragments: VideoFragmentCache,
+                          platform: Optional[Platform], date: datetime, has_ads: bool,
+                          user_tier: Optional[SubscriptionTier], next_cursor: Optional[str] = None) -> bytes:
+    """Encode a VideoResponse body by splicing cached video fragments into the envelope"""
+    envelope = orjson.dumps({
+        "total": len(videos),
+        "platform": platform,
+        "date": date,
+        "has_ads": has_ads,
+        "user_tier": user_tier,
+        "next_cursor": next_cursor
+    })
+    return b"".join((
+        b'{"videos":[',
+        b",".join([fragments.get(video) for video in videos]),
+        b"],",
+        envelope[1:]
+    ))
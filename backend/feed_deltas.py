@@ -0,0 +1,105 @@
+# Feed Deltas
+
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+import os
+
+import orjson
+
+from models import Platform, ViralVideo
+from feed_snapshots import FeedSnapshot
+from fast_json import VideoFragmentCache
+
+# (url, rank before, rank after, video after); a missing rank means the video was not in the feed
+Change = Tuple[str, Optional[int], Optional[int], Optional[ViralVideo]]
+
+
+class FeedDelta:
+    """Videos that entered, left or moved in one ranked feed between two snapshot versions"""
+
+    def __init__(self, since: int, previous: Tuple[ViralVideo, ...], current: Tuple[ViralVideo, ...]):
+        self.since = since
+        # Ids change on every fetch, so videos are matched by url
+        before = {video.url: (rank, video.viral_score) for rank, video in enumerate(previous)}
+        self.changes: List[Change] = []
+        for rank, video in enumerate(current):
+            old = before.pop(video.url, None)
+            if old is None or old != (rank, video.viral_score):
+                self.changes.append((video.url, old[0] if old else None, rank, video))
+        for url, (rank, _) in before.items():
+            self.changes.append((url, rank, None, None))
+        # Every window at least this deep is the same diff
+        self.depth = max(len(previous), len(current))
+
+    def window(self, limit: int) -> Tuple[List[Tuple[int, ViralVideo]], List[str], List[list]]:
+        """Added (rank, video) pairs, removed urls and [url, rank, viral_score] moves within the top `limit`"""
+        added, removed, reranked = [], [], []
+        for url, old_rank, new_rank, video in self.changes:
+            was_shown = old_rank is not None and old_rank < limit
+            is_shown = new_rank is not None and new_rank < limit
+            if is_shown and not was_shown:
+                added.append((new_rank, video))
+            elif was_shown and not is_shown:
+                removed.append(url)
+            elif is_shown:
+                reranked.append([url, new_rank, video.viral_score])
+        return added, removed, reranked
+
+
+class FeedDeltaLog:
+    """Diffs from each of the last few snapshot versions to the current one, computed once per transition"""
+
+    def __init__(self, fragments: VideoFragmentCache, max_versions: int = None):
+        self.fragments = fragments
+        self.max_versions = max_versions or int(os.environ.get('FEED_DELTA_VERSIONS', 20))
+        self._history: "deque[FeedSnapshot]" = deque(maxlen=self.max_versions)
+        self._current: Optional[FeedSnapshot] = None
+        self._deltas: Dict[Tuple[int, Optional[str]], FeedDelta] = {}
+        self._bodies: Dict[Tuple[int, Optional[str], int], bytes] = {}
+
+    @property
+    def version(self) -> int:
+        return self._current.version if self._current else 0
+
+    def on_snapshot(self, previous: Optional[FeedSnapshot], snapshot: FeedSnapshot):
+        """Snapshot listener diffing every retained version against the new snapshot"""
+        if previous is not None:
+            self._history.append(previous)
+
+        deltas: Dict[Tuple[int, Optional[str]], FeedDelta] = {}
+        for old in (*self._history, snapshot):
+            for key, videos in snapshot.feeds.items():
+                deltas[(old.version, key)] = FeedDelta(old.version, old.feeds.get(key, ()), videos)
+
+        self._current = snapshot
+        self._deltas = deltas
+        self._bodies = {}
+
+    def body(self, since: int, platform: Optional[Platform], limit: int) -> Optional[bytes]:
+        """Encoded diff from `since` to the current version, or None if the client needs a full snapshot"""
+        key = platform.value if platform else None
+        delta = self._deltas.get((since, key))
+        if delta is None:
+            return None
+
+        limit = min(limit, delta.depth)
+        cache_key = (since, key, limit)
+        body = self._bodies.get(cache_key)
+        if body is None:
+            added, removed, reranked = delta.window(limit)
+            envelope = orjson.dumps({
+                "since": since,
+                "version": self._current.version,
+                "platform": platform,
+                "date": self._current.created_at,
+                "removed": removed,
+                "reranked": reranked
+            })
+            body = b"".join((
+                b'{"added":[',
+                b",".join([b'{"rank":%d,"video":%s}' % (rank, self.fragments.get(video)) for rank, video in added]),
+                b"],",
+                envelope[1:]
+            ))
+            self._bodies[cache_key] = body
+        return body
@@ -0,0 +1,164 @@
+# Real-Time Feed Events
+
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, Set
+from collections import deque
+import asyncio
+import itertools
+import logging
+import os
+
+import orjson
+
+from feed_snapshots import FeedSnapshot
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("new_video", "score_threshold", "platform_refresh")
+
+
+class FeedEvent:
+    """An ingestion event, encoded as an SSE frame once and shared by every subscriber"""
+
+    def __init__(self, event_id: int, event_type: str, data: Dict, platform: Optional[str] = None,
+                 score: Optional[float] = None):
+        self.id = event_id
+        self.type = event_type
+        self.platform = platform
+        self.score = score
+        self.frame = b"".join((
+            f"id: {event_id}\nevent: {event_type}\ndata: ".encode("utf-8"),
+            orjson.dumps(data),
+            b"\n\n"
+        ))
+
+
+class SubscriberFilter:
+    """Which events a subscriber wants: platforms, a viral score floor and event types"""
+
+    def __init__(self, platforms: Optional[Set[str]] = None, min_score: float = 0.0,
+                 event_types: Optional[Set[str]] = None):
+        self.platforms: Optional[FrozenSet[str]] = frozenset(platforms) if platforms else None
+        self.min_score = min_score
+        self.event_types: FrozenSet[str] = frozenset(event_types or EVENT_TYPES)
+
+    def accepts(self, event: FeedEvent) -> bool:
+        if event.type not in self.event_types:
+            return False
+        if self.platforms is not None and event.platform is not None and event.platform not in self.platforms:
+            return False
+        return event.score is None or event.score >= self.min_score
+
+
+class Subscriber:
+    """One connection's bounded queue of pending frames"""
+
+    def __init__(self, subscriber_id: int, event_filter: SubscriberFilter, queue_size: int):
+        self.id = subscriber_id
+        self.filter = event_filter
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(maxsize=queue_size)
+        self.evicted = False
+
+    def evict(self):
+        """Drop pending frames and wake the reader so the connection closes"""
+        self.evicted = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class FeedBroadcaster:
+    """Fans feed events out to SSE subscribers, evicting any whose queue fills up"""
+
+    def __init__(self, queue_size: int = None, max_subscribers: int = None, heartbeat_interval: float = 15.0,
+                 replay_size: int = 512):
+        self.queue_size = queue_size or int(os.environ.get('FEED_EVENTS_QUEUE_SIZE', 1024))
+        self.max_subscribers = max_subscribers or int(os.environ.get('FEED_EVENTS_MAX_SUBSCRIBERS', 10000))
+        self.viral_threshold = float(os.environ.get('FEED_VIRAL_THRESHOLD', 80))
+        self.heartbeat_interval = heartbeat_interval
+        self.evictions = 0
+        self._ids = itertools.count(1)
+        self._event_ids = itertools.count(1)
+        self._subscribers: Dict[int, Subscriber] = {}
+        self._recent: "deque[FeedEvent]" = deque(maxlen=replay_size)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, event_filter: SubscriberFilter, last_event_id: Optional[int] = None) -> Subscriber:
+        """Register a subscriber, replaying buffered events after last_event_id; raises if full"""
+        if len(self._subscribers) >= self.max_subscribers:
+            raise OverflowError("Too many feed event subscribers")
+
+        subscriber = Subscriber(next(self._ids), event_filter, self.queue_size)
+        if last_event_id is not None:
+            for event in self._recent:
+                if event.id > last_event_id and event_filter.accepts(event) and not subscriber.queue.full():
+                    subscriber.queue.put_nowait(event.frame)
+        self._subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.pop(subscriber.id, None)
+
+    def publish(self, event_type: str, data: Dict, platform: Optional[str] = None,
+                score: Optional[float] = None) -> FeedEvent:
+        """Queue an event for every matching subscriber without waiting on any of them"""
+        event = FeedEvent(next(self._event_ids), event_type, data, platform, score)
+        self._recent.append(event)
+
+        slow: List[Subscriber] = []
+        for subscriber in self._subscribers.values():
+            if not subscriber.filter.accepts(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event.frame)
+            except asyncio.QueueFull:
+                slow.append(subscriber)
+
+        for subscriber in slow:
+            # A consumer this far behind would only fall further back; let it reconnect and replay
+            self.unsubscribe(subscriber)
+            subscriber.evict()
+            self.evictions += 1
+        if slow:
+            logger.warning(f"Evicted {len(slow)} slow feed event subscribers")
+        return event
+
+    def on_snapshot(self, previous: Optional[FeedSnapshot], snapshot: FeedSnapshot):
+        """Snapshot listener turning a feed transition into new video, threshold and refresh events"""
+        if previous is None:
+            return
+
+        previous_scores = {video.url: video.viral_score for video in previous.videos()}
+        for video in snapshot.videos():
+            before = previous_scores.get(video.url)
+            if before is None:
+                self.publish("new_video", {"video": video.model_dump(mode="json")},
+                             video.platform.value, video.viral_score)
+            if video.viral_score >= self.viral_threshold and (before is None or before < self.viral_threshold):
+                self.publish("score_threshold", {"threshold": self.viral_threshold, "video": video.model_dump(mode="json")},
+                             video.platform.value, video.viral_score)
+
+        for key, videos in snapshot.feeds.items():
+            before = previous.feeds.get(key, ())
+            if key is not None and [(v.url, v.viral_score) for v in videos] != [(v.url, v.viral_score) for v in before]:
+                self.publish("platform_refresh", {"platform": key, "version": snapshot.version, "count": len(videos)},
+                             key)
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        """SSE frames for a subscriber, with heartbeats, until it is evicted or disconnects"""
+        try:
+            yield f"retry: 5000\n: subscribed {subscriber.id}\n\n".encode("utf-8")
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if frame is None:
+                    yield b"event: evicted\ndata: {}\n\n"
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
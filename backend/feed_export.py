@@ -0,0 +1,91 @@
+# Streaming NDJSON Feed Export
+
+from typing import AsyncIterator, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+import logging
+
+import orjson
+
+from models import Platform, ViralVideo
+from feed_snapshots import FeedSnapshotStore
+
+logger = logging.getLogger(__name__)
+
+FEED_SOURCES = ("catalog", "snapshot")
+
+# Rows are flushed to the client in chunks of about this many bytes
+DEFAULT_CHUNK_BYTES = 64 * 1024
+DEFAULT_BATCH_SIZE = 500
+
+VIDEO_FIELDS = {name: 1 for name in ViralVideo.model_fields}
+
+
+class FeedExporter:
+    """Streams ranked videos as NDJSON with memory bounded by one cursor batch and one chunk"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, snapshots: FeedSnapshotStore):
+        self.db = db
+        self.snapshots = snapshots
+
+    async def ensure_indexes(self):
+        """Create the indexes ranked catalog reads walk"""
+        await self.db.viral_videos.create_index([("viral_score", -1), ("id", -1)])
+        await self.db.viral_videos.create_index([("platform", 1), ("viral_score", -1), ("id", -1)])
+
+    def _query(self, platform: Optional[Platform], min_score: float, since: Optional[datetime]) -> Dict:
+        query: Dict = {}
+        if platform:
+            query["platform"] = platform.value
+        if min_score > 0:
+            query["viral_score"] = {"$gte": min_score}
+        if since:
+            query["fetched_at"] = {"$gte": since}
+        return query
+
+    async def _catalog_rows(self, platform: Optional[Platform], min_score: float, since: Optional[datetime],
+                            batch_size: int) -> AsyncIterator[bytes]:
+        cursor = self.db.viral_videos.find(
+            self._query(platform, min_score, since),
+            {"_id": 0, **VIDEO_FIELDS}
+        ).sort([("viral_score", -1), ("id", -1)]).batch_size(batch_size)
+
+        # Stored documents were written from ViralVideo, so they are encoded without revalidation
+        async for document in cursor:
+            yield orjson.dumps(document, option=orjson.OPT_APPEND_NEWLINE)
+
+    async def _snapshot_rows(self, platform: Optional[Platform], min_score: float,
+                             since: Optional[datetime]) -> AsyncIterator[bytes]:
+        snapshot = await self.snapshots.current()
+        for video in snapshot.videos(platform):
+            if video.viral_score < min_score:
+                # Videos are ranked by score, so nothing further can pass the floor
+                break
+            if since and video.fetched_at < since:
+                continue
+            yield orjson.dumps(video.model_dump(), option=orjson.OPT_APPEND_NEWLINE)
+
+    async def stream(self, source: str = "catalog", platform: Optional[Platform] = None, min_score: float = 0.0,
+                     since: Optional[datetime] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                     chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        """Yield NDJSON chunks of ranked videos from the stored catalog or the current snapshot"""
+        if source not in FEED_SOURCES:
+            raise ValueError(f"Unknown source '{source}'. Choose one of: {', '.join(FEED_SOURCES)}")
+
+        if source == "catalog":
+            rows = self._catalog_rows(platform, min_score, since, batch_size)
+        else:
+            rows = self._snapshot_rows(platform, min_score, since)
+
+        chunk = bytearray()
+        count = 0
+        async for row in rows:
+            chunk += row
+            count += 1
+            if len(chunk) >= chunk_bytes:
+                yield bytes(chunk)
+                chunk.clear()
+        if chunk:
+            yield bytes(chunk)
+
+        logger.info(f"Streamed {count} {source} videos as NDJSON")
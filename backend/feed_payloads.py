@@ -0,0 +1,197 @@
+# Pre-Serialized Feed Payloads
+
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+import gzip
+import hashlib
+import os
+import time
+
+import brotli
+
+from models import Platform, SubscriptionTier, ViralVideo
+from subscription_plans import get_plan
+from feed_snapshots import FeedSnapshot, FeedSnapshotStore
+from fast_json import VideoFragmentCache, encode_video_response
+from pagination import encode_cursor
+
+PayloadKey = Tuple[Optional[str], SubscriptionTier, int]
+
+
+def _short_hash(*parts: str) -> str:
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def feed_cursor(videos: Tuple[ViralVideo, ...], has_more: bool, served: int,
+                tier: SubscriptionTier) -> Optional[str]:
+    """Cursor after the last video of a page, unless the feed or the tier's allowance ran out"""
+    max_videos = get_plan(tier).max_videos_per_day
+    if not videos or not has_more or 0 < max_videos <= served:
+        return None
+    last = videos[-1]
+    # Only the sort key; the count served is recomputed from the snapshot so clients cannot reset it
+    return encode_cursor(last.viral_score, last.id)
+
+
+class FeedPayload:
+    """One rendered /api/videos body with its compressed variants"""
+
+    def __init__(self, snapshot: FeedSnapshot, platform: Optional[Platform], tier: SubscriptionTier,
+                 videos: Tuple[ViralVideo, ...], next_cursor: Optional[str], body: bytes):
+        self.version = snapshot.version
+        self.date = snapshot.created_at
+        self.platform = platform
+        self.tier = tier
+        self.videos = videos
+        self.next_cursor = next_cursor
+        self.has_ads = get_plan(tier).has_ads
+        self.encodings: Dict[str, bytes] = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=6),
+            "br": brotli.compress(body, quality=5),
+        }
+        # Names this exact body; the per-client ETag is derived from it
+        self.tag = f"{snapshot.version}-{hashlib.sha256(body).hexdigest()[:16]}"
+
+    @property
+    def body(self) -> bytes:
+        return self.encodings["identity"]
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Tuple[str, bytes]:
+        """Pick the smallest variant the client accepts"""
+        accepted = {token.split(";")[0].strip() for token in (accept_encoding or "").lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted:
+                return encoding, self.encodings[encoding]
+        return "identity", self.body
+
+
+class FeedPayloadCache:
+    """Renders each (platform, tier, limit) feed body once per snapshot version"""
+
+    def __init__(self, snapshots: FeedSnapshotStore, fragments: VideoFragmentCache, max_callers: int = 10000):
+        self.snapshots = snapshots
+        self.fragments = fragments
+        self.tier_ttl = float(os.environ.get('FEED_ETAG_TIER_TTL', 60))
+        self.max_callers = max_callers
+        self._version = -1
+        self._payloads: Dict[PayloadKey, FeedPayload] = {}
+        self._tags: Dict[str, FeedPayload] = {}
+        # API key -> (tier, expires at) as resolved by the last full request, so 304s need no user lookup
+        self._tiers: "OrderedDict[str, Tuple[SubscriptionTier, float]]" = OrderedDict()
+
+    async def get(self, platform: Optional[Platform], tier: SubscriptionTier, limit: int) -> FeedPayload:
+        snapshot = await self.snapshots.current()
+        if snapshot.version != self._version:
+            self._version = snapshot.version
+            self._payloads = {}
+            self._tags = {}
+
+        key = (platform.value if platform else None, tier, limit)
+        payload = self._payloads.get(key)
+        if payload is None:
+            videos, has_more = snapshot.page(platform, limit)
+            next_cursor = feed_cursor(videos, has_more, len(videos), tier)
+            body = encode_video_response(
+                videos,
+                self.fragments,
+                platform=platform,
+                date=snapshot.created_at,
+                has_ads=get_plan(tier).has_ads,
+                user_tier=tier,
+                next_cursor=next_cursor
+            )
+            payload = FeedPayload(snapshot, platform, tier, videos, next_cursor, body)
+            self._payloads[key] = payload
+            self._tags[payload.tag] = payload
+        return payload
+
+    @staticmethod
+    def client_tag(payload_tag: str, api_key: Optional[str], query: str, tier: SubscriptionTier) -> str:
+        """Bind a payload tag to the caller's credentials, tier and query without any lookup"""
+        return f"{payload_tag}.{_short_hash(api_key or '', query, tier.value)}"
+
+    def _caller_tier(self, api_key: Optional[str]) -> Optional[SubscriptionTier]:
+        if not api_key:
+            return SubscriptionTier.FREE
+        entry = self._tiers.get(api_key)
+        if entry is None or entry[1] <= time.monotonic():
+            # Unknown or stale: let a full request resolve the caller again, in case the tier changed
+            return None
+        return entry[0]
+
+    def etag(self, payload: FeedPayload, api_key: Optional[str], query: str, ads: Iterable[str] = ()) -> str:
+        """Strong ETag for a cached body, weak when ads were spliced into it for this request"""
+        if api_key:
+            self._tiers[api_key] = (payload.tier, time.monotonic() + self.tier_ttl)
+            self._tiers.move_to_end(api_key)
+            while len(self._tiers) > self.max_callers:
+                self._tiers.popitem(last=False)
+        tag = self.client_tag(payload.tag, api_key, query, payload.tier)
+        ad_ids = list(ads)
+        return f'W/"{tag}.{_short_hash(*ad_ids)}"' if ad_ids else f'"{tag}"'
+
+    def match(self, if_none_match: str, api_key: Optional[str], query: str) -> Optional[str]:
+        """The If-None-Match entity tag naming a body of the current snapshot for this caller, tier and query"""
+        tier = self._caller_tier(api_key)
+        if tier is None:
+            return None
+        client_hash = _short_hash(api_key or "", query, tier.value)
+        for token in if_none_match.split(","):
+            token = token.strip()
+            parts = token[2:].strip('"').split(".") if token.startswith("W/") else token.strip('"').split(".")
+            payload = self._tags.get(parts[0]) if len(parts) >= 2 else None
+            # _tags is only reset when a request renders a body, so check the version against the store
+            if payload and payload.version == self.snapshots.version and parts[1] == client_hash:
+                return token
+        return None
+
+
+def normalized_query(items: Iterable[Tuple[str, str]],
+                     names: Tuple[str, ...] = ("platform", "limit", "cursor", "since")) -> str:
+    """Query string of the parameters that shape the feed, in a fixed order"""
+    params = dict(items)
+    return "&".join(f"{name}={params[name]}" for name in names if name in params)
+
+
+def request_api_key(headers: Mapping[str, str]) -> Optional[str]:
+    """API key from an Authorization bearer token or X-API-Key header"""
+    authorization = headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        return authorization.split(" ")[1]
+    return headers.get("x-api-key")
+
+
+class FeedNotModifiedMiddleware:
+    """Answers conditional feed requests with 304 before auth, usage logging or any database work"""
+
+    def __init__(self, app, payloads: FeedPayloadCache, path: str = "/api/videos"):
+        self.app = app
+        self.payloads = payloads
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            query = normalized_query(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+            etag = self.payloads.match(if_none_match, request_api_key(headers), query)
+            if etag:
+                await send({
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [
+                        (b"etag", etag.encode("latin-1")),
+                        (b"cache-control", b"no-cache"),
+                        (b"vary", b"Accept-Encoding, Authorization, X-API-Key"),
+                    ]
+                })
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        await self.app(scope, receive, send)
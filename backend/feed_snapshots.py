@@ -0,0 +1,160 @@
+# Feed Snapshots
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from bisect import bisect_left
+
+from models import Platform, ViralVideo
+
+logger = logging.getLogger(__name__)
+
+PlatformFetcher = Callable[[int], Awaitable[List[ViralVideo]]]
+SnapshotListener = Callable[[Optional["FeedSnapshot"], "FeedSnapshot"], None]
+
+
+class FeedSnapshot:
+    """Ranked videos per platform as of one refresh; never modified once published"""
+
+    def __init__(self, version: int, created_at: datetime, feeds: Dict[Optional[str], Tuple[ViralVideo, ...]],
+                 digest: str):
+        self.version = version
+        self.created_at = created_at
+        self.feeds = feeds
+        self.digest = digest
+        self._keys: Dict[Optional[str], List[Tuple[float, str]]] = {}
+
+    def videos(self, platform: Optional[Platform] = None) -> Tuple[ViralVideo, ...]:
+        """Videos for a platform, or all platforms, by viral score"""
+        return self.feeds.get(platform.value if platform else None, ())
+
+    def position(self, platform: Optional[Platform], after: Tuple[float, str]) -> int:
+        """How many videos rank at or above the (viral_score, id) key"""
+        videos = self.videos(platform)
+        key = platform.value if platform else None
+        keys = self._keys.get(key)
+        if keys is None:
+            # Ascending sort keys, the reverse of the feed order, for O(log n) seeks
+            keys = self._keys[key] = [(video.viral_score, video.id) for video in reversed(videos)]
+        return len(videos) - bisect_left(keys, tuple(after))
+
+    def page(self, platform: Optional[Platform], limit: int,
+             after: Optional[Tuple[float, str]] = None) -> Tuple[Tuple[ViralVideo, ...], bool]:
+        """Up to `limit` videos ranked after the (viral_score, id) key; also returns whether more follow"""
+        videos = self.videos(platform)
+        start = self.position(platform, after) if after is not None else 0
+        return videos[start:start + limit], start + limit < len(videos)
+
+
+def _ranked(videos: List[ViralVideo]) -> Tuple[ViralVideo, ...]:
+    # Ties break on id so (viral_score, id) cursors have a total order
+    return tuple(sorted(videos, key=lambda video: (video.viral_score, video.id), reverse=True))
+
+
+def _digest(feeds: Dict[Optional[str], Tuple[ViralVideo, ...]]) -> str:
+    # Ids and fetch times change on every fetch; the ranked content is what matters
+    content = [
+        (key, [(video.url, video.viral_score, video.views, video.likes, video.shares) for video in videos])
+        for key, videos in sorted(feeds.items(), key=lambda item: item[0] or "")
+    ]
+    return hashlib.sha256(repr(content).encode("utf-8")).hexdigest()
+
+
+class FeedSnapshotStore:
+    """Refreshes platform feeds in the background and publishes them as versioned snapshots"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, fetchers: Dict[Platform, PlatformFetcher]):
+        self.db = db
+        self.fetchers = fetchers
+        self.depth = int(os.environ.get('FEED_SNAPSHOT_DEPTH', 100))
+        self.refresh_interval = int(os.environ.get('FEED_SNAPSHOT_INTERVAL', 300))
+        self._snapshot: Optional[FeedSnapshot] = None
+        self._listeners: List[SnapshotListener] = []
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version if self._snapshot else 0
+
+    def add_listener(self, listener: SnapshotListener):
+        """Call listener(previous, current) whenever a new snapshot version is published"""
+        self._listeners.append(listener)
+
+    async def current(self) -> FeedSnapshot:
+        """The latest snapshot, fetching the first one if needed"""
+        if self._snapshot is None:
+            # Wait for a refresh already in flight before starting another
+            async with self._refresh_lock:
+                pass
+            if self._snapshot is None:
+                await self.refresh()
+        return self._snapshot
+
+    async def refresh(self) -> bool:
+        """Fetch every platform; returns True if a new snapshot version was published"""
+        async with self._refresh_lock:
+            platforms = list(self.fetchers)
+            results = await asyncio.gather(
+                *(self.fetchers[platform](self.depth) for platform in platforms),
+                return_exceptions=True
+            )
+
+            feeds: Dict[Optional[str], Tuple[ViralVideo, ...]] = {}
+            previous = self._snapshot
+            for platform, result in zip(platforms, results):
+                if isinstance(result, list):
+                    feeds[platform.value] = _ranked(result)
+                else:
+                    # Keep serving the last good feed for a platform that failed to refresh
+                    logger.error(f"Error fetching {platform.value} videos: {result}")
+                    feeds[platform.value] = previous.videos(platform) if previous else ()
+            feeds[None] = _ranked([video for key in feeds for video in feeds[key]])
+
+            digest = _digest(feeds)
+            if previous is not None and digest == previous.digest:
+                return False
+
+            # Epoch milliseconds rather than a counter, so a version handed out before a restart or by
+            # another process is never reused for a different snapshot that deltas would be taken against
+            version = max(self.version + 1, time.time_ns() // 1_000_000)
+            snapshot = FeedSnapshot(version, datetime.utcnow(), feeds, digest)
+            self._snapshot = snapshot
+            logger.info(f"Published feed snapshot version {snapshot.version} with {len(feeds[None])} videos")
+
+        for listener in self._listeners:
+            try:
+                listener(previous, snapshot)
+            except Exception as e:
+                logger.error(f"Error in feed snapshot listener: {e}")
+
+        await self._store(snapshot)
+        return True
+
+    async def _store(self, snapshot: FeedSnapshot):
+        """Upsert the snapshot's videos for analytics"""
+        operations = [
+            UpdateOne({"url": video.url}, {"$set": video.dict()}, upsert=True)
+            for video in snapshot.videos()
+        ]
+        if not operations:
+            return
+        try:
+            await self.db.viral_videos.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Error storing feed snapshot videos: {e}")
+
+    async def run_refresher(self):
+        """Refresh the snapshot every refresh_interval seconds"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing feed snapshot: {e}")
@@ -0,0 +1,86 @@
+# HyperLogLog Distinct Counter
+
+from typing import Iterable
+import hashlib
+import math
+
+HASH_BITS = 64
+
+
+def _hash(value: str) -> int:
+    """64-bit hash of a string value"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Mergeable approximate distinct counter with 2**precision one-byte registers"""
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        elif len(registers) != self.size:
+            raise ValueError("Register array does not match precision")
+        else:
+            self.registers = bytearray(registers)
+
+    def add(self, value: str) -> bool:
+        """Add a value; returns True if the sketch changed"""
+        hashed = _hash(value)
+        index = hashed >> (HASH_BITS - self.precision)
+        remainder = hashed & ((1 << (HASH_BITS - self.precision)) - 1)
+        rank = (HASH_BITS - self.precision) - remainder.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, values: Iterable[str]):
+        """Add several values"""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int = 12) -> "HyperLogLog":
+        """Build a new sketch counting the union of several sketches"""
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def count(self) -> int:
+        """Estimate the number of distinct values added"""
+        if self.size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / self.size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.size]
+
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+
+        # Small range correction: linear counting over empty registers
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Serialize registers for storage"""
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, precision: int = 12) -> "HyperLogLog":
+        """Restore a sketch from stored registers"""
+        return cls(precision, data)
@@ -0,0 +1,138 @@
+# ASGI Micro-Cache
+
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import os
+import time
+
+CREDENTIAL_HEADERS = (b"authorization", b"x-api-key", b"cookie")
+CONDITIONAL_HEADERS = (b"if-none-match", b"if-modified-since")
+
+CacheKey = Tuple[str, str, str]
+
+
+class CachedResponse:
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, expires_at: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+def _encoding_bucket(accept_encoding: str) -> str:
+    """Responses only differ by the best encoding the client takes, not the exact header"""
+    accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+    for encoding in ("br", "gzip"):
+        if encoding in accepted:
+            return encoding
+    return "identity"
+
+
+class MicroCacheMiddleware:
+    """Holds whole responses to credential-less GETs for a few seconds and collapses concurrent misses"""
+
+    def __init__(self, app, paths: Tuple[str, ...], ttl: float = None, max_entries: int = 1024):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.ttl = ttl if ttl is not None else float(os.environ.get('MICRO_CACHE_TTL', 2))
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+
+    def _key(self, scope) -> Optional[CacheKey]:
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.paths:
+            return None
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name in CREDENTIAL_HEADERS or name in CONDITIONAL_HEADERS:
+                return None
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+
+        query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"))))
+        return scope["path"], query, _encoding_bucket(accept_encoding)
+
+    def _lookup(self, key: CacheKey, now: float) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key: CacheKey, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _send_cached(self, entry: CachedResponse, send, hit: bool):
+        headers = entry.headers + [(b"x-cache", b"HIT" if hit else b"MISS")]
+        if hit:
+            age = max(0, int(self.ttl - (entry.expires_at - time.monotonic())))
+            headers.append((b"age", str(age).encode("latin-1")))
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
+
+    async def _render(self, scope, receive, key: CacheKey) -> Optional[CachedResponse]:
+        """Run the app and buffer its response; returns it if it may be cached"""
+        messages: List[dict] = []
+
+        async def capture(message):
+            messages.append(message)
+
+        await self.app(scope, receive, capture)
+
+        start = next((message for message in messages if message["type"] == "http.response.start"), None)
+        body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+        if start is None:
+            return None
+
+        headers = list(start.get("headers", []))
+        entry = CachedResponse(start["status"], headers, body, time.monotonic() + self.ttl)
+        cacheable = entry.status == 200 and not any(
+            name == b"set-cookie" or (name == b"cache-control" and b"no-store" in value)
+            for name, value in headers
+        )
+        if cacheable:
+            self._store(key, entry)
+        return entry
+
+    async def __call__(self, scope, receive, send):
+        key = self._key(scope)
+        if key is None or self.ttl <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        entry = self._lookup(key, time.monotonic())
+        if entry is not None:
+            await self._send_cached(entry, send, True)
+            return
+
+        # Collapse concurrent misses onto the first request's render
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            entry = await asyncio.shield(inflight)
+            if entry is not None:
+                await self._send_cached(entry, send, True)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        entry = None
+        try:
+            entry = await self._render(scope, receive, key)
+        finally:
+            del self._inflight[key]
+            # Followers only share responses that were cacheable
+            future.set_result(entry if entry is not None and self._entries.get(key) is entry else None)
+
+        if entry is None:
+            raise RuntimeError("No response returned from the application")
+        await self._send_cached(entry, send, False)
@@ -4,6 +4,7 @@ from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
+import secrets
 import uuid
 
 # Enums
@@ -55,6 +56,7 @@ class VideoResponse(BaseModel):
     date: datetime
     has_ads: bool = False
     user_tier: Optional[SubscriptionTier] = None
+    next_cursor: Optional[str] = None
 
 # User Management
 class User(BaseModel):
@@ -70,6 +72,7 @@ class User(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     subscription_expires_at: Optional[datetime] = None
     is_active: bool = True
+    is_admin: bool = False
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -135,6 +138,11 @@ class APIUsage(BaseModel):
     response_time_ms: Optional[float] = None
     status_code: int
     error_message: Optional[str] = None
+    route: Optional[str] = None  # Matched route template, e.g. /api/videos
+    platform: Optional[Platform] = None
+    tier: Optional[SubscriptionTier] = None
+    limit: Optional[int] = None
+    result_count: Optional[int] = None
 
 # Analytics Models
 class PlatformAnalytics(BaseModel):
@@ -157,10 +165,12 @@ class UserAnalytics(BaseModel):
 class SystemAnalytics(BaseModel):
     total_users: int
     total_api_calls: int
-    revenue_this_month: float
+    revenue_this_month: Dict[str, float]  # Per currency, e.g. {"eur": 99.99, "usd": 9.99}
     active_subscribers: int
     platform_distribution: Dict[Platform, int]
     daily_active_users: int
+    weekly_active_users: int = 0
+    monthly_active_users: int = 0
 
 # Advertising Models
 class Advertisement(BaseModel):
@@ -172,6 +182,7 @@ class Advertisement(BaseModel):
     advertiser: str
     target_platforms: List[Platform]
     budget: float
+    daily_budget: Optional[float] = None  # Defaults to the whole budget when unset
     cost_per_click: float
     is_active: bool = True
     impressions: int = 0
@@ -192,6 +203,17 @@ class AdClick(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     revenue: float
 
+class AdImpressionEvent(BaseModel):
+    ad_id: str
+    platform: Optional[Platform] = None
+
+class AdClickEvent(BaseModel):
+    ad_id: str
+
+class AdEventBatch(BaseModel):
+    impressions: List[AdImpressionEvent] = Field(default_factory=list, max_length=500)
+    clicks: List[AdClickEvent] = Field(default_factory=list, max_length=100)
+
 # Legacy Models (for backward compatibility)
 class OldSubscription(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -199,7 +221,12 @@ class OldSubscription(BaseModel):
     telegram_id: Optional[str] = None
     whatsapp_number: Optional[str] = None
     delivery_methods: List[DeliveryMethod]
+    platforms: List[Platform] = []  # Empty means every platform
+    locale: str = "en"
     active: bool = True
+    confirmed: bool = False  # Digests are only sent once the subscriber follows the confirmation link
+    confirm_token: str = Field(default_factory=lambda: secrets.token_urlsafe(24))
+    unsubscribe_token: str = Field(default_factory=lambda: secrets.token_urlsafe(24))
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_delivery: Optional[datetime] = None
 
@@ -207,4 +234,6 @@ class SubscriptionCreate(BaseModel):
     email: Optional[EmailStr] = None
     telegram_id: Optional[str] = None
     whatsapp_number: Optional[str] = None
-    delivery_methods: List[DeliveryMethod]
\ No newline at end of file
+    delivery_methods: List[DeliveryMethod]
+    platforms: List[Platform] = []
+    locale: str = Field("en", max_length=16)
\ No newline at end of file
@@ -0,0 +1,62 @@
+# Cursor Pagination
+
+from typing import Any, List, Optional
+from datetime import datetime, timedelta
+import base64
+
+import orjson
+
+MAX_PAGE_SIZE = 100
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque cursor for a sort key; datetimes are stored as epoch milliseconds"""
+    packed = [
+        {"t": (value.replace(tzinfo=None) - EPOCH) // MILLISECOND} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    return base64.urlsafe_b64encode(orjson.dumps(packed)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor holding `size` values; raises ValueError if it is malformed"""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+
+    decoded = []
+    for value in values:
+        # Only scalars may reach a query; anything else could smuggle in operators
+        if isinstance(value, dict) and list(value) == ["t"] and isinstance(value["t"], int):
+            try:
+                decoded.append(EPOCH + value["t"] * MILLISECOND)
+            except OverflowError:
+                raise ValueError("Invalid cursor")
+        elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            decoded.append(value)
+        else:
+            raise ValueError("Invalid cursor")
+    return decoded
+
+
+def seek_before(fields: List[str], values: List[Any]) -> dict:
+    """Mongo filter for documents after a key in descending order of `fields`"""
+    clauses = []
+    for index, field in enumerate(fields):
+        clause = {previous: values[position] for position, previous in enumerate(fields[:index])}
+        clause[field] = {"$lt": values[index]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def next_cursor(items: List[Any], limit: int, key) -> Optional[str]:
+    """Cursor after the last item of a page fetched with limit + 1, or None on the last page"""
+    if len(items) <= limit:
+        return None
+    return encode_cursor(*key(items[limit - 1]))
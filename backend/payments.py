@@ -1,6 +1,6 @@
 # Payment System with Stripe Integration
 
-from fastapi import APIRouter, HTTPException, Request, Header, Depends
+from fastapi import APIRouter, HTTPException, Request, Header, Depends, Query
 from typing import Optional
 import os
 from datetime import datetime
@@ -9,17 +9,40 @@ import logging
 from models import CheckoutRequest, PaymentTransaction, PaymentStatus, SubscriptionTier, User
 from subscription_plans import get_stripe_price_id, get_plan
 from auth import AuthService, get_current_user, require_user
+from revenue_ledger import RevenueLedger
+from pagination import MAX_PAGE_SIZE, decode_cursor, next_cursor, seek_before
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 
 logger = logging.getLogger(__name__)
 
 class PaymentService:
-    def __init__(self, db, auth_service: AuthService):
+    def __init__(self, db, auth_service: AuthService, revenue_ledger: Optional[RevenueLedger] = None):
         self.db = db
         self.auth_service = auth_service
+        self.revenue_ledger = revenue_ledger or RevenueLedger(db)
         self.stripe_api_key = os.environ.get('STRIPE_API_KEY')
         self.stripe_checkout = None
         
+    async def ensure_indexes(self):
+        """Create the index transaction listings page through"""
+        await self.db.payment_transactions.create_index([("user_id", 1), ("created_at", -1), ("id", -1)])
+    
+    async def list_transactions(self, user_id: str, limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """Page through a user's transactions, newest first, keyed on (created_at, id)"""
+        query = {"user_id": user_id}
+        if cursor:
+            query.update(seek_before(["created_at", "id"], decode_cursor(cursor, 2)))
+        
+        transactions = await self.db.payment_transactions.find(query, {"_id": 0}).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        
+        return {
+            "transactions": transactions[:limit],
+            "total": min(len(transactions), limit),
+            "next_cursor": next_cursor(transactions, limit, lambda item: (item["created_at"], item["id"]))
+        }
+    
     def get_stripe_checkout(self, host_url: str):
         """Initialize Stripe checkout with webhook URL"""
         if not self.stripe_checkout:
@@ -129,16 +152,19 @@ class PaymentService:
     async def _process_successful_payment(self, session_id: str, transaction: dict):
         """Process a successful payment"""
         try:
-            # Update transaction status
-            await self.db.payment_transactions.update_one(
-                {"session_id": session_id},
+            # Update transaction status; only the call that completes it books the revenue
+            completed_at = datetime.utcnow()
+            result = await self.db.payment_transactions.update_one(
+                {"session_id": session_id, "status": {"$ne": PaymentStatus.COMPLETED.value}},
                 {
                     "$set": {
                         "status": PaymentStatus.COMPLETED.value,
-                        "completed_at": datetime.utcnow()
+                        "completed_at": completed_at
                     }
                 }
             )
+            if result.modified_count:
+                await self.revenue_ledger.record_payment(transaction, completed_at)
             
             # Update user subscription
             user_id = transaction.get("user_id")
@@ -188,10 +214,12 @@ class PaymentService:
             raise HTTPException(status_code=400, detail="Webhook processing failed")
 
 
-def create_payment_router(db, auth_service: AuthService) -> APIRouter:
+def create_payment_router(db, auth_service: AuthService,
+                          revenue_ledger: Optional[RevenueLedger] = None) -> APIRouter:
     """Create payment router with all payment endpoints"""
     router = APIRouter(prefix="/api/payments/v1")
-    payment_service = PaymentService(db, auth_service)
+    payment_service = PaymentService(db, auth_service, revenue_ledger)
+    router.add_event_handler("startup", payment_service.ensure_indexes)
     
     @router.post("/checkout/session", response_model=CheckoutSessionResponse)
     async def create_checkout_session(
@@ -218,13 +246,16 @@ def create_payment_router(db, auth_service: AuthService) -> APIRouter:
         return await payment_service.handle_webhook(body, stripe_signature)
     
     @router.get("/transactions/me")
-    async def get_my_transactions(user: User = Depends(require_user)):
-        """Get current user's payment transactions"""
+    async def get_my_transactions(
+        limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        user: User = Depends(require_user)
+    ):
+        """Get current user's payment transactions; pass next_cursor back to get the next page"""
         try:
-            transactions = await db.payment_transactions.find(
-                {"user_id": user.id}
-            ).sort("created_at", -1).to_list(50)
-            return {"transactions": transactions, "total": len(transactions)}
+            return await payment_service.list_transactions(user.id, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error fetching user transactions: {str(e)}")
             raise HTTPException(status_code=500, detail="Error fetching transactions")
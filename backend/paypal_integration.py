@@ -10,6 +10,8 @@ import json
 from models import PaymentTransaction, PaymentStatus, SubscriptionTier, User, CheckoutRequest
 from subscription_plans import get_plan
 from auth import get_current_user, require_user
+from revenue_ledger import RevenueLedger
+from pymongo import ReturnDocument
 
 # PayPal SDK imports
 from paypalcheckoutsdk.core import SandboxEnvironment, LiveEnvironment, PayPalHttpClient
@@ -19,8 +21,9 @@ from paypalcheckoutsdk.payments import CapturesRefundRequest
 logger = logging.getLogger(__name__)
 
 class PayPalService:
-    def __init__(self, db):
+    def __init__(self, db, revenue_ledger: Optional[RevenueLedger] = None):
         self.db = db
+        self.revenue_ledger = revenue_ledger or RevenueLedger(db)
         self.client_id = os.environ.get('PAYPAL_CLIENT_ID')
         self.client_secret = os.environ.get('PAYPAL_CLIENT_SECRET')
         self.mode = os.environ.get('PAYPAL_MODE', 'sandbox')
@@ -153,19 +156,11 @@ class PayPalService:
             capture_result = capture_response.result.__dict__
             
             # Update payment transaction
-            await self.db.payment_transactions.update_one(
-                {"session_id": order_id},
-                {
-                    "$set": {
-                        "status": PaymentStatus.COMPLETED.value,
-                        "completed_at": datetime.utcnow(),
-                        "payment_id": capture_result['id']
-                    }
-                }
-            )
+            transaction = await self._mark_completed(order_id, {"payment_id": capture_result['id']})
             
             # Get transaction to update user subscription
-            transaction = await self.db.payment_transactions.find_one({"session_id": order_id})
+            if not transaction:
+                transaction = await self.db.payment_transactions.find_one({"session_id": order_id})
             if transaction:
                 await self._process_successful_payment(transaction)
             
@@ -182,6 +177,23 @@ class PayPalService:
             logger.error(f"Error capturing PayPal order {order_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error processing PayPal payment: {str(e)}")
     
+    async def _mark_completed(self, order_id: str, extra_fields: Optional[dict] = None) -> Optional[dict]:
+        """Mark a transaction completed and book its revenue; returns None if it already was"""
+        transaction = await self.db.payment_transactions.find_one_and_update(
+            {"session_id": order_id, "status": {"$ne": PaymentStatus.COMPLETED.value}},
+            {
+                "$set": {
+                    "status": PaymentStatus.COMPLETED.value,
+                    "completed_at": datetime.utcnow(),
+                    **(extra_fields or {})
+                }
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if transaction:
+            await self.revenue_ledger.record_payment(transaction)
+        return transaction
+    
     async def _process_successful_payment(self, transaction: dict):
         """Process successful PayPal payment and update user subscription"""
         try:
@@ -235,15 +247,7 @@ class PayPalService:
                 
                 if order_id:
                     # Update transaction status
-                    await self.db.payment_transactions.update_one(
-                        {"session_id": order_id},
-                        {
-                            "$set": {
-                                "status": PaymentStatus.COMPLETED.value,
-                                "completed_at": datetime.utcnow()
-                            }
-                        }
-                    )
+                    await self._mark_completed(order_id)
             
             return {"status": "success", "event_type": event_type}
             
@@ -273,10 +277,10 @@ class PayPalService:
             raise HTTPException(status_code=500, detail="Error checking payment status")
 
 
-def create_paypal_router(db) -> APIRouter:
+def create_paypal_router(db, revenue_ledger: Optional[RevenueLedger] = None) -> APIRouter:
     """Create PayPal payment router with all PayPal endpoints"""
     router = APIRouter(prefix="/api/payments/paypal")
-    paypal_service = PayPalService(db)
+    paypal_service = PayPalService(db, revenue_ledger)
     
     @router.get("/available")
     async def check_paypal_availability():
@@ -0,0 +1,114 @@
+# Daily Revenue Ledger
+
+from typing import Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RevenueLedger:
+    """Completed payment totals per day, currency and subscription tier"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.revenue_ledger.create_index("date")
+
+    async def backfill(self):
+        """Build ledger rows from completed transactions when the ledger is empty"""
+        if await self.db.revenue_ledger.estimated_document_count():
+            return
+
+        pipeline = [
+            {"$match": {"status": "completed"}},
+            {
+                "$group": {
+                    "_id": {
+                        "date": {"$dateToString": {
+                            "format": "%Y-%m-%d",
+                            "date": {"$ifNull": ["$completed_at", "$created_at"]}
+                        }},
+                        "currency": {"$toLower": {"$ifNull": ["$currency", "usd"]}},
+                        "subscription_tier": {"$ifNull": ["$subscription_tier", "unknown"]}
+                    },
+                    "amount_cents": {"$sum": {"$round": [{"$multiply": ["$amount", 100]}, 0]}},
+                    "transactions": {"$sum": 1}
+                }
+            }
+        ]
+
+        rows = []
+        async for group in self.db.payment_transactions.aggregate(pipeline):
+            key = group["_id"]
+            rows.append({
+                "_id": f"{key['date']}|{key['currency']}|{key['subscription_tier']}",
+                **key,
+                "amount_cents": int(group["amount_cents"]),
+                "transactions": group["transactions"]
+            })
+
+        if rows:
+            await self.db.revenue_ledger.insert_many(rows, ordered=False)
+            logger.info(f"Backfilled revenue ledger with {len(rows)} rows")
+
+    async def record_payment(self, transaction: dict, completed_at: Optional[datetime] = None):
+        """Add a completed transaction to its daily ledger row"""
+        completed_at = completed_at or transaction.get("completed_at") or datetime.utcnow()
+        date = completed_at.strftime("%Y-%m-%d")
+        currency = (transaction.get("currency") or "usd").lower()
+        tier = transaction.get("subscription_tier") or "unknown"
+        if hasattr(tier, "value"):
+            tier = tier.value
+
+        # Amounts are kept in minor units so totals never accumulate float error
+        amount_cents = int(round(float(transaction.get("amount", 0.0)) * 100))
+
+        await self.db.revenue_ledger.update_one(
+            {"_id": f"{date}|{currency}|{tier}"},
+            {
+                "$setOnInsert": {"date": date, "currency": currency, "subscription_tier": tier},
+                "$inc": {"amount_cents": amount_cents, "transactions": 1}
+            },
+            upsert=True
+        )
+
+    async def get_revenue(self, start_date: datetime, end_date: Optional[datetime] = None) -> Dict:
+        """Summarize ledger rows between two dates, keeping currencies separate"""
+        query = {"date": {"$gte": start_date.strftime("%Y-%m-%d")}}
+        if end_date:
+            query["date"]["$lte"] = end_date.strftime("%Y-%m-%d")
+
+        totals: Dict[str, int] = {}
+        by_tier: Dict[str, Dict[str, int]] = {}
+        daily: Dict[str, Dict[str, int]] = {}
+        transactions = 0
+
+        async for row in self.db.revenue_ledger.find(query):
+            currency = row["currency"]
+            amount = row["amount_cents"]
+            totals[currency] = totals.get(currency, 0) + amount
+            tier_totals = by_tier.setdefault(row["subscription_tier"], {})
+            tier_totals[currency] = tier_totals.get(currency, 0) + amount
+            day_totals = daily.setdefault(row["date"], {})
+            day_totals[currency] = day_totals.get(currency, 0) + amount
+            transactions += row["transactions"]
+
+        def to_major(amounts: Dict[str, int]) -> Dict[str, float]:
+            return {currency: cents / 100 for currency, cents in sorted(amounts.items())}
+
+        return {
+            "total_revenue": to_major(totals),
+            "revenue_by_tier": {tier: to_major(amounts) for tier, amounts in by_tier.items()},
+            "daily_revenue": {day: to_major(daily[day]) for day in sorted(daily)},
+            "total_transactions": transactions
+        }
+
+    async def get_revenue_this_month(self) -> Dict[str, float]:
+        """Month-to-date revenue per currency"""
+        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        revenue = await self.get_revenue(month_start)
+        return revenue["total_revenue"]
+
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Depends, Request, Header
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Depends, Request, Header, Query
+from fastapi.responses import RedirectResponse, StreamingResponse, Response
+from pydantic import ValidationError
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -8,7 +9,7 @@ import logging
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import aiohttp
 import asyncio
 from googleapiclient.discovery import build
@@ -21,7 +22,23 @@ from models import *
 from auth import AuthService, get_current_user, require_user, require_pro_user, require_business_user
 from subscription_plans import SUBSCRIPTION_PLANS, get_plan, get_stripe_price_id
 from advertising import AdvertisingService
+from ad_inventory import AdInventory
+from ad_events import AdEventBuffer
 from analytics import AnalyticsService
+from trending import TrendingTopicsEngine, WINDOWS as TRENDING_WINDOWS
+from usage_sketches import UsageSketchService
+from revenue_ledger import RevenueLedger
+from analytics_export import AnalyticsExporter, EXPORT_FORMATS
+from fast_json import VideoFragmentCache, encode_video_response
+from feed_snapshots import FeedSnapshotStore
+from feed_payloads import FeedPayloadCache, FeedNotModifiedMiddleware, feed_cursor, normalized_query, request_api_key
+from pagination import MAX_PAGE_SIZE, decode_cursor
+from micro_cache import MicroCacheMiddleware
+from feed_export import FeedExporter, FEED_SOURCES
+from feed_events import FeedBroadcaster, SubscriberFilter, EVENT_TYPES
+from feed_deltas import FeedDeltaLog
+from digest_delivery import DigestDeliveryEngine
+from delivery_transports import build_channels
 from payments import create_payment_router
 from paypal_integration import create_paypal_router
 
@@ -37,9 +54,19 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Initialize services
-auth_service = AuthService(db)
-advertising_service = AdvertisingService(db)
-analytics_service = AnalyticsService(db)
+usage_sketches = UsageSketchService(db)
+auth_service = AuthService(db, usage_sketches)
+ad_inventory = AdInventory(db)
+ad_event_buffer = AdEventBuffer(db, ad_inventory)
+advertising_service = AdvertisingService(db, ad_inventory, ad_event_buffer)
+trending_engine = TrendingTopicsEngine()
+revenue_ledger = RevenueLedger(db)
+analytics_service = AnalyticsService(db, trending_engine, usage_sketches, revenue_ledger)
+analytics_exporter = AnalyticsExporter(db)
+video_fragments = VideoFragmentCache()
+
+# Long-running background jobs started on startup
+background_tasks: List[asyncio.Task] = []
 
 # Stripe setup
 stripe_api_key = os.environ.get('STRIPE_API_KEY')
@@ -49,10 +76,13 @@ app = FastAPI(title="Viral Daily API", description="Monetized API for aggregatin
 
 # Create routers
 api_router = APIRouter(prefix="/api")
-payments_router = create_payment_router(db, auth_service)
-paypal_router = create_paypal_router(db)
+payments_router = create_payment_router(db, auth_service, revenue_ledger)
+paypal_router = create_paypal_router(db, revenue_ledger)
 admin_router = APIRouter(prefix="/api/admin")
 
+# YouTube videos.list accepts maxResults between 1 and 50
+YOUTUBE_MAX_RESULTS = 50
+
 # Video Aggregation Service (Enhanced)
 class VideoAggregator:
     def __init__(self):
@@ -173,17 +203,25 @@ class VideoAggregator:
             return await self._get_youtube_mock_data(limit)
         
         try:
-            # Get trending videos
-            trending_request = youtube.videos().list(
-                part='snippet,statistics,contentDetails',
-                chart='mostPopular',
-                regionCode='US',
-                maxResults=limit,
-                videoCategoryId='0'  # All categories
-            )
-            trending_response = trending_request.execute()
-            
-            for item in trending_response.get('items', []):
+            # Get trending videos; videos.list returns at most 50 per page, so page through deeper feeds
+            items = []
+            page_token = None
+            while len(items) < limit:
+                trending_request = youtube.videos().list(
+                    part='snippet,statistics,contentDetails',
+                    chart='mostPopular',
+                    regionCode='US',
+                    maxResults=min(limit - len(items), YOUTUBE_MAX_RESULTS),
+                    videoCategoryId='0',  # All categories
+                    pageToken=page_token
+                )
+                trending_response = trending_request.execute()
+                items.extend(trending_response.get('items', []))
+                page_token = trending_response.get('nextPageToken')
+                if not page_token:
+                    break
+
+            for item in items[:limit]:
                 try:
                     snippet = item['snippet']
                     statistics = item['statistics']
@@ -496,6 +534,23 @@ class VideoAggregator:
 # Initialize aggregator
 aggregator = VideoAggregator()
 
+# Feeds are fetched in the background and served from versioned snapshots
+feed_snapshots = FeedSnapshotStore(db, {
+    Platform.YOUTUBE: aggregator.fetch_youtube_viral_videos,
+    Platform.TIKTOK: aggregator.fetch_tiktok_viral_videos,
+    Platform.TWITTER: aggregator.fetch_twitter_viral_videos,
+})
+feed_payloads = FeedPayloadCache(feed_snapshots, video_fragments)
+feed_exporter = FeedExporter(db, feed_snapshots)
+feed_broadcaster = FeedBroadcaster()
+feed_deltas = FeedDeltaLog(video_fragments)
+digest_engine = DigestDeliveryEngine(db, feed_snapshots, build_channels())
+
+# Update trending topic counts with newly seen videos
+feed_snapshots.add_listener(lambda previous, snapshot: trending_engine.ingest_many(snapshot.videos()))
+feed_snapshots.add_listener(feed_broadcaster.on_snapshot)
+feed_snapshots.add_listener(feed_deltas.on_snapshot)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -503,6 +558,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PLATFORM_VALUES = {platform.value for platform in Platform}
+
+def get_viewer_key(request: Optional[Request]) -> Optional[str]:
+    """Key for anonymous ad frequency caps: the client's X-Client-ID, else its address"""
+    if request is None:
+        return None
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return f"client:{client_id[:64]}"
+    return f"ip:{request.client.host}" if request.client else None
+
+def get_clicker_keys(request: Optional[Request]) -> List[str]:
+    """Keys click fraud checks count: always the connection address, plus X-Client-ID when sent"""
+    if request is None:
+        return []
+    # The client id is caller-supplied, so it only adds a key and never replaces the address
+    keys = [f"ip:{request.client.host}"] if request.client else []
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        keys.append(f"client:{client_id[:64]}")
+    return keys
+
 # Middleware to track API usage
 @app.middleware("http")
 async def track_api_usage_middleware(request: Request, call_next):
@@ -530,6 +607,11 @@ async def track_api_usage_middleware(request: Request, call_next):
     
     # Log API usage (async)
     if request.url.path.startswith("/api/"):
+        route = request.scope.get("route")
+        query_params = request.query_params
+        platform = query_params.get("platform")
+        limit = query_params.get("limit")
+        
         asyncio.create_task(
             auth_service.log_api_usage(
                 user=user,
@@ -537,7 +619,11 @@ async def track_api_usage_middleware(request: Request, call_next):
                 method=request.method,
                 api_key=api_key,
                 response_time_ms=response_time_ms,
-                status_code=response.status_code
+                status_code=response.status_code,
+                route=getattr(route, "path", None),
+                platform=Platform(platform) if platform in PLATFORM_VALUES else None,
+                limit=int(limit) if limit and limit.isdigit() else None,
+                result_count=getattr(request.state, "result_count", None)
             )
         )
     
@@ -556,11 +642,17 @@ async def root():
 @api_router.get("/videos", response_model=VideoResponse)
 async def get_viral_videos(
     platform: Optional[Platform] = None, 
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[int] = None,
     user: Optional[User] = Depends(get_current_user),
     request: Request = None
 ):
-    """Get viral videos from all platforms or a specific platform"""
+    """Get viral videos from all platforms or a specific platform; pass next_cursor back for the next page.
+
+    With since=<X-Feed-Version of an earlier response>, ad-free tiers get only the added, removed and
+    re-ranked videos; a full response is returned instead when that version is no longer retained.
+    """
     try:
         # Check rate limits
         if user and not await auth_service.check_api_rate_limit(user):
@@ -570,57 +662,152 @@ async def get_viral_videos(
             )
         
         # Get user's plan
-        user_plan = get_plan(user.subscription_tier if user else SubscriptionTier.FREE)
+        tier = user.subscription_tier if user else SubscriptionTier.FREE
+        user_plan = get_plan(tier)
         
         # Apply limits based on subscription
         max_limit = user_plan.max_videos_per_day if user_plan.max_videos_per_day > 0 else limit
         limit = min(limit, max_limit)
         
-        if platform:
-            # Get videos from specific platform
-            if platform == Platform.YOUTUBE:
-                videos = await aggregator.fetch_youtube_viral_videos(limit)
-            elif platform == Platform.TIKTOK:
-                videos = await aggregator.fetch_tiktok_viral_videos(limit)
-            elif platform == Platform.TWITTER:
-                videos = await aggregator.fetch_twitter_viral_videos(limit)
-            else:
-                videos = []
-        else:
-            # Get aggregated videos from all platforms
-            videos = await aggregator.get_aggregated_viral_videos(limit, user)
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding, Authorization, X-API-Key"}
+        if since is not None and not cursor and not user_plan.has_ads:
+            # Make sure the first snapshot, and so the delta log, exists
+            await feed_snapshots.current()
+            body = feed_deltas.body(since, platform, limit)
+            if body is not None:
+                headers["X-Feed-Version"] = str(feed_deltas.version)
+                return Response(content=body, media_type="application/json", headers=headers)
         
-        # Get ads for free tier users
-        ads = await advertising_service.get_ads_for_platform(platform, user)
+        if cursor:
+            # Later pages seek into the current snapshot by (viral_score, id)
+            try:
+                score, video_id = decode_cursor(cursor, 2)
+                if not isinstance(score, (int, float)) or not isinstance(video_id, str):
+                    raise ValueError("Invalid cursor")
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            # Everything ranked above the cursor counts as served toward the tier's allowance
+            snapshot = await feed_snapshots.current()
+            served = snapshot.position(platform, (score, video_id))
+            if user_plan.max_videos_per_day > 0:
+                limit = max(0, min(limit, user_plan.max_videos_per_day - served))
+            page, has_more = snapshot.page(platform, limit, (score, video_id))
+            payload = None
+            videos = list(page)
+            next_page = feed_cursor(page, has_more, served + len(page), tier)
+            date = snapshot.created_at
+            version = snapshot.version
+        else:
+            # The first page comes pre-rendered from the current snapshot
+            payload = await feed_payloads.get(platform, tier, limit)
+            videos = list(payload.videos)
+            next_page = payload.next_cursor
+            date = payload.date
+            version = payload.version
         
-        # Inject ads if user is on free tier
+        # Get ads for free tier users; they are chosen per viewer, so they are spliced in per request
+        ads = []
         if user_plan.has_ads:
-            videos = advertising_service.inject_ads_into_videos(videos, ads, user)
+            ads = await advertising_service.get_ads_for_platform(platform, user, viewer=get_viewer_key(request))
         
-        # Store videos in database for analytics
-        for video in videos:
-            try:
-                if not video.is_sponsored:  # Don't store ads as viral videos
-                    await db.viral_videos.update_one(
-                        {"url": video.url},
-                        {"$set": video.dict()},
-                        upsert=True
-                    )
-            except Exception as e:
-                logger.error(f"Error storing video {video.url}: {e}")
-        
-        return VideoResponse(
-            videos=videos,
-            total=len(videos),
-            platform=platform,
-            date=datetime.utcnow(),
-            has_ads=user_plan.has_ads,
-            user_tier=user.subscription_tier if user else SubscriptionTier.FREE
+        request.state.result_count = len(videos) + len(ads)
+        headers["X-Feed-Version"] = str(version)
+        
+        if payload is not None:
+            etag_args = (request_api_key(request.headers), normalized_query(request.query_params.multi_items()))
+            headers["ETag"] = feed_payloads.etag(payload, *etag_args, ads=[ad.id for ad in ads])
+            if not ads:
+                content_encoding, body = payload.negotiate(request.headers.get("accept-encoding"))
+                if content_encoding != "identity":
+                    headers["Content-Encoding"] = content_encoding
+                return Response(content=body, media_type="application/json", headers=headers)
+        
+        # Videos were built by us, so skip response_model revalidation and splice cached JSON
+        if ads:
+            videos = advertising_service.inject_ads_into_videos(videos, ads, user)
+        return Response(
+            content=encode_video_response(
+                videos,
+                video_fragments,
+                platform=platform,
+                date=date,
+                has_ads=user_plan.has_ads,
+                user_tier=tier,
+                next_cursor=next_page
+            ),
+            media_type="application/json",
+            headers=headers
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching videos: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching viral videos")
 
+@api_router.get("/videos/stream")
+async def stream_videos(
+    platform: Optional[Platform] = None,
+    min_score: float = 0.0,
+    since: Optional[datetime] = None,
+    source: str = "catalog",
+    user: User = Depends(require_business_user)
+):
+    """Stream the ranked catalog, or the current snapshot, as NDJSON (Business only)"""
+    if source not in FEED_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Unknown source '{source}'. Choose one of: {', '.join(FEED_SOURCES)}")
+    
+    # Stored and snapshot times are naive UTC
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    return StreamingResponse(
+        feed_exporter.stream(source, platform, min_score, since),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="viral_daily_videos.ndjson"'}
+    )
+
+@api_router.get("/videos/events")
+async def video_events(
+    platform: Optional[List[Platform]] = Query(None),
+    min_score: float = 0.0,
+    types: Optional[str] = None,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    user: User = Depends(require_business_user)
+):
+    """Server-Sent Events for new videos, viral score threshold crossings and platform refreshes (Business only)"""
+    event_types = {name.strip() for name in types.split(",") if name.strip()} if types else None
+    unknown = (event_types or set()) - set(EVENT_TYPES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(sorted(unknown))}")
+    
+    event_filter = SubscriberFilter({p.value for p in platform} if platform else None, min_score, event_types)
+    try:
+        subscriber = feed_broadcaster.subscribe(event_filter, last_event_id)
+    except OverflowError:
+        raise HTTPException(status_code=503, detail="Too many event subscribers, retry later")
+    
+    return StreamingResponse(
+        feed_broadcaster.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Advertising Routes
+@api_router.post("/ads/events", status_code=202)
+async def ingest_ad_events(
+    request: Request,
+    user: Optional[User] = Depends(get_current_user)
+):
+    """Accept a batch of ad impressions and clicks (also works with navigator.sendBeacon)"""
+    # Parse the raw body so text/plain beacons are accepted alongside application/json
+    try:
+        batch = AdEventBatch.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    
+    return advertising_service.record_event_batch(batch, user, get_viewer_key(request), get_clicker_keys(request))
+
 # User Management Routes
 @api_router.post("/users/register", response_model=User)
 async def register_user(user_data: UserCreate):
@@ -673,23 +860,56 @@ async def get_my_subscription(user: User = Depends(require_user)):
     }
 
 # Legacy subscription route (for backward compatibility)
-@api_router.post("/subscribe", response_model=OldSubscription)
+@api_router.post("/subscribe", response_model=OldSubscription,
+                 response_model_exclude={"confirm_token", "unsubscribe_token"})
 async def create_legacy_subscription(subscription_data: SubscriptionCreate):
-    """Create a legacy subscription for daily viral video delivery"""
+    """Create a legacy subscription; digests start once the subscriber follows the confirmation link"""
     try:
         subscription = OldSubscription(**subscription_data.dict())
         await db.subscriptions.insert_one(subscription.dict())
-        return subscription
     except Exception as e:
         logger.error(f"Error creating subscription: {str(e)}")
         raise HTTPException(status_code=500, detail="Error creating subscription")
+    # Tokens only ever travel to the subscriber's own addresses, never back to the caller
+    asyncio.create_task(digest_engine.send_confirmation(subscription.dict()))
+    return subscription
+
+@api_router.get("/subscribe/confirm")
+async def confirm_legacy_subscription(token: str = Query(..., min_length=16, max_length=64)):
+    """Confirm a legacy subscription from the link sent to the subscriber"""
+    result = await db.subscriptions.update_one({"confirm_token": token}, {"$set": {"confirmed": True}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Unknown confirmation link")
+    return {"message": "Subscription confirmed"}
+
+@api_router.get("/subscribe/unsubscribe")
+async def unsubscribe_legacy_subscription(token: str = Query(..., min_length=16, max_length=64)):
+    """Stop digest delivery from the unsubscribe link in each digest"""
+    result = await db.subscriptions.update_one({"unsubscribe_token": token}, {"$set": {"active": False}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Unknown unsubscribe link")
+    return {"message": "Unsubscribed from Viral Daily"}
+
+@api_router.post("/subscribe/deliver")
+async def deliver_legacy_digests(user: User = Depends(require_user)):
+    """Queue today's digest for legacy subscriptions not yet delivered today (admin only)"""
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can trigger digest delivery")
+    stats = await digest_engine.deliver()
+    return {**stats, "jobs_by_status": await digest_engine.queue.counts()}
 
 # Analytics Routes (Business Tier)
 @api_router.get("/analytics/dashboard")
-async def get_analytics_dashboard(user: User = Depends(require_business_user)):
+async def get_analytics_dashboard(
+    refresh: bool = False,
+    user: User = Depends(require_business_user)
+):
     """Get comprehensive analytics dashboard"""
+    if refresh and not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can force a dashboard refresh")
+    
     try:
-        dashboard_data = await analytics_service.create_analytics_dashboard_data(user.id)
+        dashboard_data = await analytics_service.create_analytics_dashboard_data(user.id, force_refresh=refresh)
         return dashboard_data
     except Exception as e:
         logger.error(f"Error fetching dashboard data: {str(e)}")
@@ -709,17 +929,72 @@ async def get_platform_analytics(
         logger.error(f"Error fetching platform analytics: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching platform analytics")
 
+@api_router.get("/analytics/trending")
+async def get_trending_topics(
+    platform: Optional[Platform] = None,
+    window: str = "24h",
+    limit: int = 10,
+    user: User = Depends(require_pro_user)
+):
+    """Get trending topics ranked by burst score"""
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid window. Choose one of: {', '.join(TRENDING_WINDOWS)}"
+        )
+    
+    return {
+        "platform": platform,
+        "window": window,
+        "topics": [
+            {"term": term, "score": round(score, 2)}
+            for term, score in trending_engine.top_terms(platform, window, min(limit, 100))
+        ]
+    }
+
+@api_router.get("/analytics/export")
+async def export_analytics(
+    dataset: str = "videos",
+    format: str = "parquet",
+    columns: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: User = Depends(require_business_user)
+):
+    """Stream an analytics dataset as Parquet or Arrow IPC"""
+    column_list = [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+    try:
+        analytics_exporter.resolve_schema(dataset, column_list)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format '{format}'. Choose one of: {', '.join(EXPORT_FORMATS)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    extension = "parquet" if format == "parquet" else "arrows"
+    return StreamingResponse(
+        analytics_exporter.stream(dataset, format, column_list, start, end),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="viral_daily_{dataset}.{extension}"'}
+    )
+
 # Include routers
 app.include_router(api_router)
 app.include_router(payments_router)
 app.include_router(paypal_router)
 
+# Inside CORS so 304s still carry CORS headers, outside usage tracking so they skip auth
+app.add_middleware(FeedNotModifiedMiddleware, payloads=feed_payloads)
+
+# Anonymous bursts on hot routes cost one render per TTL; conditional requests pass through to the 304 check
+app.add_middleware(MicroCacheMiddleware, paths=("/api/", "/api/videos", "/api/subscription/plans"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Feed-Version"],
 )
 
 @app.on_event("startup")
@@ -728,10 +1003,37 @@ async def startup_event():
     try:
         # Create sample advertisements
         await advertising_service.create_sample_ads()
+        await ad_inventory.load()
+        await ad_event_buffer.ensure_indexes()
+        await ad_event_buffer.backfill_rollups()
+        await advertising_service.spend_tracker.reconcile()
+        await auth_service.ensure_indexes()
+        await revenue_ledger.ensure_indexes()
+        await feed_exporter.ensure_indexes()
+        await digest_engine.ensure_indexes()
+        await digest_engine.backfill_tokens()
+        await revenue_ledger.backfill()
+        await analytics_service.warm_trending_topics()
+        await feed_snapshots.refresh()
+        
+        # Keep the materialized analytics dashboard warm
+        background_tasks.append(asyncio.create_task(analytics_service.run_dashboard_refresher()))
+        background_tasks.append(asyncio.create_task(usage_sketches.run_flusher()))
+        background_tasks.append(asyncio.create_task(feed_snapshots.run_refresher()))
+        background_tasks.append(asyncio.create_task(ad_inventory.run_watcher()))
+        background_tasks.append(asyncio.create_task(ad_event_buffer.run_flusher()))
+        background_tasks.append(asyncio.create_task(advertising_service.spend_tracker.run_reconciler()))
+        background_tasks.append(asyncio.create_task(digest_engine.run_scheduler()))
+        background_tasks.append(asyncio.create_task(digest_engine.run_workers()))
         logger.info("Startup completed successfully")
     except Exception as e:
         logger.error(f"Error during startup: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await usage_sketches.flush()
+    await ad_event_buffer.flush()
     client.close()
\ No newline at end of file
@@ -0,0 +1,239 @@
+# Trending Topics Engine
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from collections import Counter, OrderedDict
+from datetime import timezone
+import heapq
+import re
+import time
+import unicodedata
+
+from models import Platform, ViralVideo
+
+# Window name -> (bucket width in seconds, number of buckets)
+WINDOWS: Dict[str, Tuple[int, int]] = {
+    "1h": (60, 60),
+    "24h": (3600, 24),
+    "7d": (6 * 3600, 28),
+}
+
+# Each window is compared against the next longer one to find bursts
+BASELINE_WINDOW = {"1h": "24h", "24h": "7d"}
+
+ALL_PLATFORMS = "all"
+
+# Scripts written without spaces between words: Thai, Lao, Myanmar, Khmer, kana and Han
+SPACELESS = (
+    "\u0e00-\u0eff\u1000-\u109f\u1780-\u17ff\u3040-\u30fa\u30fc-\u30ff\u31f0-\u31ff"
+    "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f\U00020000-\U0002fa1f"
+)
+SPACELESS_RUN = re.compile(f"[{SPACELESS}]+")
+
+# Runs of space-less script, words with at least one letter (any script), and single emoji pictographs
+TOKEN_PATTERN = re.compile(
+    rf"[{SPACELESS}]+"
+    r"|[^\W_]*[^\W\d_][^\W_]*(?:['’][^\W_]+)*"
+    r"|[\U0001F1E6-\U0001F1FF\U0001F300-\U0001FAFF☀-➿]"
+)
+
+# Short Latin words are mostly noise ("ok", "vs"); the length filter only applies to these
+LATIN_WORD = re.compile(r"[a-z\u00df-\u024f\u1e00-\u1eff'’]+")
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been before being but by can could
+did do does doing don't for from get got had has have he her here him his how i i'm if
+in into is it it's its just like me more most my no not now of on one only or our out
+over so some than that that's the their them then there these they this those to too
+up us very was we were what when where which who why will with would you you're your
+pov via new
+el la los las un una unos unas de del y o que en es por para con sin su sus se lo le
+al como más pero mi tu yo ya
+""".split())
+
+
+def _character_bigrams(run: str) -> List[str]:
+    # Combining vowel and tone marks (Thai, Khmer, Myanmar) stay with the letter they modify
+    characters: List[str] = []
+    for char in run:
+        if characters and unicodedata.category(char).startswith("M"):
+            characters[-1] += char
+        else:
+            characters.append(char)
+    if len(characters) == 1:
+        return characters
+    return [first + second for first, second in zip(characters, characters[1:])]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word and emoji tokens without stopwords"""
+    tokens = []
+    # Keep space-less runs apart from adjacent words so "f1東京" is not one token
+    text = SPACELESS_RUN.sub(r" \g<0> ", text.casefold())
+    for token in TOKEN_PATTERN.findall(text):
+        if SPACELESS_RUN.fullmatch(token):
+            # Without word boundaries, overlapping character bigrams stand in for words
+            tokens.extend(_character_bigrams(token))
+            continue
+        if token in STOPWORDS:
+            continue
+        if len(token) < 3 and LATIN_WORD.fullmatch(token):
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def extract_terms(text: str) -> List[str]:
+    """Get unigram and bigram terms for a title"""
+    tokens = tokenize(text)
+    bigrams = [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return tokens + bigrams
+
+
+class SlidingWindowCounter:
+    """Term counts over a ring buffer of fixed-width time buckets"""
+
+    def __init__(self, bucket_seconds: int, bucket_count: int):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.duration = bucket_seconds * bucket_count
+        self.buckets: List[Counter] = [Counter() for _ in range(bucket_count)]
+        self.totals: Counter = Counter()
+        self.head = -1
+
+    def _expire(self, slot: int):
+        bucket = self.buckets[slot]
+        if bucket:
+            self.totals.subtract(bucket)
+            for term in bucket:
+                if self.totals[term] <= 0:
+                    del self.totals[term]
+            bucket.clear()
+
+    def advance(self, now: float) -> bool:
+        """Expire buckets that fell out of the window; returns True if any did"""
+        current = int(now // self.bucket_seconds)
+        if current <= self.head:
+            return False
+
+        expired = False
+        start = max(self.head + 1, current - self.bucket_count + 1)
+        for bucket_id in range(start, current + 1):
+            slot = bucket_id % self.bucket_count
+            if self.buckets[slot]:
+                expired = True
+            self._expire(slot)
+        self.head = current
+        return expired
+
+    def add(self, terms: Iterable[str], timestamp: float) -> bool:
+        """Count terms at timestamp; returns False if it is outside the window"""
+        bucket_id = int(timestamp // self.bucket_seconds)
+        if bucket_id <= self.head - self.bucket_count or bucket_id > self.head:
+            return False
+
+        bucket = self.buckets[bucket_id % self.bucket_count]
+        for term in terms:
+            bucket[term] += 1
+            self.totals[term] += 1
+        return True
+
+
+class TrendingTopicsEngine:
+    """Incremental per-platform term and bigram counts over sliding windows"""
+
+    def __init__(self, clock: Callable[[], float] = time.time, max_seen_videos: int = 50000,
+                 max_ranked_terms: int = 100):
+        self.clock = clock
+        self.max_seen_videos = max_seen_videos
+        self.max_ranked_terms = max_ranked_terms
+        self._counters: Dict[str, Dict[str, SlidingWindowCounter]] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._rankings: Dict[Tuple[str, str], List[Tuple[str, float]]] = {}
+
+    def _platform_counters(self, key: str) -> Dict[str, SlidingWindowCounter]:
+        counters = self._counters.get(key)
+        if counters is None:
+            counters = {
+                name: SlidingWindowCounter(bucket_seconds, bucket_count)
+                for name, (bucket_seconds, bucket_count) in WINDOWS.items()
+            }
+            now = self.clock()
+            for counter in counters.values():
+                counter.advance(now)
+            self._counters[key] = counters
+        return counters
+
+    def _advance(self, key: str, now: float):
+        for name, counter in self._platform_counters(key).items():
+            if counter.advance(now):
+                self._invalidate(key, name)
+
+    def _invalidate(self, key: str, window: str):
+        self._rankings.pop((key, window), None)
+        for shorter, baseline in BASELINE_WINDOW.items():
+            if baseline == window:
+                self._rankings.pop((key, shorter), None)
+
+    def ingest(self, video: ViralVideo) -> bool:
+        """Count a video's title once; returns False for duplicates and ads"""
+        if video.is_sponsored or video.url in self._seen:
+            return False
+
+        self._seen[video.url] = None
+        if len(self._seen) > self.max_seen_videos:
+            self._seen.popitem(last=False)
+
+        terms = extract_terms(video.title)
+        if not terms:
+            return True
+
+        now = self.clock()
+        timestamp = min(video.fetched_at.replace(tzinfo=timezone.utc).timestamp(), now) if video.fetched_at else now
+        platform = video.platform.value if isinstance(video.platform, Platform) else str(video.platform)
+
+        for key in (platform, ALL_PLATFORMS):
+            self._advance(key, now)
+            for name, counter in self._platform_counters(key).items():
+                if counter.add(terms, timestamp):
+                    self._invalidate(key, name)
+        return True
+
+    def ingest_many(self, videos: Iterable[ViralVideo]) -> int:
+        """Ingest a batch of videos; returns the number of new videos counted"""
+        return sum(1 for video in videos if self.ingest(video))
+
+    def burst_score(self, key: str, window: str, term: str) -> float:
+        """Rate of a term in a window relative to its rate in the baseline window"""
+        counters = self._platform_counters(key)
+        count = counters[window].totals.get(term, 0)
+        baseline = BASELINE_WINDOW.get(window)
+        if not baseline:
+            return float(count)
+
+        expected = counters[baseline].totals.get(term, 0) * counters[window].duration / counters[baseline].duration
+        return count * (count + 1) / (expected + 1)
+
+    def _rank(self, key: str, window: str) -> List[Tuple[str, float]]:
+        totals = self._platform_counters(key)[window].totals
+        scored = ((term, self.burst_score(key, window, term)) for term in totals)
+        return heapq.nlargest(self.max_ranked_terms, scored, key=lambda item: (item[1], item[0]))
+
+    def top_terms(self, platform: Optional[Platform] = None, window: str = "24h",
+                  limit: int = 10) -> List[Tuple[str, float]]:
+        """Get the top terms by burst score for a platform and window"""
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown trending window: {window}")
+
+        key = platform.value if platform else ALL_PLATFORMS
+        self._advance(key, self.clock())
+
+        ranking = self._rankings.get((key, window))
+        if ranking is None:
+            ranking = self._rank(key, window)
+            self._rankings[(key, window)] = ranking
+        return ranking[:limit]
+
+    def top_topics(self, platform: Optional[Platform] = None, window: str = "24h",
+                   limit: int = 10) -> List[str]:
+        """Get the top trending terms without scores"""
+        return [term for term, score in self.top_terms(platform, window, limit)]
@@ -0,0 +1,149 @@
+# Active User Sketches
+
+from typing import Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+
+from hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+ALL_SCOPE = "all"
+
+
+def platform_scope(platform: str) -> str:
+    return f"platform:{platform}"
+
+
+def endpoint_scope(endpoint: str) -> str:
+    return f"endpoint:{endpoint}"
+
+
+class UsageSketchService:
+    """Daily HyperLogLog sketches of active users, overall, per platform and per endpoint"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, precision: int = 12):
+        self.db = db
+        self.precision = precision
+        self.flush_interval = int(os.environ.get('USAGE_SKETCH_FLUSH_INTERVAL', 60))
+        self._sketches: Dict[Tuple[str, str], HyperLogLog] = {}
+        self._dirty: set = set()
+
+    @staticmethod
+    def day_key(timestamp: Optional[datetime] = None) -> str:
+        return (timestamp or datetime.utcnow()).strftime("%Y-%m-%d")
+
+    def _sketch(self, day: str, scope: str) -> HyperLogLog:
+        key = (day, scope)
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            sketch = self._sketches[key] = HyperLogLog(self.precision)
+        return sketch
+
+    def record(self, user_id: str, endpoint: Optional[str] = None, platform: Optional[str] = None,
+               timestamp: Optional[datetime] = None):
+        """Count a user as active today in every scope the request touches"""
+        day = self.day_key(timestamp)
+        scopes = [ALL_SCOPE]
+        if platform:
+            scopes.append(platform_scope(platform))
+        if endpoint:
+            scopes.append(endpoint_scope(endpoint))
+
+        for scope in scopes:
+            if self._sketch(day, scope).add(user_id):
+                self._dirty.add((day, scope))
+
+    async def _merge_into_store(self, day: str, scope: str, sketch: HyperLogLog):
+        """Merge a local sketch into the stored one using an optimistic version check"""
+        doc_id = f"{day}|{scope}"
+        while True:
+            stored = await self.db.usage_sketches.find_one({"_id": doc_id})
+            if stored is None:
+                try:
+                    await self.db.usage_sketches.insert_one({
+                        "_id": doc_id,
+                        "day": day,
+                        "scope": scope,
+                        "precision": self.precision,
+                        "registers": sketch.to_bytes(),
+                        "version": 1
+                    })
+                    return
+                except DuplicateKeyError:
+                    continue
+
+            merged = HyperLogLog.from_bytes(stored["registers"], stored["precision"]).merge(sketch)
+            result = await self.db.usage_sketches.update_one(
+                {"_id": doc_id, "version": stored["version"]},
+                {"$set": {"registers": merged.to_bytes()}, "$inc": {"version": 1}}
+            )
+            if result.matched_count:
+                return
+
+    async def flush(self):
+        """Persist changed sketches and drop local sketches from past days"""
+        dirty, self._dirty = self._dirty, set()
+        for day, scope in dirty:
+            try:
+                await self._merge_into_store(day, scope, self._sketches[(day, scope)])
+            except Exception as e:
+                self._dirty.add((day, scope))
+                logger.error(f"Error flushing usage sketch {day}|{scope}: {e}")
+
+        today = self.day_key()
+        for key in list(self._sketches):
+            if key[0] < today and key not in self._dirty:
+                del self._sketches[key]
+
+    async def run_flusher(self):
+        """Periodically persist sketches"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _load_daily_sketches(self, days: int, scope: str,
+                                   end: Optional[datetime] = None) -> List[List[HyperLogLog]]:
+        """Load the sketches for each of the last `days` days, newest first"""
+        end = end or datetime.utcnow()
+        day_keys: List[str] = [self.day_key(end - timedelta(days=offset)) for offset in range(days)]
+        sketches: Dict[str, List[HyperLogLog]] = {day: [] for day in day_keys}
+
+        cursor = self.db.usage_sketches.find(
+            {"_id": {"$in": [f"{day}|{scope}" for day in day_keys]}},
+            {"day": 1, "registers": 1, "precision": 1}
+        )
+        async for stored in cursor:
+            if stored["precision"] == self.precision:
+                sketches[stored["day"]].append(HyperLogLog.from_bytes(stored["registers"], self.precision))
+
+        # Include increments not flushed yet
+        for day in day_keys:
+            local = self._sketches.get((day, scope))
+            if local is not None:
+                sketches[day].append(local)
+
+        return [sketches[day] for day in day_keys]
+
+    async def count_active_users(self, days: int = 1, scope: str = ALL_SCOPE,
+                                 end: Optional[datetime] = None) -> int:
+        """Estimate distinct active users over the last `days` days from a union of daily sketches"""
+        daily = await self._load_daily_sketches(days, scope, end)
+        return HyperLogLog.union((sketch for day in daily for sketch in day), self.precision).count()
+
+    async def get_active_user_counts(self, scope: str = ALL_SCOPE) -> Dict[str, int]:
+        """Get daily, weekly and monthly active users for a scope from one read of 30 daily sketches"""
+        daily = await self._load_daily_sketches(30, scope)
+
+        def union_count(days: int) -> int:
+            return HyperLogLog.union((sketch for day in daily[:days] for sketch in day), self.precision).count()
+
+        return {
+            "daily_active_users": union_count(1),
+            "weekly_active_users": union_count(7),
+            "monthly_active_users": union_count(30)
+        }
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from ad_events import AdEventBuffer  # noqa: E402
+from advertising import AdvertisingService  # noqa: E402
+from fast_json import VideoFragmentCache, encode_video_response  # noqa: E402
+from feed_events import FeedBroadcaster, SubscriberFilter  # noqa: E402
+from models import Platform, SubscriptionTier, VideoResponse, ViralVideo  # noqa: E402
+
+
+class AdAnalyticsBenchmark:
+    """Compare ad analytics over raw events with the hourly rollups at growing event volumes"""
+
+    def __init__(self, mongo_url=None, db_name="viral_daily_benchmark", ads=40, advertisers=8, days=30, runs=5):
+        self.client = AsyncIOMotorClient(mongo_url or os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        self.db = self.client[db_name]
+        self.ad_ids = [str(uuid.uuid4()) for _ in range(ads)]
+        self.advertisers = {ad_id: f"Advertiser {index % advertisers}" for index, ad_id in enumerate(self.ad_ids)}
+        self.days = days
+        self.runs = runs
+
+    async def reset(self):
+        for name in ("ad_impressions", "ad_clicks", "ad_hourly_rollups", "advertisements"):
+            await self.db.drop_collection(name)
+        await self.db.advertisements.insert_many([
+            {"id": ad_id, "title": f"Ad {ad_id[:8]}", "description": "Benchmark ad",
+             "image_url": "https://example.com/ad.png", "click_url": "https://example.com",
+             "advertiser": advertiser, "target_platforms": ["youtube"], "budget": 1e9,
+             "cost_per_click": 0.5, "is_active": True}
+            for ad_id, advertiser in self.advertisers.items()
+        ])
+
+    async def seed(self, events):
+        """Insert raw events spread over the window, one click per ten impressions"""
+        rng = random.Random(events)
+        now = datetime.utcnow()
+        span = self.days * 86400
+        batch = []
+        for index in range(events):
+            timestamp = now - timedelta(seconds=rng.random() * span)
+            ad_id = rng.choice(self.ad_ids)
+            if index % 10 == 9:
+                batch.append(("ad_clicks", {"id": str(uuid.uuid4()), "ad_id": ad_id, "timestamp": timestamp, "revenue": 0.5}))
+            else:
+                batch.append(("ad_impressions", {"id": str(uuid.uuid4()), "ad_id": ad_id, "timestamp": timestamp}))
+            if len(batch) >= 10000:
+                await self._insert(batch)
+                batch = []
+        await self._insert(batch)
+
+    async def _insert(self, batch):
+        for name in ("ad_impressions", "ad_clicks"):
+            documents = [document for collection, document in batch if collection == name]
+            if documents:
+                await self.db[name].insert_many(documents, ordered=False)
+
+    async def raw_analytics(self, advertiser=None):
+        """The previous implementation: two aggregations over raw events joined in Python"""
+        match_query = {"timestamp": {"$gte": datetime.utcnow() - timedelta(days=self.days)}}
+        impressions = await self.db.ad_impressions.aggregate([
+            {"$match": match_query},
+            {"$group": {"_id": "$ad_id", "impressions": {"$sum": 1}}}
+        ]).to_list(1000)
+        clicks = await self.db.ad_clicks.aggregate([
+            {"$match": match_query},
+            {"$group": {"_id": "$ad_id", "clicks": {"$sum": 1}, "revenue": {"$sum": "$revenue"}}}
+        ]).to_list(1000)
+        return len(impressions) + len(clicks)
+
+    async def time_call(self, call):
+        timings = []
+        for _ in range(self.runs):
+            started = time.perf_counter()
+            await call()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2]
+
+    async def run(self, volumes):
+        print(f"{'events':>10} {'raw ms':>10} {'rollup ms':>10} {'advertiser ms':>14} {'rollups':>8}")
+        for events in volumes:
+            await self.reset()
+            await self.seed(events)
+
+            service = AdvertisingService(self.db)
+            await service.inventory.load()
+            buffer = AdEventBuffer(self.db, service.inventory)
+            await buffer.ensure_indexes()
+            await buffer.backfill_rollups()
+            rollups = await self.db.ad_hourly_rollups.count_documents({})
+
+            raw_ms = await self.time_call(self.raw_analytics)
+            rollup_ms = await self.time_call(lambda: service.get_ad_analytics(days=self.days))
+            advertiser_ms = await self.time_call(
+                lambda: service.get_ad_analytics(advertiser="Advertiser 0", days=self.days)
+            )
+            print(f"{events:>10} {raw_ms:>10.1f} {rollup_ms:>10.1f} {advertiser_ms:>14.1f} {rollups:>8}")
+
+        await self.reset()
+        self.client.close()
+
+
+class VideoResponseBenchmark:
+    """Compare the response_model serialization path with the cached orjson path for /api/videos"""
+
+    def __init__(self, runs=200, thumbnail_bytes=20000):
+        self.runs = runs
+        self.thumbnail = "data:image/jpeg;base64," + "A" * thumbnail_bytes
+        self.field = create_response_field(name="Response_get_viral_videos", type_=VideoResponse)
+
+    def feed(self, size):
+        platforms = [Platform.YOUTUBE, Platform.TIKTOK, Platform.TWITTER]
+        return [
+            ViralVideo(title=f"Viral video {index} 🔥", url=f"https://example.com/watch/{index}",
+                       thumbnail=self.thumbnail, platform=platforms[index % 3], views=index * 1000,
+                       likes=index * 10, author=f"Creator {index}", duration="PT1M",
+                       description="Benchmark video " * 10, viral_score=index / 3,
+                       published_at=datetime.utcnow())
+            for index in range(size)
+        ]
+
+    async def current_path(self, videos):
+        response = VideoResponse(videos=videos, total=len(videos), platform=None, date=datetime.utcnow(),
+                                 has_ads=True, user_tier=SubscriptionTier.FREE)
+        content = await serialize_response(field=self.field, response_content=response)
+        return JSONResponse(content).body
+
+    async def fast_path(self, videos, fragments):
+        return encode_video_response(videos, fragments, platform=None, date=datetime.utcnow(),
+                                     has_ads=True, user_tier=SubscriptionTier.FREE)
+
+    async def measure(self, encode):
+        timings = []
+        total_bytes = 0
+        for _ in range(self.runs):
+            started = time.perf_counter()
+            body = await encode()
+            timings.append(time.perf_counter() - started)
+            total_bytes += len(body)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+        return total_bytes / sum(timings) / 1e6, p99
+
+    async def run(self, sizes):
+        print(f"{'items':>6} {'current MB/s':>13} {'current p99 ms':>15} {'fast MB/s':>10} {'fast p99 ms':>12}")
+        for size in sizes:
+            videos = self.feed(size)
+            fragments = VideoFragmentCache()
+            # Both paths must produce the same videos; only the response date differs
+            current = json.loads(await self.current_path(videos))
+            fast = json.loads(await self.fast_path(videos, fragments))
+            assert current["videos"] == fast["videos"]
+
+            current_rate, current_p99 = await self.measure(lambda: self.current_path(videos))
+            fast_rate, fast_p99 = await self.measure(lambda: self.fast_path(videos, fragments))
+            print(f"{size:>6} {current_rate:>13.1f} {current_p99:>15.2f} {fast_rate:>10.1f} {fast_p99:>12.2f}")
+
+
+class FeedEventsLoadTest:
+    """Fan feed events out over real SSE connections from thousands of local clients
+
+    Clients share the server's event loop, so reported latency is an upper bound on a real deployment.
+    """
+
+    def __init__(self, port=8765, events=300, payload_bytes=1024, interval=0.02, slow_fraction=0.02, queue_size=32):
+        self.port = port
+        self.events = events
+        self.payload = "x" * payload_bytes
+        self.interval = interval
+        self.slow_fraction = slow_fraction
+        self.broadcaster = FeedBroadcaster(queue_size=queue_size, max_subscribers=1000000)
+
+    def app(self):
+        app = FastAPI()
+
+        @app.get("/events")
+        async def events():
+            subscriber = self.broadcaster.subscribe(SubscriberFilter())
+            return StreamingResponse(self.broadcaster.stream(subscriber), media_type="text/event-stream")
+
+        return app
+
+    async def client(self, slow, latencies, outcomes):
+        request = f"GET /events HTTP/1.1\r\nHost: 127.0.0.1:{self.port}\r\nAccept: text/event-stream\r\n\r\n"
+        if slow:
+            # Never read, and keep the receive window tiny so the kernel cannot soak up the backlog;
+            # the server has to evict this client rather than buffer for it
+            loop = asyncio.get_running_loop()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, ("127.0.0.1", self.port))
+                await loop.sock_sendall(sock, request.encode())
+                await asyncio.sleep(3600)
+            finally:
+                sock.close()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port, limit=1 << 20)
+        writer.write(request.encode())
+        await writer.drain()
+        try:
+            received = 0
+            while True:
+                line = await reader.readline()
+                if not line:
+                    outcomes["closed"] += 1
+                    return
+                if line.startswith(b"event: evicted"):
+                    outcomes["evicted"] += 1
+                    return
+                if line.startswith(b"data: {\"sent\""):
+                    latencies.append(time.perf_counter() - json.loads(line[6:])["sent"])
+                    received += 1
+                    if received == self.events:
+                        outcomes["complete"] += 1
+                        return
+        finally:
+            writer.close()
+
+    async def run(self, sizes):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Accepted sockets inherit this, so a stalled client backs up into its queue instead of kernel memory
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+        listener.bind(("127.0.0.1", self.port))
+        server = uvicorn.Server(uvicorn.Config(self.app(), log_level="warning", backlog=8192))
+        serving = asyncio.create_task(server.serve(sockets=[listener]))
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        print(f"{'clients':>8} {'connect s':>10} {'events':>7} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'complete':>9} {'evicted':>8} {'slow':>5}")
+        for clients in sizes:
+            latencies = []
+            outcomes = {"complete": 0, "evicted": 0, "closed": 0}
+            slow_count = int(clients * self.slow_fraction)
+            started = time.perf_counter()
+            tasks = [asyncio.create_task(self.client(index < slow_count, latencies, outcomes))
+                     for index in range(clients)]
+            while self.broadcaster.subscriber_count < clients:
+                await asyncio.sleep(0.05)
+            connect_seconds = time.perf_counter() - started
+
+            for _ in range(self.events):
+                self.broadcaster.publish("new_video", {"sent": time.perf_counter(), "payload": self.payload})
+                await asyncio.sleep(self.interval)
+
+            fast = tasks[slow_count:]
+            await asyncio.wait(fast, timeout=60)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+            print(f"{clients:>8} {connect_seconds:>10.2f} {self.events:>7} {p50:>8.1f} {p99:>8.1f} "
+                  f"{outcomes['complete']:>9} {self.broadcaster.evictions:>8} {slow_count:>5}")
+
+        server.should_exit = True
+        await serving
+
+
+BENCHMARKS = {
+    "ads": (lambda: AdAnalyticsBenchmark(), [10000, 100000, 1000000]),
+    "videos": (lambda: VideoResponseBenchmark(), [10, 100, 1000]),
+    "sse": (lambda: FeedEventsLoadTest(), [5000]),
+}
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "ads"
+    if name not in BENCHMARKS:
+        print(f"Usage: {sys.argv[0]} [{'|'.join(BENCHMARKS)}] [sizes...]")
+        return 1
+    factory, default_sizes = BENCHMARKS[name]
+    sizes = [int(arg) for arg in sys.argv[2:]] or default_sizes
+    asyncio.run(factory().run(sizes))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
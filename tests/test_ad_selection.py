@@ -0,0 +1,62 @@
+import asyncio
+import random
+
+from mongomock_motor import AsyncMongoMockClient
+
+from ad_events import AdEventBuffer
+from ad_inventory import AdInventory
+from ad_selection import AdSelector, AliasTable
+from ad_spend import SpendTracker
+from models import Advertisement, Platform
+
+
+def make_selector(*ads):
+    async def load():
+        db = AsyncMongoMockClient()["viral_daily_test"]
+        await db.advertisements.insert_many([ad.dict() for ad in ads])
+        inventory = AdInventory(db)
+        await inventory.load()
+        return inventory, SpendTracker(db, inventory, AdEventBuffer(db, inventory))
+
+    inventory, spend_tracker = asyncio.run(load())
+    return AdSelector(inventory, spend_tracker, rng=random.Random(7)), spend_tracker
+
+
+def make_ad(budget=1_000_000.0, cost_per_click=1.0):
+    return Advertisement(title="Ad", description="", image_url="", click_url="https://example.com",
+                         advertiser="Acme", target_platforms=[Platform.YOUTUBE], budget=budget,
+                         cost_per_click=cost_per_click)
+
+
+def test_alias_table_follows_weights():
+    table = AliasTable(["a", "b", "c"], [1.0, 2.0, 7.0])
+    rng = random.Random(1)
+    draws = [table.draw(rng) for _ in range(20000)]
+    assert abs(draws.count("c") / len(draws) - 0.7) < 0.02
+    assert not AliasTable(["a"], [0.0])
+
+
+def test_small_spend_keeps_the_tables():
+    ad = make_ad()
+    selector, spend_tracker = make_selector(ad)
+    assert [chosen.id for chosen in selector.select(Platform.YOUTUBE)] == [ad.id]
+    selector.select()
+    tables = dict(selector._tables)
+
+    for _ in range(100):
+        spend_tracker.record(ad.id, ad.cost_per_click)
+        selector.note_spend(ad)
+    assert selector._tables == tables
+
+
+def test_material_spend_rebuilds_the_ads_tables():
+    ad = make_ad()
+    selector, spend_tracker = make_selector(ad)
+    selector.select(Platform.YOUTUBE)
+    selector.select(Platform.TIKTOK)
+    selector.select()
+
+    # Most of the remaining budget is gone, so the ad's share must drop now, not at the next rebuild
+    spend_tracker.record(ad.id, 600_000)
+    selector.note_spend(ad)
+    assert set(selector._tables) == {Platform.TIKTOK.value}
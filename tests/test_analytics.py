@@ -0,0 +1,67 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from analytics import AnalyticsService
+
+
+def make_service():
+    return AnalyticsService(AsyncMongoMockClient()["viral_daily_test"])
+
+
+def test_dashboard_reads_do_not_wait_for_a_refresh():
+    async def run():
+        service = make_service()
+        service._dashboard = {"generated_at": "cached"}
+
+        refreshing = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_refresh():
+            refreshing.set()
+            await release.wait()
+            service._dashboard = {"generated_at": "fresh"}
+
+        service.refresh_dashboard = slow_refresh
+        async with service._dashboard_lock:
+            # A forced refresh in another request holds the lock; plain reads are still served
+            assert (await asyncio.wait_for(service.get_dashboard(), 0.1))["generated_at"] == "cached"
+
+        refresher = asyncio.create_task(service.run_dashboard_refresher())
+        await refreshing.wait()
+        assert (await asyncio.wait_for(service.get_dashboard(), 0.1))["generated_at"] == "cached"
+        release.set()
+        await asyncio.sleep(0)
+        assert (await service.get_dashboard())["generated_at"] == "fresh"
+        refresher.cancel()
+        await asyncio.gather(refresher, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_user_sections_are_bounded_while_fresh():
+    async def run():
+        service = make_service()
+        service.max_user_sections = 3
+        calls = []
+
+        class Section:
+            def __init__(self, user_id):
+                self.user_id = user_id
+
+            def dict(self):
+                return {"user_id": self.user_id}
+
+        async def get_user_analytics(user_id):
+            calls.append(user_id)
+            return Section(user_id)
+
+        service.get_user_analytics = get_user_analytics
+        for user_id in ("a", "b", "c", "d", "e"):
+            await service.get_user_section(user_id)
+
+        assert list(service._user_sections) == ["c", "d", "e"]
+        assert (await service.get_user_section("e")) == {"user_id": "e"}
+        assert calls.count("e") == 1
+
+    asyncio.run(run())
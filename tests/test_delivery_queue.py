@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from delivery_queue import JOB_DEAD, JOB_DONE, JOB_LEASED, JOB_PENDING, DeliveryJobQueue, job_id
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2026, 1, 1, 8, 0)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+def make_queue(monkeypatch, max_attempts=3):
+    monkeypatch.setenv("DELIVERY_LEASE_SECONDS", "60")
+    monkeypatch.setenv("DELIVERY_MAX_ATTEMPTS", str(max_attempts))
+    clock = Clock()
+    queue = DeliveryJobQueue(AsyncMongoMockClient()["viral_daily_test"], clock=clock)
+    return queue, clock
+
+
+def make_job(subscription_id="sub-1", method="email"):
+    return {
+        "_id": job_id(subscription_id, method, "2026-01-01"),
+        "subscription_id": subscription_id,
+        "method": method,
+        "address": f"{subscription_id}@example.com",
+    }
+
+
+def test_duplicate_enqueue_is_ignored(monkeypatch):
+    async def run():
+        queue, _ = make_queue(monkeypatch)
+        assert await queue.enqueue([make_job("a"), make_job("b")]) == 2
+        assert await queue.enqueue([make_job("a"), make_job("b"), make_job("c")]) == 1
+        assert await queue.counts() == {JOB_PENDING: 3, JOB_LEASED: 0, JOB_DONE: 0, JOB_DEAD: 0}
+
+    asyncio.run(run())
+
+
+def test_claim_and_complete(monkeypatch):
+    async def run():
+        queue, _ = make_queue(monkeypatch)
+        await queue.enqueue([make_job()])
+
+        job = await queue.claim("email", "worker-1")
+        assert job["status"] == JOB_LEASED
+        assert job["attempts"] == 1
+        assert await queue.claim("email", "worker-2") is None
+        assert await queue.claim("telegram", "worker-2") is None
+
+        assert await queue.complete(job)
+        assert (await queue.counts())[JOB_DONE] == 1
+
+    asyncio.run(run())
+
+
+def test_lost_lease_cannot_settle_the_job(monkeypatch):
+    async def run():
+        queue, clock = make_queue(monkeypatch)
+        await queue.enqueue([make_job()])
+
+        stale = await queue.claim("email", "worker-1")
+        clock.advance(seconds=61)
+        fresh = await queue.claim("email", "worker-2")
+        assert fresh["_id"] == stale["_id"]
+        assert fresh["attempts"] == 2
+
+        assert not await queue.complete(stale)
+        await queue.fail(stale, RuntimeError("timed out"), retryable=False)
+        stored = await queue.db.delivery_jobs.find_one({"_id": fresh["_id"]})
+        assert stored["status"] == JOB_LEASED
+        assert stored["lease_token"] == fresh["lease_token"]
+        assert await queue.db.delivery_dead_letters.count_documents({}) == 0
+
+        assert await queue.complete(fresh)
+
+    asyncio.run(run())
+
+
+def test_retry_backs_off_then_dead_letters(monkeypatch):
+    async def run():
+        queue, clock = make_queue(monkeypatch, max_attempts=3)
+        await queue.enqueue([make_job()])
+
+        for attempt in (1, 2):
+            job = await queue.claim("email", "worker-1")
+            assert job["attempts"] == attempt
+            assert await queue.fail(job, RuntimeError("503"))
+            # Not due again until the backoff has passed
+            assert await queue.claim("email", "worker-1") is None
+            clock.advance(seconds=queue.backoff_max)
+
+        job = await queue.claim("email", "worker-1")
+        assert job["attempts"] == 3
+        assert not await queue.fail(job, RuntimeError("503"))
+
+        assert (await queue.counts())[JOB_DEAD] == 1
+        dead_letter = await queue.db.delivery_dead_letters.find_one({"_id": job["_id"]})
+        assert dead_letter["error"] == "503"
+        assert dead_letter["retryable"] is True
+        assert dead_letter["attempts"] == 3
+
+        # The dead job keeps its key, so the same send is never queued again
+        assert await queue.enqueue([make_job()]) == 0
+
+    asyncio.run(run())
+
+
+def test_permanent_failure_dead_letters_immediately(monkeypatch):
+    async def run():
+        queue, _ = make_queue(monkeypatch)
+        await queue.enqueue([make_job()])
+
+        job = await queue.claim("email", "worker-1")
+        assert not await queue.fail(job, RuntimeError("bad address"), retryable=False)
+        dead_letter = await queue.db.delivery_dead_letters.find_one({"_id": job["_id"]})
+        assert dead_letter["retryable"] is False
+
+    asyncio.run(run())
+
+
+def test_expired_lease_on_last_attempt_is_reaped(monkeypatch):
+    async def run():
+        queue, clock = make_queue(monkeypatch, max_attempts=2)
+        await queue.enqueue([make_job()])
+
+        await queue.claim("email", "worker-1")
+        clock.advance(seconds=61)
+        job = await queue.claim("email", "worker-2")
+        assert job["attempts"] == 2
+
+        # The last lease expiring must not grant a third attempt
+        clock.advance(seconds=61)
+        assert await queue.claim("email", "worker-3") is None
+        assert await queue.reap() == 1
+        assert await queue.reap() == 0
+
+        stored = await queue.db.delivery_jobs.find_one({"_id": job["_id"]})
+        assert stored["status"] == JOB_DEAD
+        assert "lease_token" not in stored
+        assert await queue.db.delivery_dead_letters.count_documents({"_id": job["_id"]}) == 1
+        assert not await queue.complete(job)
+
+    asyncio.run(run())
@@ -0,0 +1,119 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from digest_delivery import UNSUBSCRIBE_PLACEHOLDER, DeliveryChannel, DigestDeliveryEngine, FakeTransport
+from feed_snapshots import FeedSnapshotStore
+from models import DeliveryMethod, OldSubscription, Platform, ViralVideo
+
+
+async def fetch_youtube(depth):
+    return [
+        ViralVideo(title=f"Video {i}", url=f"https://youtube.com/watch?v={i}", thumbnail="",
+                   platform=Platform.YOUTUBE, views=1000 * i, viral_score=float(i))
+        for i in range(1, 4)
+    ]
+
+
+def make_engine(monkeypatch):
+    monkeypatch.setenv("PUBLIC_BASE_URL", "https://viral.example/")
+    monkeypatch.setenv("DELIVERY_POLL_INTERVAL", "0.01")
+    db = AsyncMongoMockClient()["viral_daily_test"]
+    transport = FakeTransport()
+    channels = {DeliveryMethod.EMAIL: DeliveryChannel(DeliveryMethod.EMAIL, transport, concurrency=1, rate=1000)}
+    engine = DigestDeliveryEngine(db, FeedSnapshotStore(db, {Platform.YOUTUBE: fetch_youtube}), channels)
+    return engine, transport
+
+
+async def subscribe(db, email, confirmed):
+    subscription = OldSubscription(email=email, delivery_methods=[DeliveryMethod.EMAIL], confirmed=confirmed)
+    await db.subscriptions.insert_one(subscription.dict())
+    return subscription
+
+
+async def drain(engine, transport, expected):
+    workers = asyncio.create_task(engine.run_workers())
+    for _ in range(200):
+        if len(transport.sent) >= expected:
+            break
+        await asyncio.sleep(0.01)
+    workers.cancel()
+    await asyncio.gather(workers, return_exceptions=True)
+
+
+def test_confirmation_link_is_sent_to_the_subscriber(monkeypatch):
+    async def run():
+        engine, transport = make_engine(monkeypatch)
+        subscription = await subscribe(engine.db, "new@example.com", confirmed=False)
+
+        assert await engine.send_confirmation(subscription.dict()) == 1
+        address, message = transport.sent[0]
+        assert address == "new@example.com"
+        assert f"https://viral.example/api/subscribe/confirm?token={subscription.confirm_token}" in message.text
+
+    asyncio.run(run())
+
+
+def test_unconfirmed_subscriptions_are_skipped(monkeypatch):
+    async def run():
+        engine, _ = make_engine(monkeypatch)
+        await subscribe(engine.db, "confirmed@example.com", confirmed=True)
+        await subscribe(engine.db, "pending@example.com", confirmed=False)
+
+        stats = await engine.deliver()
+        assert stats["subscriptions"] == 1
+        assert stats["queued"] == 1
+        job = await engine.db.delivery_jobs.find_one({})
+        assert job["address"] == "confirmed@example.com"
+
+    asyncio.run(run())
+
+
+def test_each_recipient_gets_their_own_unsubscribe_link(monkeypatch):
+    async def run():
+        engine, transport = make_engine(monkeypatch)
+        first = await subscribe(engine.db, "first@example.com", confirmed=True)
+        second = await subscribe(engine.db, "second@example.com", confirmed=True)
+
+        assert (await engine.deliver())["segments"] == 1
+        await drain(engine, transport, expected=2)
+
+        digests = dict(transport.sent)
+        for subscription in (first, second):
+            digest = digests[subscription.email]
+            url = f"https://viral.example/api/subscribe/unsubscribe?token={subscription.unsubscribe_token}"
+            assert url in digest.text
+            assert f'href="{url}"' in digest.html
+            assert UNSUBSCRIBE_PLACEHOLDER not in digest.text + digest.html
+        assert digests[first.email].text != digests[second.email].text
+
+    asyncio.run(run())
+
+
+def test_legacy_subscriptions_are_grandfathered(monkeypatch):
+    async def run():
+        engine, transport = make_engine(monkeypatch)
+        legacy = OldSubscription(email="legacy@example.com", delivery_methods=[DeliveryMethod.EMAIL]).dict()
+        for field in ("confirmed", "confirm_token", "unsubscribe_token"):
+            del legacy[field]
+        # Confirmed by hand before the backfill ran
+        manual = {**legacy, "id": "manual", "email": "manual@example.com", "confirmed": True}
+        await engine.db.subscriptions.insert_many([legacy, manual])
+        pending = await subscribe(engine.db, "pending@example.com", confirmed=False)
+
+        assert (await engine.deliver())["queued"] == 0
+        assert await engine.backfill_tokens() == 2
+        assert await engine.backfill_tokens() == 0
+
+        stored = await engine.db.subscriptions.find_one({"id": legacy["id"]})
+        assert stored["confirmed"] is True
+        assert stored["unsubscribe_token"]
+        untouched = await engine.db.subscriptions.find_one({"id": pending.id})
+        assert untouched["unsubscribe_token"] == pending.unsubscribe_token
+        assert untouched["confirmed"] is False
+
+        assert (await engine.deliver())["queued"] == 2
+        await drain(engine, transport, expected=2)
+        assert {address for address, _ in transport.sent} == {"legacy@example.com", "manual@example.com"}
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import orjson
+from mongomock_motor import AsyncMongoMockClient
+
+from fast_json import VideoFragmentCache
+from feed_deltas import FeedDeltaLog
+from feed_snapshots import FeedSnapshotStore
+from models import Platform, ViralVideo
+
+
+def make_store(urls):
+    async def fetch(depth):
+        return [
+            ViralVideo(title=url, url=url, thumbnail="", platform=Platform.YOUTUBE, viral_score=float(len(urls) - i))
+            for i, url in enumerate(urls)
+        ]
+
+    store = FeedSnapshotStore(AsyncMongoMockClient()["viral_daily_test"], {Platform.YOUTUBE: fetch})
+    deltas = FeedDeltaLog(VideoFragmentCache())
+    store.add_listener(deltas.on_snapshot)
+    return store, deltas
+
+
+def test_delta_between_versions():
+    async def run():
+        urls = ["a", "b", "c"]
+        store, deltas = make_store(urls)
+        await store.refresh()
+        since = store.version
+
+        urls[:] = ["d", "a", "b"]
+        assert await store.refresh()
+        assert store.version > since
+
+        body = orjson.loads(deltas.body(since, None, 3))
+        assert body["since"] == since
+        assert body["version"] == store.version
+        assert [entry["video"]["url"] for entry in body["added"]] == ["d"]
+        assert body["removed"] == ["c"]
+
+    asyncio.run(run())
+
+
+def test_versions_from_before_a_restart_get_a_full_response():
+    async def run():
+        before, _ = make_store(["a", "b", "c"])
+        await before.refresh()
+        await before.refresh()
+        stale = before.version
+
+        time.sleep(0.002)
+        # A new process publishes its own snapshots of different content
+        after, deltas = make_store(["x", "y", "z"])
+        for _ in range(3):
+            await after.refresh()
+        assert after.version > stale
+        assert deltas.body(stale, None, 3) is None
+        assert deltas.body(12345, None, 3) is None
+
+    asyncio.run(run())
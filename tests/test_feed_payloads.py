@@ -0,0 +1,92 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from fast_json import VideoFragmentCache
+from feed_payloads import FeedNotModifiedMiddleware, FeedPayloadCache
+from feed_snapshots import FeedSnapshotStore
+from models import Platform, SubscriptionTier, ViralVideo
+
+
+class Feed:
+    def __init__(self):
+        self.generation = 1
+
+    async def __call__(self, depth):
+        return [
+            ViralVideo(title=f"Video {i}", url=f"https://youtube.com/watch?v={self.generation}-{i}", thumbnail="",
+                       platform=Platform.YOUTUBE, viral_score=float(i))
+            for i in range(1, 6)
+        ]
+
+
+def make_payloads():
+    feed = Feed()
+    store = FeedSnapshotStore(AsyncMongoMockClient()["viral_daily_test"], {Platform.YOUTUBE: feed})
+    return FeedPayloadCache(store, VideoFragmentCache()), store, feed
+
+
+async def conditional_get(payloads, etag, api_key=None):
+    statuses = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    headers = [(b"if-none-match", etag.encode("latin-1"))]
+    if api_key:
+        headers.append((b"x-api-key", api_key.encode("latin-1")))
+    scope = {"type": "http", "method": "GET", "path": "/api/videos", "query_string": b"limit=5",
+             "headers": headers}
+    await FeedNotModifiedMiddleware(app, payloads)(scope, None, send)
+    return statuses[0]
+
+
+def test_current_etag_gets_304():
+    async def run():
+        payloads, _, _ = make_payloads()
+        payload = await payloads.get(None, SubscriptionTier.FREE, 5)
+        etag = payloads.etag(payload, None, "limit=5")
+
+        assert await conditional_get(payloads, etag) == 304
+        assert await conditional_get(payloads, '"1-0000.0000"') == 200
+
+    asyncio.run(run())
+
+
+def test_etag_of_an_older_snapshot_gets_the_new_feed():
+    async def run():
+        payloads, store, feed = make_payloads()
+        payload = await payloads.get(None, SubscriptionTier.FREE, 5)
+        etag = payloads.etag(payload, None, "limit=5")
+
+        feed.generation = 2
+        assert await store.refresh()
+        # No unconditional request has rendered the new snapshot yet
+        assert await conditional_get(payloads, etag) == 200
+
+    asyncio.run(run())
+
+
+def test_etag_is_bound_to_the_callers_tier():
+    async def run():
+        payloads, _, _ = make_payloads()
+        free = await payloads.get(None, SubscriptionTier.FREE, 5)
+        etag = payloads.etag(free, "vd_key", "limit=5")
+        assert await conditional_get(payloads, etag, "vd_key") == 304
+
+        # The same key upgraded; its next full request records the new tier
+        pro = await payloads.get(None, SubscriptionTier.PRO, 5)
+        payloads.etag(pro, "vd_key", "limit=5")
+        assert await conditional_get(payloads, etag, "vd_key") == 200
+
+        # Callers not seen recently are always sent to a full request
+        payloads.tier_ttl = 0
+        payloads.etag(pro, "vd_other", "limit=5")
+        assert await conditional_get(payloads, etag, "vd_other") == 200
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import pytest
+
+from hyperloglog import HyperLogLog
+
+
+def relative_error(estimate: int, actual: int) -> float:
+    return abs(estimate - actual) / actual
+
+
+def test_empty_sketch_counts_zero():
+    assert HyperLogLog().count() == 0
+
+
+def test_small_counts_are_nearly_exact():
+    sketch = HyperLogLog()
+    sketch.update(f"user-{i}" for i in range(100))
+    assert abs(sketch.count() - 100) <= 2
+
+
+@pytest.mark.parametrize("actual", [1_000, 10_000, 100_000])
+def test_estimate_is_within_error_bounds(actual):
+    sketch = HyperLogLog(precision=12)
+    sketch.update(f"user-{i}" for i in range(actual))
+    # The standard error at precision 12 is about 1.6%
+    assert relative_error(sketch.count(), actual) < 0.05
+
+
+def test_duplicates_do_not_change_the_sketch():
+    sketch = HyperLogLog()
+    sketch.update(f"user-{i}" for i in range(1_000))
+    registers = sketch.to_bytes()
+    assert not any(sketch.add(f"user-{i}") for i in range(1_000))
+    assert sketch.to_bytes() == registers
+
+
+def test_merge_counts_the_union():
+    first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    first.update(f"user-{i}" for i in range(0, 6_000))
+    second.update(f"user-{i}" for i in range(4_000, 10_000))
+    both.update(f"user-{i}" for i in range(0, 10_000))
+
+    merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+    # Merging is exact on registers, so it matches a sketch of the union
+    assert merged.to_bytes() == both.to_bytes()
+    assert relative_error(merged.count(), 10_000) < 0.05
+    assert HyperLogLog.union([first, second]).to_bytes() == both.to_bytes()
+
+
+def test_merge_is_idempotent_and_commutative():
+    first, second = HyperLogLog(), HyperLogLog()
+    first.update(f"a-{i}" for i in range(500))
+    second.update(f"b-{i}" for i in range(500))
+
+    left = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+    right = HyperLogLog.from_bytes(second.to_bytes()).merge(first)
+    assert left.to_bytes() == right.to_bytes()
+    assert left.merge(second).to_bytes() == right.to_bytes()
+
+
+def test_merge_rejects_different_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=12).merge(HyperLogLog(precision=10))
+
+
+def test_rejects_registers_of_the_wrong_size():
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(bytes(100), precision=12)
@@ -0,0 +1,33 @@
+from trending import extract_terms, tokenize
+
+
+def test_short_latin_words_and_stopwords_are_dropped():
+    assert tokenize("The GOAT vs Ok: epic comeback") == ["goat", "epic", "comeback"]
+
+
+def test_letter_digit_tokens_are_kept():
+    assert tokenize("F1 highlights, GTA6 trailer in 4K") == ["f1", "highlights", "gta6", "trailer", "4k"]
+    # Bare numbers carry no topic on their own
+    assert tokenize("2024 recap") == ["recap"]
+
+
+def test_short_words_in_other_spaced_scripts_are_kept():
+    assert tokenize("Москва ТВ") == ["москва", "тв"]
+
+
+def test_cjk_runs_split_into_character_bigrams():
+    assert tokenize("東京の夜景") == ["東京", "京の", "の夜", "夜景"]
+    assert tokenize("猫") == ["猫"]
+    assert tokenize("F1東京GP!") == ["f1", "東京"]
+
+
+def test_thai_bigrams_keep_combining_marks_with_their_letter():
+    assert tokenize("วันนี้") == ["วัน", "นนี้"]
+
+
+def test_emoji_are_tokens():
+    assert tokenize("Don't miss this 🔥🔥") == ["miss", "🔥", "🔥"]
+
+
+def test_extract_terms_adds_bigrams():
+    assert extract_terms("F1 東京") == ["f1", "東京", "f1 東京"]
@@ -0,0 +1,26 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from auth import AuthService
+from models import Platform, User
+from usage_sketches import ALL_SCOPE, UsageSketchService, endpoint_scope, platform_scope
+
+
+def test_usage_is_scoped_to_matched_routes_only():
+    async def run():
+        db = AsyncMongoMockClient()["viral_daily_test"]
+        sketches = UsageSketchService(db)
+        auth = AuthService(db, sketches)
+        user = User(email="user@example.com")
+
+        await auth.log_api_usage(user, "/api/videos", "GET", route="/api/videos", platform=Platform.YOUTUBE)
+        # Unmatched paths are logged but must not create a sketch per raw path
+        for i in range(50):
+            await auth.log_api_usage(user, f"/api/missing/{i}", "GET", status_code=404)
+
+        scopes = {scope for _, scope in sketches._sketches}
+        assert scopes == {ALL_SCOPE, platform_scope("youtube"), endpoint_scope("/api/videos")}
+        assert await db.api_usage.count_documents({}) == 51
+
+    asyncio.run(run())